@@ -1,10 +1,41 @@
+import time
 import traceback
 import importlib
+from contextlib import contextmanager
 from collections import defaultdict
-from functools import reduce
+from functools import reduce, partial
 from concurrent.futures import ThreadPoolExecutor
-from concurrent.futures import as_completed
-from typing import Dict, List, Callable, Any, Optional, Set, Tuple, Iterator
+from concurrent.futures import Future
+from typing import Dict, List, Callable, Any, Optional, Set, Tuple, Iterator, Iterable
+from arbtools import clock
+from arbtools.dispatch import OrderDispatcher
+from arbtools.metrics import metrics, span
+from arbtools.records import Order
+
+class InlineExecutor:
+    """
+    Executor running every call in the caller's thread.
+    
+    Used for gateways that answer without I/O, such as the simulated one,
+    where starting worker threads costs more than the calls themselves.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        pass
+
+    def submit(self, f: Callable, *args, **kwargs) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(f(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def __enter__(self) -> 'InlineExecutor':
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
 
 class APIFacade:
     """
@@ -14,16 +45,25 @@ class APIFacade:
     abstracting away the differences between exchange APIs.
     """
 
-    def __init__(self, exchanges: Dict[str, Any], gw_name: str) -> None:
+    def __init__(self, exchanges: Dict[str, Any], gw_name: str, *,
+                 connections: Optional[Any] = None) -> None:
         """
         Initialize the APIFacade with exchange configurations.
         
         Args:
             exchanges: Dictionary of exchange configurations
             gw_name: Name of the gateway module to import
+            connections: ConnectionManager giving every exchange its own
+                pooled session and keep-alive ping, see arbtools.connections
         """
         self._product: str = 'BTC/JPY'
         self._gw = importlib.import_module(gw_name)
+        # ゲートウェイが並列化を望まない場合は呼び出し元のスレッドで実行する
+        parallel = getattr(self._gw, 'parallel', True) is not False
+        self._executor = ThreadPoolExecutor if parallel else InlineExecutor
+        # 自前で接続を持つゲートウェイにはセッションを渡さない
+        sessions = connections is not None and getattr(self._gw, 'sessions', True) is not False
+        self._connections = connections
 
         def _new(name: str, value: Any) -> Tuple[str, Any]:
             """
@@ -42,12 +82,135 @@ class APIFacade:
                 'secret': value.secret,
                 'verbose': False,
             }
+            if sessions:
+                options['session'] = connections.session(name)
             instance = klass(options)
             setattr(instance, 'trading_fees', value.fees)
             return (name, instance)
 
         items = exchanges.items()
         self._api: Dict[str, Any] = dict(_new(k, v) for k, v in items if v.enable)
+        self._hedging: Optional[Any] = None
+        self._latency: Optional[Any] = None
+        # BTC/JPY以外に残高を読む通貨 (閉路取引で使う通貨)
+        self._currencies: List[str] = []
+        # 二本の脚は常駐スレッドから揃えて出す(呼び出し元で実行するゲートウェイを除く)
+        self._dispatcher: Optional[OrderDispatcher] = None
+        if parallel:
+            self._dispatcher = OrderDispatcher(self._api, self._create_orders_params, self._timed)
+        if connections is not None:
+            for name, api in self._api.items():
+                connections.watch(name, partial(self._ping, api))
+
+    def _ping(self, api: Any) -> Any:
+        """
+        Make the cheapest public request of an exchange, keeping its
+        connections open.
+        
+        Args:
+            api: Exchange API instance
+            
+        Returns:
+            Response of the request
+        """
+        # 初回の注文で市場情報を読みに行かないよう先に読み込んでおく
+        if hasattr(api, 'load_markets'):
+            api.load_markets()
+        if getattr(api, 'has', {}).get('fetchTime'):
+            return api.fetch_time()
+        return api.fetch_order_book(self._product)
+
+    def warm_connections(self, concurrency: int = 2) -> Dict[str, Optional[str]]:
+        """
+        Open connections to every exchange before the first order.
+        
+        Args:
+            concurrency: Connections opened per exchange
+            
+        Returns:
+            Error message of a failed warm-up, or None, by exchange name
+        """
+        if self._connections is None:
+            return {}
+        return self._connections.warm(concurrency)
+
+    def set_hedging(self, hedging: Optional[Any]) -> None:
+        """
+        Hedge slow reads, see arbtools.hedging.HedgedReads.
+        
+        Args:
+            hedging: HedgedReads instance, or None to stop hedging
+        """
+        self._hedging = hedging
+
+    def set_latency(self, latency: Optional[Any]) -> None:
+        """
+        Feed the round trip of every gateway call to an estimator, see
+        arbtools.latency.LatencyEstimator.
+        
+        Args:
+            latency: LatencyEstimator instance, or None to stop feeding it
+        """
+        self._latency = latency
+        if self._dispatcher is not None:
+            self._dispatcher.set_latency(latency)
+
+    def add_currencies(self, symbols: List[str]) -> None:
+        """
+        Read the balances of every currency of some symbols as well.
+        
+        Args:
+            symbols: Symbols whose base and quote currencies are traded,
+                e.g. ['ETH/BTC']
+        """
+        for symbol in symbols:
+            for currency in symbol.split('/'):
+                if currency not in self._currencies:
+                    self._currencies.append(currency)
+
+    def latency(self) -> Optional[Any]:
+
+        return self._latency
+
+    def order_timeout(self, exchanges: Iterable[str], k: float = 4.0) -> Optional[float]:
+        """
+        Get how long placing or canceling an order on some venues can take.
+        
+        Args:
+            exchanges: Exchange names
+            k: Round-trip deviations added to the smoothed round trip
+            
+        Returns:
+            Seconds, or None if the round trips are not measured
+        """
+        if self._latency is None:
+            return None
+        return self._latency.timeout(exchanges, 'order', k)
+
+    @contextmanager
+    def _timed(self, stage: str, name: str) -> Iterator[None]:
+        # 成功した呼び出しだけを往復時間として数える
+        started = time.perf_counter()
+        with span(stage, name):
+            yield
+        if self._latency is not None:
+            self._latency.observe(name, stage, time.perf_counter() - started)
+
+    def _read(self, stage: str, name: str, f: Callable[[], Any]) -> Any:
+        """
+        Run an idempotent gateway read, hedged if hedging is set.
+        
+        Args:
+            stage: Gateway call name
+            name: Exchange name
+            f: Read to run
+            
+        Returns:
+            Result of the read
+        """
+        if self._hedging is None:
+            return f()
+        return self._hedging.call(stage, name, f)
 
     def names(self) -> List[str]:
         """
@@ -101,15 +264,31 @@ class APIFacade:
             Dictionary of results by exchange name
         """
         result: Dict[str, Any] = defaultdict(dict)
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        with self._executor(max_workers=max_workers) as executor:
             futures = {executor.submit(f, (k, v)): k for k, v in self._api.items()}
-            for future in as_completed(futures):
+            # 完了順ではなく依頼順に集めて結果の並びを毎回同じにする
+            for future in futures:
                 exchange_name = futures[future]
                 data = future.result()
                 if allowed_none or data:
                     result[exchange_name] = data
         return result
 
+    def _fetch_orderbook(self, item: Tuple[str, Any]) -> Dict[str, Any]:
+        """Fetch order book from a single exchange."""
+        name, api = item
+        try:
+            with self._timed('fetch_order_book', name):
+                result = self._read('fetch_order_book', name,
+                    lambda: api.fetch_order_book(self._product))
+            # 取引所側の板を書き換えないよう、受信時刻は写しに付ける
+            result = { **result, 'received_at': clock.time() }
+        except Exception as e:
+            print(f"Error fetching orderbook: {e}")
+            metrics.incr('fetch_order_book_errors', name)
+            result = { 'fetch_orderbooks_error': str(e) }
+        return result
+
     def fetch_orderbooks(self) -> Dict[str, Any]:
         """
         Fetch order books from all enabled exchanges.
@@ -117,18 +296,50 @@ class APIFacade:
         Returns:
             Dictionary of order books by exchange name
         """
+        return self.traverse(self._fetch_orderbook)
+
+    def fetch_symbol_orderbooks(self, symbols: List[str]) -> Dict[str, Any]:
+        """
+        Fetch order books of several symbols from all enabled exchanges.
+        
+        Args:
+            symbols: Symbols to fetch, e.g. ['BTC/JPY', 'ETH/BTC']
+            
+        Returns:
+            Dictionary of order books by exchange name and symbol
+        """
         def _fetch(item: Tuple[str, Any]) -> Dict[str, Any]:
-            """Fetch order book from a single exchange."""
-            _, api = item
-            try:
-                result = api.fetch_order_book(self._product)
-            except Exception as e:
-                print(f"Error fetching orderbook: {e}")
-                result = { 'fetch_orderbooks_error': str(e) }
+            """Fetch the order books of every symbol from a single exchange."""
+            name, api = item
+            result = {}
+            for symbol in symbols:
+                try:
+                    with self._timed('fetch_order_book', name):
+                        result[symbol] = self._read('fetch_order_book', name,
+                            lambda: api.fetch_order_book(symbol))
+                except Exception as e:
+                    print(f"Error fetching orderbook: {e}")
+                    metrics.incr('fetch_order_book_errors', name)
+                    result[symbol] = { 'fetch_orderbooks_error': str(e) }
             return result
 
         return self.traverse(_fetch)
 
+    def _fetch_balance(self, item: Tuple[str, Any]) -> Dict[str, Any]:
+        """Fetch balance from a single exchange."""
+        name, api = item
+        try:
+            with self._timed('fetch_balance', name):
+                balance = self._read('fetch_balance', name, api.fetch_balance)
+            result = { key: balance[key] for key in ['JPY', 'BTC'] }
+            # 持っていない通貨は返さない取引所もあるので、無ければ読まない
+            result.update({ key: balance[key] for key in self._currencies if key in balance })
+        except Exception as e:
+            print(f"Error fetching balance: {e}")
+            metrics.incr('fetch_balance_errors', name)
+            result = { 'fetch_balances_error': str(e) }
+        return result
+
     def fetch_balances(self) -> Dict[str, Any]:
         """
         Fetch account balances from all enabled exchanges.
@@ -136,18 +347,36 @@ class APIFacade:
         Returns:
             Dictionary of balances by exchange name
         """
-        def _fetch(item: Tuple[str, Any]) -> Dict[str, Any]:
-            """Fetch balance from a single exchange."""
-            _, api = item
-            try:
-                balance = api.fetch_balance()
-                result = { key: balance[key] for key in ['JPY', 'BTC'] }
-            except Exception as e:
-                print(f"Error fetching balance: {e}")
-                result = { 'fetch_balances_error': str(e) }
-            return result
+        return self.traverse(self._fetch_balance)
 
-        return self.traverse(_fetch)
+    def fetch_market(self, *, orderbooks: bool = True) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Fetch order books and account balances of all enabled exchanges in
+        one fan-out.
+        
+        The public book requests and the private balance requests run side
+        by side, so a cycle waits for the slowest request once instead of
+        once for the books and again for the balances.
+        
+        Args:
+            orderbooks: Whether to fetch the order books, False when they
+                come from elsewhere, e.g. shared fetcher processes
+            
+        Returns:
+            Tuple of order books and balances, each by exchange name
+        """
+        books: Dict[str, Any] = {}
+        balances: Dict[str, Any] = {}
+        fetches = ([ (books, self._fetch_orderbook) ] if orderbooks else []) + [ (balances, self._fetch_balance) ]
+        items = list(self._api.items())
+        with self._executor(max_workers=max(1, len(items) * len(fetches))) as executor:
+            futures = [ (result, name, executor.submit(f, (name, api)))
+                for result, f in fetches for name, api in items ]
+            for result, name, future in futures:
+                data = future.result()
+                if data:
+                    result[name] = data
+        return books, balances
 
     def _create_orders_params(self, data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
         """
@@ -177,6 +406,100 @@ class APIFacade:
 
         return reduce(_params, ['buy', 'sell'], {})
 
+    def prepare_orders(self, data: Dict[str, Any]) -> None:
+        """
+        Build the order parameters of a requested pair deal ahead of its
+        placement.
+        
+        Args:
+            data: Trade data
+        """
+        if self._dispatcher is not None and 'legs' not in data:
+            self._dispatcher.prepare(data)
+
+    def _local_time(self, name: str, timestamp: Any) -> Optional[float]:
+        # 取引所のミリ秒の時刻を手元の時計の秒に直す
+        if not isinstance(timestamp, (int, float)):
+            return None
+        seconds = timestamp / 1000.0
+        return self._latency.local_time(name, seconds) if self._latency else seconds
+
+    def _order_targets(self, data: Dict[str, Any]) -> Dict[str, Tuple[str, str]]:
+        """
+        Map the order keys of a deal to the exchange and symbol they trade.
+        
+        Pair deals key their orders by exchange name, multi-leg deals and
+        hedge orders by leg id.
+        
+        Args:
+            data: Trade data containing order information
+            
+        Returns:
+            Dictionary of (exchange name, symbol) by order key
+        """
+        if 'legs' in data:
+            targets = { leg['leg_id']: (leg['exchange_name'], leg['symbol']) for leg in data['legs'] }
+        else:
+            names = [ data[side]['exchange_name'] for side in ['buy', 'sell'] if side in data ]
+            targets = { name: (name, self._product) for name in names }
+        for leg in data.get('hedges') or []:
+            targets[leg['leg_id']] = (leg['exchange_name'], leg['symbol'])
+        return targets
+
+    def _create_legs_params(self, data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Create parameters for order creation of a multi-leg deal.
+        
+        Args:
+            data: Trade data containing a 'legs' list
+            
+        Returns:
+            Dictionary of order parameters by leg id
+        """
+        return { leg['leg_id']: {
+                'symbol': leg['symbol'],
+                'type': 'limit',
+                'side': leg['side'],
+                'amount': leg['amount'],
+                'price': leg['quote'][0],
+            } for leg in data['legs'] }
+
+    def _create_legs(self, data: Dict[str, Any], ordered: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Create the orders of a multi-leg deal, one call per leg.
+        
+        Args:
+            data: Trade data containing a 'legs' list
+            ordered: Previously created orders, if any
+            
+        Returns:
+            Dictionary of created orders by leg id
+        """
+        params = self._create_legs_params(data)
+        targets = self._order_targets(data)
+
+        def _execute(key: str) -> Dict[str, Any]:
+            """Execute order creation for a single leg."""
+            name, _ = targets[key]
+            try:
+                if ordered and (key in ordered) and ('id' in ordered[key]):
+                    return ordered[key]
+                sent = clock.time()
+                with self._timed('create_order', name):
+                    result = self._api[name].create_order(**params[key])
+                return Order.from_ccxt(result, sent_at=sent, acked_at=clock.time())
+            except Exception as e:
+                print(f"Error creating order: {e}")
+                metrics.incr('create_order_errors', name)
+                return { 'create_orders_error': str(e) }
+
+        result: Dict[str, Any] = {}
+        with self._executor(max_workers=len(params)) as executor:
+            futures = {executor.submit(_execute, k): k for k in params}
+            for future in futures:
+                result[futures[future]] = future.result()
+        return result
+
     def create_orders(self, data: Dict[str, Any], ordered: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Create orders on exchanges based on trade data.
@@ -186,8 +509,14 @@ class APIFacade:
             ordered: Previously created orders, if any
             
         Returns:
-            Dictionary of created orders by exchange name
+            Dictionary of created orders by exchange name. Orders are
+            converted to Order records here, errors stay plain dicts.
         """
+        if 'legs' in data:
+            return self._create_legs(data, ordered)
+        if self._dispatcher is not None:
+            return self._dispatcher.dispatch(data, ordered)
+
         params = self._create_orders_params(data)
 
         def _execute(item: Tuple[str, Any]) -> Optional[Dict[str, Any]]:
@@ -200,9 +529,13 @@ class APIFacade:
                 if ordered and (name in ordered) and ('id' in ordered[name]):
                     result = ordered[name]
                 else:
-                    result = api.create_order(**args)
+                    sent = clock.time()
+                    with self._timed('create_order', name):
+                        result = api.create_order(**args)
+                    result = Order.from_ccxt(result, sent_at=sent, acked_at=clock.time())
             except Exception as e:
                 print(f"Error creating order: {e}")
+                metrics.incr('create_order_errors', name)
                 result = { 'create_orders_error': str(e) }
             return result
 
@@ -220,26 +553,81 @@ class APIFacade:
             Dictionary of order status by exchange name
         """
         api = self._api
+        targets = self._order_targets(data)
 
-        def _execute(name: str, order: Dict[str, Any]) -> Dict[str, Any]:
+        def _execute(key: str, order: Dict[str, Any]) -> Dict[str, Any]:
             """Fetch order status for a single exchange."""
-            if (name in ordered) and ('status' in ordered[name]):
-                if ordered[name]['status'] == 'closed':
-                    return ordered[name]
+            if 'id' not in order:
+                return order
+            if (key in ordered) and ('status' in ordered[key]):
+                if ordered[key]['status'] in ('closed', 'canceled', 'expired', 'rejected'):
+                    return ordered[key]
+            name, symbol = targets.get(key, (key, self._product))
             id_ = order['id']
-            return api[name].fetch_order(id_, self._product)
+            with self._timed('fetch_order', name):
+                order = api[name].fetch_order(id_, symbol)
+            return Order.from_ccxt(order,
+                last_trade=self._local_time(name, order.get('lastTradeTimestamp')))
 
         result: Dict[str, Dict[str, Any]] = defaultdict(dict)
-        with ThreadPoolExecutor(max_workers=2) as executor:
+        with self._executor(max_workers=max(2, len(targets))) as executor:
             orders = data['orders']
             futures = {executor.submit(_execute, k, v): k for k, v in orders.items()}
-            for future in as_completed(futures):
+            for future in futures:
                 exchange_name = futures[future]
                 try:
                     result[exchange_name] = future.result()
                 except Exception as e:
                     print(f"Error fetching order: {e}")
+                    metrics.incr('fetch_order_errors', targets.get(exchange_name, (exchange_name,))[0])
                     result[exchange_name]['id'] = ordered[exchange_name]['id']
                     result[exchange_name]['fetch_orders_error'] = str(e)
 
         return result
+
+    def cancel_orders(self, data: Dict[str, Any], orders: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Cancel orders and read back their final state.
+        
+        Every order is fetched after its cancel, so fills made before the
+        cancel are counted and an order that filled meanwhile comes back
+        closed rather than as an error.
+        
+        Args:
+            data: Trade data containing order information
+            orders: Orders to cancel by order key
+            
+        Returns:
+            Dictionary of orders by order key, with 'cancel_orders_error'
+            for those whose state could not be read
+        """
+        api = self._api
+        targets = self._order_targets(data)
+
+        def _execute(key: str, order: Dict[str, Any]) -> Dict[str, Any]:
+            """Cancel a single order and fetch its state."""
+            name, symbol = targets.get(key, (key, self._product))
+            try:
+                with self._timed('cancel_order', name):
+                    api[name].cancel_order(order['id'], symbol)
+            except Exception as e:
+                print(f"Error canceling order: {e}")
+                metrics.incr('cancel_order_errors', name)
+            with self._timed('fetch_order', name):
+                order = api[name].fetch_order(order['id'], symbol)
+            return Order.from_ccxt(order,
+                last_trade=self._local_time(name, order.get('lastTradeTimestamp')))
+
+        result: Dict[str, Any] = {}
+        with self._executor(max_workers=max(2, len(orders))) as executor:
+            futures = {executor.submit(_execute, k, v): k for k, v in orders.items()}
+            for future in futures:
+                key = futures[future]
+                try:
+                    result[key] = future.result()
+                except Exception as e:
+                    print(f"Error fetching order: {e}")
+                    metrics.incr('fetch_order_errors', targets.get(key, (key,))[0])
+                    result[key] = { 'id': orders[key]['id'], 'cancel_orders_error': str(e) }
+
+        return result
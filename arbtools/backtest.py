@@ -0,0 +1,214 @@
+import time
+from contextlib import ExitStack
+from types import SimpleNamespace
+from typing import Dict, List, Any, Callable, Iterable, Optional, Tuple
+from arbtools import clock
+from arbtools import simgw
+from arbtools.loop import run_cycle
+from arbtools.provider import Provider
+
+
+def exchange_configs(fees: Dict[str, float]) -> Dict[str, Any]:
+    """
+    Build exchange configurations for the simulated gateway.
+
+    Args:
+        fees: Trading fees in percent by exchange name
+
+    Returns:
+        Dictionary of exchange configurations accepted by Provider
+    """
+    return { name: SimpleNamespace(enable=True, apikey='', secret='', fees=fee)
+        for name, fee in fees.items() }
+
+def realized_pnl(data: Dict[str, Any]) -> float:
+    """
+    Compute the realized profit of a closed deal from its fills.
+
+    Args:
+        data: Reverse deal data carrying its 'open_deal', or a deal closed
+            by recovery, whose orders include its hedges
+
+    Returns:
+        Sell proceeds minus buy costs and fees of the orders
+    """
+    total = 0.0
+    deals = (data['open_deal'], data) if 'open_deal' in data else (data,)
+    for deal in deals:
+        for order in deal.get('orders', {}).values():
+            price = order.get('average') or order['price']
+            sign = 1 if order['side'] == 'sell' else -1
+            fee = order.get('fee_cost') or (order.get('fee') or {}).get('cost') or 0.0
+            total += sign * price * order['filled'] - fee
+    return total
+
+
+class BacktestResult:
+    """
+    Deal-level timing and profit of a backtest run.
+    """
+
+    def __init__(self) -> None:
+
+        self.deals: Dict[str, Dict[str, Any]] = {}
+        self.cycles = 0
+        self.elapsed = 0.0
+        self.api_calls = 0
+
+    def closed(self) -> List[Dict[str, Any]]:
+
+        return [ deal for deal in self.deals.values() if 'closed_at' in deal ]
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the run.
+
+        Returns:
+            Dictionary of deal counts, profit and timing
+        """
+        closed = self.closed()
+        pnl = [ deal['pnl'] for deal in closed ]
+        holding = [ deal['closed_at'] - deal['found_at'] for deal in closed ]
+        return {
+            'cycles': self.cycles,
+            'elapsed': self.elapsed,
+            'api_calls': self.api_calls,
+            'deals': len(self.deals),
+            'closed': len(closed),
+            'recovered': sum(1 for deal in closed if deal.get('recovered')),
+            'pnl': sum(pnl),
+            'win_rate': (sum(1 for p in pnl if p > 0) / len(pnl)) if pnl else 0.0,
+            'mean_holding': (sum(holding) / len(holding)) if holding else 0.0,
+        }
+
+
+class Backtest:
+    """
+    Replay of market data through Provider, Broker and TradeRule.
+
+    The replay runs on a VirtualClock that jumps from one recorded cycle to
+    the next, so a day of data takes as long as the trading logic needs and
+    no more. Orders go to the simulated gateway in `arbtools.simgw`.
+    """
+
+    def __init__(self, exchanges: Dict[str, Any], trade: Any,
+                 feed: Iterable[Tuple[float, Dict[str, Any]]], *,
+                 balances: Dict[str, Dict[str, float]],
+                 latency: Optional[simgw.Latency] = None, fill_ratio: float = 1.0,
+                 price_unit: float = 100, jobs: Optional[Callable] = None,
+                 spreads: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Initialize the Backtest.
+
+        Args:
+            exchanges: Exchange configurations, e.g. from exchange_configs
+            trade: Trade configuration parameters
+            feed: Iterable of (timestamp, books by exchange name)
+            balances: Initial free balances by exchange name and currency
+            latency: Latency from order placement to matching
+            fill_ratio: Share of a crossing level's volume an order may take
+            price_unit: Price unit passed to OrderBooks.round
+            jobs: Callable registering jobs on a schedule.Scheduler
+            spreads: Options of the SpreadStats deriving the thresholds,
+                or None for the static thresholds
+        """
+        self._exchanges = exchanges
+        self._trade = trade
+        self._feed = feed
+        self._balances = balances
+        self._latency = latency
+        self._fill_ratio = fill_ratio
+        self._price_unit = price_unit
+        self._jobs = jobs
+        self._spreads = spreads
+        self.spreads = None
+        self.result = BacktestResult()
+
+    def _listen(self, broker: Any) -> None:
+
+        deals = self.result.deals
+
+        def found_open(sender, data):
+            deals[data['deal_id']] = {
+                'deal_id': data['deal_id'],
+                'found_at': clock.time(),
+                'expected_profit': data['expected_profit'],
+            }
+
+        def open_pair(sender, data):
+            if data['deal_id'] in deals:
+                deals[data['deal_id']]['opened_at'] = clock.time()
+
+        def found_close(sender, data):
+            deal_id = data['open_deal']['deal_id']
+            if deal_id in deals:
+                deals[deal_id]['close_found_at'] = clock.time()
+
+        def close_pair(sender, data):
+            deal_id = data['open_deal']['deal_id']
+            if deal_id in deals:
+                deals[deal_id]['closed_at'] = clock.time()
+                deals[deal_id]['pnl'] = realized_pnl(data)
+
+        def recovered(sender, data):
+            deal_id = data['open_deal']['deal_id'] if 'open_deal' in data else data['deal_id']
+            if deal_id in deals:
+                deals[deal_id]['closed_at'] = clock.time()
+                deals[deal_id]['pnl'] = realized_pnl(data)
+                deals[deal_id]['recovered'] = True
+
+        broker.on('found_open', found_open)
+        broker.on('open_pair', open_pair)
+        broker.on('found_close', found_close)
+        broker.on('close_pair', close_pair)
+        broker.on('recovered', recovered)
+
+    def _cycles(self, provider: Any, broker: Any, virtual_clock: Any, market: Any) -> None:
+
+        scheduler = None
+        for timestamp, books in self._feed:
+            virtual_clock.set(timestamp)
+            market.update(books)
+            if self._jobs:
+                # ジョブの次回実行時刻も仮想時刻で決める
+                if scheduler is None:
+                    import schedule
+                    scheduler = schedule.Scheduler()
+                    self._jobs(scheduler)
+                scheduler.run_pending()
+
+            run_cycle(provider, broker, price_unit=self._price_unit, spreads=self.spreads)
+            self.result.cycles += 1
+
+    def run(self) -> BacktestResult:
+        """
+        Replay the whole feed.
+
+        Returns:
+            BacktestResult of the run
+        """
+        fees = { name: value.fees for name, value in self._exchanges.items() }
+        market = simgw.install(simgw.SimMarket(
+            self._balances, fees=fees, latency=self._latency, fill_ratio=self._fill_ratio))
+        provider = Provider(self._exchanges, gw_name='arbtools.simgw')
+        self.broker = provider.broker(self._trade)
+        if self._spreads is not None:
+            self.spreads = provider.spread_stats(**self._spreads)
+            self.broker.set_spreads(self.spreads)
+        self._listen(self.broker)
+
+        virtual_clock = clock.VirtualClock()
+        previous = clock.set_clock(virtual_clock)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                if self._jobs:
+                    import schedule
+                    stack.enter_context(clock.patched_datetime(schedule))
+                self._cycles(provider, self.broker, virtual_clock, market)
+        finally:
+            clock.set_clock(previous)
+            self.result.elapsed = time.perf_counter() - started
+            self.result.api_calls = market.calls
+
+        return self.result
@@ -1,10 +1,27 @@
 
+def spending(deal):
+
+    # 取引の注文が各取引所で使う資金 (取引所名, 通貨) -> 量
+    # 買いは決済通貨を、売りは基軸通貨を使う
+    if 'legs' in deal:
+        legs = [ (leg['exchange_name'], leg['symbol'], leg['side'], leg['amount'], leg['quote'][0])
+            for leg in deal['legs'] ]
+    else:
+        legs = [ (deal[side]['exchange_name'], 'BTC/JPY', side, deal['volume'], deal[side]['quote'][0])
+            for side in ('buy', 'sell') ]
+    needs = {}
+    for name, symbol, side, amount, price in legs:
+        base, quote = symbol.split('/')
+        key = (name, quote) if side == 'buy' else (name, base)
+        needs[key] = needs.get(key, 0.0) + (amount * price if side == 'buy' else amount)
+    return needs
+
 class Balances:
 
-    def __init__(self, api):
+    def __init__(self, api, data=None):
 
         self._api = api
-        items = api.fetch_balances().items()
+        items = (data if data is not None else api.fetch_balances()).items()
         error_key = 'fetch_balances_error'
         self._errors = { k: v for k, v in items if error_key in v }
         self._data = { k: v for k, v in items if k not in self._errors }
@@ -17,6 +34,27 @@ class Balances:
 
         return self._errors
 
+    def partition(self, share, reserved=None, own=None):
+
+        # 資金を戦略ごとに分ける。元手は空いている残高に各戦略の取引中の資金を
+        # 足したもので、その割合から自分の取引中の資金を差し引く
+        # reserved, own: (取引所名, 通貨) -> 全戦略と自分の取引が使っている量
+        reserved = reserved or {}
+        own = own or {}
+
+        def _free(name, currency, free):
+            capital = free + reserved.get((name, currency), 0.0)
+            return min(free, max(0.0, capital * share - own.get((name, currency), 0.0)))
+
+        def _scaled(name, balance):
+            return { currency: { k: _free(name, currency, v) if k == 'free'
+                    else v * share if isinstance(v, (int, float)) else v
+                    for k, v in amounts.items() } if isinstance(amounts, dict) else amounts
+                for currency, amounts in balance.items() }
+
+        data = { k: _scaled(k, v) for k, v in self._data.items() }
+        return Balances(self._api, { **data, **self._errors })
+
     def __getitem__(self, name):
 
         return self._data[name]
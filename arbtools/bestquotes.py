@@ -0,0 +1,145 @@
+import heapq
+from typing import Dict, Any, List, Optional, Tuple
+from arbtools.records import Quote
+
+
+class BestQuotes:
+    """
+    Cross-venue index of the best tradable ask and bid.
+
+    Every venue has a bit in the `long` and `short` tradability bitmaps and
+    an entry on the ask and bid heaps. Updating a venue pushes new entries
+    and bumps its generation instead of searching the heaps; entries of an
+    old generation or of a venue that is no longer tradable are dropped
+    when they reach the top. An update costs O(log n) and the best pair is
+    read without scanning the venues.
+
+    Ties are broken like TradePlan: the lower (price, volume) ask and the
+    higher (price, volume) bid win, then the venue added first.
+    """
+
+    def __init__(self) -> None:
+
+        self._bits: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._generation: Dict[str, int] = {}
+        self._quotes: Dict[str, Tuple[Optional[Quote], Optional[Quote]]] = {}
+        self._asks: List[Tuple[float, float, int, int]] = []
+        self._bids: List[Tuple[float, float, int, int]] = []
+        # 買える取引所と売れる取引所のビット集合
+        self.long = 0
+        self.short = 0
+
+    def __len__(self) -> int:
+
+        return len(self._quotes)
+
+    def __contains__(self, name: str) -> bool:
+
+        return name in self._quotes
+
+    def _bit(self, name: str) -> int:
+
+        bit = self._bits.get(name)
+        if bit is None:
+            bit = self._bits[name] = len(self._names)
+            self._names.append(name)
+        return bit
+
+    def update(self, name: str, ask: Optional[Quote], bid: Optional[Quote]) -> None:
+        """
+        Set the tradable top of book of a venue.
+
+        Args:
+            name: Exchange name
+            ask: Best ask the venue can buy at, or None
+            bid: Best bid the venue can sell at, or None
+        """
+        bit = self._bit(name)
+        generation = self._generation.get(name, 0) + 1
+        self._generation[name] = generation
+        self._quotes[name] = (ask, bid)
+        mask = 1 << bit
+        if ask:
+            self.long |= mask
+            heapq.heappush(self._asks, (ask[0], ask[1], bit, generation))
+        else:
+            self.long &= ~mask
+        if bid:
+            self.short |= mask
+            heapq.heappush(self._bids, (-bid[0], -bid[1], bit, generation))
+        else:
+            self.short &= ~mask
+        self._compact()
+
+    def remove(self, name: str) -> None:
+        """
+        Drop a venue, e.g. when its book could not be fetched.
+
+        Args:
+            name: Exchange name
+        """
+        if name not in self._quotes:
+            return
+        del self._quotes[name]
+        self._generation[name] += 1
+        mask = ~(1 << self._bits[name])
+        self.long &= mask
+        self.short &= mask
+
+    def _compact(self) -> None:
+        # 無効な要素が溜まりすぎたらヒープを作り直す
+        limit = 2 * len(self._quotes) + 64
+        for heap in (self._asks, self._bids):
+            if len(heap) > limit:
+                heap[:] = [ entry for entry in heap
+                    if self._generation.get(self._names[entry[2]]) == entry[3] ]
+                heapq.heapify(heap)
+
+    def _top(self, heap: List[Tuple[float, float, int, int]], bits: int) -> Optional[str]:
+
+        while heap:
+            _, _, bit, generation = heap[0]
+            name = self._names[bit]
+            if self._generation.get(name) == generation and bits >> bit & 1:
+                return name
+            heapq.heappop(heap)
+        return None
+
+    def best_ask(self) -> Optional[Tuple[str, Quote]]:
+        """
+        Get the venue to buy at.
+
+        Returns:
+            (exchange name, ask), or None if no venue can buy
+        """
+        name = self._top(self._asks, self.long)
+        return (name, self._quotes[name][0]) if name else None
+
+    def best_bid(self) -> Optional[Tuple[str, Quote]]:
+        """
+        Get the venue to sell at.
+
+        Returns:
+            (exchange name, bid), or None if no venue can sell
+        """
+        name = self._top(self._bids, self.short)
+        return (name, self._quotes[name][1]) if name else None
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+
+        return [ (name, { 'ask': ask, 'bid': bid }) for name, (ask, bid) in self._quotes.items() ]
+
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+
+        ask, bid = self._quotes[name]
+        return { 'ask': ask, 'bid': bid }
+
+    def tradable(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the tradable quotes of every venue.
+
+        Returns:
+            {'ask': ask or None, 'bid': bid or None} by exchange name
+        """
+        return { name: { 'ask': ask, 'bid': bid } for name, (ask, bid) in self._quotes.items() }
@@ -1,12 +1,37 @@
 import pickle
-from collections import defaultdict
 from functools import reduce, partial
 from typing import Dict, List, Callable, Any, Optional, Set, Tuple
-from arbtools.balances import Balances
+from arbtools import clock
+from arbtools import trace
+from arbtools.balances import Balances, spending
+from arbtools.events import EventBus
+from arbtools.bestquotes import BestQuotes
+from arbtools.metrics import metrics, span
 from arbtools.orderbooks import OrderBooks
 from arbtools.nothing import Nothing
+from arbtools.polling import CONFIRM_STATES, PollSchedule, fill_state
+from arbtools.requestbook import RequestBook
+from arbtools.snapshot import SnapshotBuffer
 from arbtools.tradeplan import TradePlan
-from arbtools.traderule import TradeRule
+from arbtools.traderule import DONE_STATUSES, TradeRule, hedge_deadline, trade_option
+
+# 注文が約定するまで新規の取引を控える状態
+OPENING_STATES = ('open_pair', 'confirm_open', 'open_legs', 'confirm_legs',
+                  'recover', 'confirm_recover')
+
+def order_exchanges(deal):
+    # 注文のキー(取引所名または脚ID)から取引所名を引く
+    legs = list(deal['legs']) if 'legs' in deal else []
+    legs += deal.get('hedges') or []
+    return { leg['leg_id']: leg['exchange_name'] for leg in legs }
+
+def unfilled_exchanges(state, deal):
+    # 約定待ちのオープン注文が残っている取引所
+    if not state in OPENING_STATES:
+        return []
+    names = order_exchanges(deal)
+    return [ names.get(key, key) for key, param in deal.get('orders', {}).items()
+        if param.get('status') not in DONE_STATUSES ]
 
 
 class Broker:
@@ -14,21 +39,119 @@ class Broker:
     Central trade orchestrator that manages trade planning and execution.
     """
 
-    def __init__(self, api: Any, trade: Any) -> None:
+    def __init__(self, api: Any, trade: Any, *, shadow: bool = False) -> None:
         """
         Initialize the Broker with API facade and trade configuration.
         
         Args:
             api: API facade for exchange communication
             trade: Trade configuration parameters
+            shadow: Whether deals are only reported by a 'shadow_deal'
+                event instead of being ordered
         """
         self._api = api
         self._trade = trade
-        self._listeners: Dict[str, Callable] = defaultdict(lambda: lambda *args, **kwargs: None)
-        self._requests: List[Tuple[str, Dict[str, Any]]] = []
+        self._shadow = shadow
+        # 全ての聞き手に事象を配るバス
+        self._bus = EventBus()
+        self._book = RequestBook(exchanges=unfilled_exchanges)
         self._trade_rule = TradeRule(self)
-        self._last_quotes: Optional[Dict[str, Any]] = None
-        self._last_balances: Optional[Balances] = None
+        # 最新の相場と残高は版付きのスナップショットとして持つ
+        self._snapshots = SnapshotBuffer()
+        # 取引可能な最良気配の索引と、各取引所の前回の板と残高
+        self._best = BestQuotes()
+        self._seen: Dict[str, Tuple[Any, ...]] = {}
+        self._polls = PollSchedule(
+            interval=trade_option(trade, 'poll_interval', 0.2),
+            max_interval=trade_option(trade, 'poll_max_interval', 30.0),
+            backoff=trade_option(trade, 'poll_backoff', 2.0))
+        self._spreads: Optional[Any] = None
+        # 最後に書いた (ファイル名, 取引の一覧, 版)
+        self._saved: Optional[Tuple[str, RequestBook, int]] = None
+
+    @property
+    def _last_quotes(self) -> Optional[Any]:
+
+        snapshot = self._snapshots.current()
+        return snapshot.quotes if snapshot else None
+
+    @_last_quotes.setter
+    def _last_quotes(self, quotes: Any) -> None:
+
+        self._snapshots.publish(quotes=quotes)
+
+    @property
+    def _last_balances(self) -> Optional[Balances]:
+
+        snapshot = self._snapshots.current()
+        return snapshot.balances if snapshot else None
+
+    @_last_balances.setter
+    def _last_balances(self, balances: Optional[Balances]) -> None:
+
+        self._snapshots.publish(balances=balances)
+
+    def snapshot(self) -> Optional[Any]:
+        """
+        Get the market snapshot of the last planning round.
+        
+        Returns:
+            MarketSnapshot, or None before the first round
+        """
+        return self._snapshots.current()
+
+    @property
+    def _requests(self) -> RequestBook:
+
+        return self._book
+
+    @_requests.setter
+    def _requests(self, requests: List[Tuple[str, Dict[str, Any]]]) -> None:
+
+        self._book = RequestBook(requests, exchanges=unfilled_exchanges)
+
+    def set_spreads(self, spreads: Optional[Any]) -> 'Broker':
+        """
+        Derive the entry and exit thresholds of pair deals from spread
+        statistics.
+
+        Args:
+            spreads: SpreadStats, or None for the static thresholds only
+
+        Returns:
+            Self for method chaining
+        """
+        self._spreads = spreads
+        return self
+
+    def target_profit_rate(self, deal: Dict[str, Any]) -> float:
+        """
+        Get the profit rate a deal has to reach to be requested.
+
+        The configured target_profit_rate is the floor; with spread
+        statistics, a pair deal also has to reach its pair's entry rate.
+
+        Args:
+            deal: Deal data
+
+        Returns:
+            Rate in percent
+        """
+        floor = self._trade.target_profit_rate
+        if self._spreads is None or 'legs' in deal:
+            return floor
+        rate = self._spreads.entry_rate(deal['buy']['exchange_name'], deal['sell']['exchange_name'])
+        return floor if rate is None else max(floor, rate)
+
+    def _exitcost_ratio(self, plan: Any) -> float:
+        # 反対方向の利ざやの分布から、決済に払ってよい割合を決める
+        ratio = self._trade.allowed_exitcost_ratio
+        if self._spreads is None:
+            return ratio
+        _, rate = plan.expected_profit()
+        names = [ plan.best(side)['exchange_name'] for side in ('buy', 'sell') ]
+        dynamic = self._spreads.exitcost_ratio(*names, rate)
+        return ratio if dynamic is None else dynamic
 
     def trade_volume(self) -> float:
         """
@@ -39,22 +162,40 @@ class Broker:
         """
         return self._trade.volume
 
-    def on(self, name: str, f: Callable, **kwargs) -> 'Broker':
+    def on(self, name: str, f: Callable, *, delivery: str = 'inline', queue_size: int = 1000,
+           policy: str = 'drop_oldest', **kwargs) -> 'Broker':
         """
         Register an event listener for the specified event name.
         
+        Every listener of an event is called, in the order they were
+        registered. Queued listeners run in their own thread, so slow ones
+        such as notifications do not hold up trading.
+        
         Args:
             name: Event name to listen for
             f: Callback function to execute when event occurs
+            delivery: 'inline' to run in the emitting thread, or 'queued'
+            queue_size: Most events waiting for a queued listener
+            policy: 'drop_oldest', 'drop_newest' or 'block' when the queue is full
             **kwargs: Additional arguments to pass to the callback
             
         Returns:
             Self for method chaining
         """
-        self._listeners[name] = partial(f, **kwargs) if kwargs else f
+        listener = partial(f, **kwargs) if kwargs else f
+        self._bus.subscribe(name, listener, delivery=delivery, queue_size=queue_size, policy=policy)
 
         return self
 
+    def events(self) -> EventBus:
+        """
+        Get the event bus, e.g. for listener statistics.
+        
+        Returns:
+            EventBus delivering the broker's events
+        """
+        return self._bus
+
     def emit(self, name: str, arg: Any) -> Any:
         """
         Emit an event with the specified name and argument.
@@ -66,12 +207,18 @@ class Broker:
         Returns:
             Result of the event listener
         """
-        return self._listeners[name](self, arg)
+        return self._bus.dispatchers[name](self, arg)
 
     def save_to(self, file_name):
 
+        # 前回書いてから取引が出入りしていなければ書き直さない
+        book = self._book
+        saved = self._saved
+        if saved and saved[0] == file_name and saved[1] is book and saved[2] == book.version():
+            return self
         with open(file_name, 'wb') as f:
-            pickle.dump(self._requests, f)
+            pickle.dump(list(book), f)
+        self._saved = (file_name, book, book.version())
 
         return self
 
@@ -85,10 +232,18 @@ class Broker:
 
         return self
 
+    def request_counts(self):
+
+        return self._book.counts()
+
     def map_requests(self, f):
-        xs = [ f(status) for status in self._requests ]
+        xs = [ f(status) for status in self._book ]
         return xs
 
+    def find_request(self, deal_id):
+
+        return self._book.deal(deal_id)
+
     def _to_investments(self, quotes, trade_volume):
 
         def _investment(acc, item):
@@ -112,22 +267,14 @@ class Broker:
             if not name in balances:
                 return False
 
-            _, quote_volume = quote
-            return all([
-                quote_volume > volume,
-                balances[name]['JPY']['free'] > investments[name]
-            ])
+            return quote[1] > volume and balances[name]['JPY']['free'] > investments[name]
 
         def _short_OK(name, quote):
 
             if not name in balances:
                 return False
 
-            _, quote_volume = quote
-            return all([
-                quote_volume > volume,
-                balances[name]['BTC']['free'] > volume
-            ])
+            return quote[1] > volume and balances[name]['BTC']['free'] > volume
 
         def _verify(acc, item):
             name, quote = item
@@ -139,27 +286,69 @@ class Broker:
 
         return reduce(_verify, quotes.items(), {})
 
+    def _refresh_best(self, volume, quotes, balances):
+        # 板の先頭か残高が変わった取引所だけ索引を更新する
+        seen = self._seen
+        for name, quote in quotes.items():
+            balance = balances[name] if name in balances else None
+            key = (volume, quote['ask'], quote['bid'],
+                balance['JPY']['free'] if balance else None,
+                balance['BTC']['free'] if balance else None)
+            if seen.get(name) == key:
+                continue
+            seen[name] = key
+            tradable = self._tradable(volume, { name: quote }, balances)[name]
+            self._best.update(name, tradable['ask'], tradable['bid'])
+        for name in [ name for name in seen if name not in quotes ]:
+            del seen[name]
+            self._best.remove(name)
+        return self._best
+
+    def _trace_of(self, quotes):
+
+        trace = quotes.trace() if hasattr(quotes, 'trace') else {}
+        return { **trace, 'planned': clock.time() }
+
     def orderbooks(self):
 
         return OrderBooks(self._api)
 
-    def planning(self, quotes, *, balances=None):
+    def _skewed(self, plan, snapshot):
+        # 売り買いの板の受信時刻が離れすぎた計画は使わない
+        names = [ plan.best(side)['exchange_name'] for side in ('buy', 'sell') ]
+        skew = snapshot.skew(names)
+        if skew is None:
+            return False
+        metrics.observe('plan_skew', skew)
+        if skew <= trade_option(self._trade, 'max_skew', float('inf')):
+            return False
+        metrics.incr('skew_rejected')
+        self.emit('skew_rejected', { 'exchanges': names, 'skew': skew, 'version': snapshot.version })
+        return True
 
-        self._last_quotes = quotes
+    def planning(self, quotes, *, balances=None):
 
         volume = self.trade_volume()
-        balances = balances if balances else Balances(self._api)
+        if not balances:
+            with span('balances'):
+                balances = Balances(self._api)
         if balances.has_error():
+            self._last_quotes = quotes
             return Nothing()
 
-        self._last_balances = balances
+        snapshot = self._snapshots.publish(quotes=quotes, balances=balances)
 
-        quotes_ = self._tradable(volume, quotes, balances)
+        with span('tradable'):
+            best = self._refresh_best(volume, quotes, balances)
 
-        plan = TradePlan(self._api, volume, quotes_, balances)
+        plan = TradePlan(self._api, volume, best, balances)
         plan.set_allowed_exitcost_ratio(self._trade.allowed_exitcost_ratio)
+        plan.set_trace(self._trace_of(quotes))
         if not self._trade_rule.validate_plan(plan):
             return Nothing()
+        if self._skewed(plan, snapshot):
+            return Nothing()
+        plan.set_allowed_exitcost_ratio(self._exitcost_ratio(plan))
 
         return plan
 
@@ -189,62 +378,119 @@ class Broker:
         balances = balances if balances else Balances(self._api)
         plan = TradePlan(self._api, volume, quotes_, balances)
         plan.set_allowed_exitcost_ratio(self._trade.allowed_exitcost_ratio)
+        plan.set_trace(self._trace_of(quotes))
 
         return plan if plan.target_volume() == volume else None
 
     def request_is_ready(self):
         # 未完了のオープン注文があるか？
-        reply = True
-        status_list = [ status for status, _ in self._requests]
-        if 'open_pair' in status_list or 'confirm_open' in status_list:
-            reply = False
-        return reply
+        return not self._book.any_state(OPENING_STATES)
 
     def unclosed_exchanges(self):
         # 未完了のオープン注文がある取引所
-        exchanges = []
-        for status, deal in self._requests:
-            if not status in ('open_pair', 'confirm_open'):
-                continue
-            for name, param in deal['orders'].items():
-                if 'status' in param and param['status'] == 'closed':
-                    continue
-                exchanges.append(name)
-        return set(exchanges)
+        return self._book.unclosed_exchanges()
+
+    def reserved(self):
+        # 完了していない取引が注文に充てた資金 (取引所名, 通貨) -> 量
+        needs = {}
+        for _, data in self._book:
+            for key, amount in spending(data).items():
+                needs[key] = needs.get(key, 0.0) + amount
+        return needs
 
     def exchange_pair(self, deal):
 
+        if 'legs' in deal:
+            return set(leg['exchange_name'] for leg in deal['legs'])
         return set(deal[side]['exchange_name'] for side in ['buy', 'sell'])
 
+    def order_timeout(self, deal):
+        # 取引の注文先の取引所で、発注・取消の応答にかかりうる時間
+        names = order_exchanges(deal)
+        exchanges = { names.get(key, key) for key in deal.get('orders', {}) }
+        return self._api.order_timeout(exchanges or self.exchange_pair(deal))
+
     def request(self, deal):
 
-        if self.unclosed_exchanges() & self.exchange_pair(deal):
+        if isinstance(deal, Nothing):
+            return Nothing()
+
+        if self._book.unclosed(self.exchange_pair(deal)):
             # 未完了のオープン注文がある場合、新規にリクエストを積まない
             return Nothing()
 
-        if len(self._requests) >= self._trade.max_order:
+        if len(self._book) >= self._trade.max_order:
             return Nothing()
 
-        if isinstance(deal, Nothing):
+        if deal['profit_rate'] < self.target_profit_rate(deal):
             return Nothing()
 
-        if deal['profit_rate'] < self._trade.target_profit_rate:
+        if self._shadow:
+            # 影の戦略は注文せずに取引を報告するだけ
+            metrics.incr('shadow_deals')
+            self.emit('shadow_deal', deal)
             return Nothing()
 
+        trace.mark(deal, 'requested')
         status = self._trade_rule.new_status(deal)
-        self._requests.append(status)
+        self._book.append(status)
+        # 発注の直前に組み立てずに済むよう注文の引数を用意しておく
+        self._api.prepare_orders(deal)
 
         return self
 
+    def notify_fill(self, exchange_name, order_id=None):
+        # 約定のプッシュ通知を受けたら、待たずに次の処理で確認する
+        woken = 0
+        for status, deal in self._book.in_states(CONFIRM_STATES):
+            names = order_exchanges(deal)
+            for key, order in deal.get('orders', {}).items():
+                if names.get(key, key) != exchange_name:
+                    continue
+                if order_id is None or order.get('id') == order_id:
+                    self._polls.wake(deal)
+                    woken += 1
+                    break
+        return woken
+
+    def _schedule(self, status, next_status, before):
+
+        state, data = status
+        next_state, next_data = next_status if next_status else (None, None)
+        if next_state in CONFIRM_STATES and next_state == state:
+            if next_data is not data:
+                # 新しいデータに引き継ぐ前に古い予定を消す
+                self._polls.forget(data)
+            self._polls.polled(next_data, fill_state(next_data) != before,
+                hedge_deadline(next_data, self))
+            return
+        if state in CONFIRM_STATES:
+            self._polls.forget(data)
+        if next_state in CONFIRM_STATES:
+            self._polls.placed(next_data)
+
     def process_requests(self):
 
-        new_requests = []
-        while self._requests:
-            status = self._requests.pop(0)
-            next_status = self._trade_rule.execute(
-                status, self._last_quotes, self._last_balances)
+        # 処理中に次の版が出ても同じ版の相場と残高を使う
+        snapshot = self._snapshots.current()
+        quotes = snapshot.quotes if snapshot else None
+        balances = snapshot.balances if snapshot else None
+        # 今ある分だけ処理し、次の状態は後ろに積み直す
+        book = self._book
+        for _ in range(len(book)):
+            state, data = book.peek()
+            before = None
+            if state in CONFIRM_STATES:
+                if not self._polls.due(data):
+                    # 確認の時刻になるまで約定確認を見送る
+                    metrics.incr('confirm_skipped')
+                    book.rotate()
+                    continue
+                before = fill_state(data)
+            status = book.popleft()
+            next_status = self._trade_rule.execute(status, quotes, balances)
+            self._schedule(status, next_status, before)
             if next_status:
-                new_requests.append(next_status)
-        self._requests = new_requests
+                book.append(next_status)
 
         return self
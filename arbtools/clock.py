@@ -0,0 +1,117 @@
+import time as _time
+import datetime
+import threading
+
+
+class SystemClock:
+    """
+    Wall clock used in live trading.
+    """
+
+    def time(self) -> float:
+
+        return _time.time()
+
+    def sleep(self, seconds: float) -> None:
+
+        _time.sleep(seconds)
+
+
+class VirtualClock:
+    """
+    Manually advanced clock used to replay market data faster than real time.
+    """
+
+    def __init__(self, start: float = 0.0) -> None:
+
+        self._now = start
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+
+        with self._lock:
+            self._now += max(0.0, seconds)
+
+    def set(self, timestamp: float) -> None:
+
+        # 時刻は巻き戻さない
+        with self._lock:
+            self._now = max(self._now, timestamp)
+
+
+_clock = SystemClock()
+
+def get_clock():
+
+    return _clock
+
+def set_clock(clock):
+
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+def time() -> float:
+
+    return _clock.time()
+
+def sleep(seconds: float) -> None:
+
+    _clock.sleep(seconds)
+
+def now(tz=None) -> datetime.datetime:
+
+    return datetime.datetime.fromtimestamp(_clock.time(), tz)
+
+
+class _VirtualDatetime(datetime.datetime):
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.fromtimestamp(_clock.time(), tz)
+
+    @classmethod
+    def today(cls):
+        return cls.now()
+
+
+class _DatetimeModule:
+    # datetimeモジュールの代わりに、nowだけを現在のclockに向ける
+
+    def __getattr__(self, name):
+        if name == 'datetime':
+            return _VirtualDatetime
+        return getattr(datetime, name)
+
+
+class patched_datetime:
+    """
+    Context manager that makes a module see the current clock as `datetime.now`.
+
+    Used to drive libraries such as `schedule`, which read the wall clock
+    through their own `datetime` import, from a VirtualClock.
+    """
+
+    def __init__(self, module) -> None:
+
+        self._module = module
+        self._saved = None
+
+    def __enter__(self):
+
+        self._saved = self._module.datetime
+        self._module.datetime = _DatetimeModule()
+        return self
+
+    def __exit__(self, *exc):
+
+        self._module.datetime = self._saved
+        return False
@@ -0,0 +1,207 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # requestsが無くても他の機能は使える
+    requests = None
+    HTTPAdapter = None
+
+
+class ConnectionManager:
+    """
+    Managed HTTP connections of the exchanges and notifiers.
+
+    `session(name)` returns a requests.Session with its own keep-alive pool
+    of `pool_size` connections, to be passed to a ccxt exchange as its
+    'session' option or used by a notifier. Names registered with `watch`
+    get a ping: `warm` runs it `concurrency` times at once to open that
+    many connections before the first order, and once started, a
+    background thread pings every name idle for `keepalive` seconds so its
+    connections are not dropped by the venue.
+    """
+
+    def __init__(self, *, pool_size: int = 4, keepalive: float = 30.0) -> None:
+        """
+        Initialize the ConnectionManager.
+
+        Args:
+            pool_size: Connections kept open per session
+            keepalive: Idle seconds after which a watched name is pinged
+        """
+        self._pool_size = pool_size
+        self._keepalive = keepalive
+        self._sessions: Dict[str, Any] = {}
+        self._pings: Dict[str, Callable[[], Any]] = {}
+        self._used: Dict[str, float] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _count(self, name: str, key: str) -> None:
+
+        with self._lock:
+            counts = self._counts.setdefault(name, { 'requests': 0, 'pings': 0, 'errors': 0 })
+            counts[key] += 1
+
+    def used(self, name: str) -> None:
+        """
+        Record activity on a name, postponing its next keep-alive ping.
+
+        Args:
+            name: Exchange or notifier name
+        """
+        self._used[name] = time.monotonic()
+
+    def session(self, name: str) -> Any:
+        """
+        Get the pooled session of a name, creating it on first use.
+
+        Args:
+            name: Exchange or notifier name
+
+        Returns:
+            requests.Session
+        """
+        if requests is None:
+            raise RuntimeError('ConnectionManager.session requires the requests package')
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is not None:
+                return session
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self._pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+            def _hook(response, *args, **kwargs):
+                self.used(name)
+                self._count(name, 'requests')
+
+            session.hooks['response'].append(_hook)
+            self._sessions[name] = session
+            return session
+
+    def watch(self, name: str, ping: Callable[[], Any]) -> None:
+        """
+        Register the cheap request keeping a name's connections warm.
+
+        Args:
+            name: Exchange or notifier name
+            ping: Callable making one request through the name's connections
+        """
+        self._pings[name] = ping
+        self._used.setdefault(name, 0.0)
+
+    def _ping(self, name: str) -> Optional[str]:
+
+        try:
+            self._pings[name]()
+        except Exception as e:
+            self._count(name, 'errors')
+            return str(e)
+        self._count(name, 'pings')
+        self.used(name)
+        return None
+
+    def warm(self, concurrency: int = 2) -> Dict[str, Optional[str]]:
+        """
+        Open connections to every watched name.
+
+        Args:
+            concurrency: Pings sent at once per name, one connection each
+
+        Returns:
+            Error message of a failed ping, or None, by name
+        """
+        names = list(self._pings)
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(names) * concurrency) as executor:
+            futures = [ (name, executor.submit(self._ping, name))
+                for name in names for _ in range(concurrency) ]
+            errors: Dict[str, Optional[str]] = {}
+            for name, future in futures:
+                errors[name] = errors.get(name) or future.result()
+        return errors
+
+    def idle(self) -> List[str]:
+        """
+        Get the watched names idle for longer than the keep-alive interval.
+
+        Returns:
+            Names to ping
+        """
+        now = time.monotonic()
+        return [ name for name in self._pings if now - self._used.get(name, 0.0) >= self._keepalive ]
+
+    def _run(self) -> None:
+
+        while not self._stopped.wait(self._keepalive / 2.0):
+            for name in self.idle():
+                self._ping(name)
+
+    def start(self) -> 'ConnectionManager':
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='keepalive', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+
+        self._stopped.set()
+        for session in self._sessions.values():
+            session.close()
+
+    def _pool_stats(self, session: Any) -> Dict[str, int]:
+
+        # urllib3のプールから接続数を集計する
+        stats = { 'connections': 0, 'idle_connections': 0 }
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats['connections'] += pool.num_connections
+                stats['idle_connections'] += pool.pool.qsize() if pool.pool else 0
+        return stats
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get the connection statistics of every name.
+
+        Returns:
+            Requests, pings, ping errors and idle seconds by name, plus the
+            connections opened and currently idle in its pool for sessions
+        """
+        now = time.monotonic()
+        names = set(self._sessions) | set(self._pings)
+        result = {}
+        for name in sorted(names):
+            with self._lock:
+                counts = dict(self._counts.get(name, { 'requests': 0, 'pings': 0, 'errors': 0 }))
+            used = self._used.get(name)
+            counts['idle_seconds'] = now - used if used else None
+            if name in self._sessions:
+                counts.update(self._pool_stats(self._sessions[name]))
+            result[name] = counts
+        return result
+
+    def gauge(self, key: str) -> Dict[str, float]:
+        """
+        Get one statistic by name, for Metrics.gauge.
+
+        Args:
+            key: Statistic, e.g. 'connections' or 'requests'
+
+        Returns:
+            Values by name
+        """
+        return { name: stats[key] for name, stats in self.stats().items()
+            if stats.get(key) is not None }
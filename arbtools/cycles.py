@@ -0,0 +1,315 @@
+import uuid
+from math import log, exp
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Set, Tuple
+from arbtools import clock
+from arbtools.balances import spending
+from arbtools.records import Deal, Leg, Quote
+
+# (exchange_name, symbol, side)
+EdgeKey = Tuple[str, str, str]
+
+
+class CycleFinder:
+    """
+    Incremental detector of profitable currency cycles across exchanges.
+
+    Currencies are nodes and every (exchange, symbol) book contributes two
+    edges weighted by the fee-adjusted negative log rate: 'buy' spends the
+    quote currency at the best ask, 'sell' spends the base currency at the
+    best bid. A cycle whose weights sum below zero returns more than it
+    spends. Cycles that trade one symbol on every leg are left to the pair
+    deals of Broker.planning.
+
+    Only edges whose top of book changed since the last update are searched
+    again; profitable cycles that do not touch a changed edge are kept from
+    the previous update.
+
+    A deal starts from a fixed amount of the currency its cycle spends
+    first: the `notional` of that currency if configured, otherwise the
+    trade volume converted from `currency` at the current books. A cycle
+    that was requested is not proposed again for `cooldown` seconds.
+    """
+
+    def __init__(self, api: Any, symbols: List[str], *, max_legs: int = 3,
+                 currency: str = 'BTC', notional: Optional[Dict[str, float]] = None,
+                 cooldown: float = 60.0) -> None:
+        """
+        Initialize the CycleFinder.
+
+        Args:
+            api: API facade for exchange communication
+            symbols: Symbols to fetch from every exchange, e.g. 'BTC/JPY'
+            max_legs: Maximum number of legs in a cycle
+            currency: Currency the volume passed to `deals` is counted in
+            notional: Amount a cycle starts from, by start currency
+            cooldown: Seconds before a requested cycle is proposed again
+        """
+        self._api = api
+        self._symbols = list(symbols)
+        self._max_legs = max_legs
+        self._currency = currency
+        self._notional = dict(notional or {})
+        self._cooldown = cooldown
+        self._requested: Dict[Tuple[EdgeKey, ...], float] = {}
+        self._built: Dict[str, Tuple[EdgeKey, ...]] = {}
+        self._quotes: Dict[EdgeKey, Tuple[float, float]] = {}
+        self._weights: Dict[EdgeKey, float] = {}
+        self._nodes: Dict[EdgeKey, Tuple[str, str]] = {}
+        self._adjacency: Dict[str, Set[EdgeKey]] = defaultdict(set)
+        self._cycles: Dict[Tuple[EdgeKey, ...], float] = {}
+        self._errors: Dict[str, Any] = {}
+
+    def refresh(self) -> 'CycleFinder':
+        """
+        Fetch the books of all symbols and update the graph.
+
+        Returns:
+            Self for method chaining
+        """
+        return self.update(self._api.fetch_symbol_orderbooks(self._symbols))
+
+    def symbols(self) -> List[str]:
+
+        return list(self._symbols)
+
+    def errors(self) -> Dict[str, Any]:
+
+        return self._errors
+
+    def update(self, books: Dict[str, Dict[str, Any]]) -> 'CycleFinder':
+        """
+        Update edges from order books and re-evaluate changed edges.
+
+        Args:
+            books: Order books by exchange name and symbol
+
+        Returns:
+            Self for method chaining
+        """
+        error_key = 'fetch_orderbooks_error'
+        self._errors = {}
+        dirty: Set[EdgeKey] = set()
+        for name, symbols in books.items():
+            if error_key in symbols:
+                self._errors[name] = symbols
+                continue
+            for symbol, book in symbols.items():
+                if error_key in book:
+                    self._errors[(name, symbol)] = book
+                    continue
+                dirty |= self._update_book(name, symbol, book)
+
+        if dirty:
+            self._cycles = {
+                k: v for k, v in self._cycles.items() if not dirty.intersection(k)}
+            for edge in dirty:
+                if edge in self._weights:
+                    self._search(edge)
+
+        return self
+
+    def _update_book(self, name: str, symbol: str, book: Dict[str, Any]) -> Set[EdgeKey]:
+
+        fees = self._api[name].trading_fees / 100.0
+        base, quote = symbol.split('/')
+        asks = book.get('asks')
+        bids = book.get('bids')
+        # 丸める前の板なので、asksは安い順、bidsは高い順に並んでいる
+        tops = {
+            'buy': (asks[0][0], asks[0][1]) if asks else None,
+            'sell': (bids[0][0], bids[0][1]) if bids else None,
+        }
+
+        dirty = set()
+        for side, top in tops.items():
+            edge = (name, symbol, side)
+            if self._quotes.get(edge) == top:
+                continue
+            dirty.add(edge)
+            src, dst = (quote, base) if side == 'buy' else (base, quote)
+            if top is None or top[0] <= 0:
+                self._quotes.pop(edge, None)
+                self._weights.pop(edge, None)
+                self._adjacency[src].discard(edge)
+                continue
+            price, _ = top
+            rate = (1.0 / price if side == 'buy' else price) * (1.0 - fees)
+            self._quotes[edge] = top
+            self._weights[edge] = -log(rate)
+            self._nodes[edge] = (src, dst)
+            self._adjacency[src].add(edge)
+
+        return dirty
+
+    def _search(self, first: EdgeKey) -> None:
+        # 変更された辺を通る閉路だけを深さ優先で探索する
+        origin, head = self._nodes[first]
+
+        def _walk(node, path, books, weight):
+            for edge in self._adjacency[node]:
+                book = edge[:2]
+                if book in books:
+                    continue
+                total = weight + self._weights[edge]
+                _, dst = self._nodes[edge]
+                if dst == origin:
+                    if total < 0:
+                        self._add_cycle(path + [edge], total)
+                elif len(path) + 1 < self._max_legs:
+                    _walk(dst, path + [edge], books | {book}, total)
+
+        _walk(head, [first], {first[:2]}, self._weights[first])
+
+    def _add_cycle(self, path: List[EdgeKey], weight: float) -> None:
+
+        # 単一銘柄の取引所間の往復はペア取引として扱う
+        if len({ edge[1] for edge in path }) == 1:
+            return
+        # 同じ閉路は回転させて最小の辺から始まる形にそろえる
+        i = path.index(min(path))
+        self._cycles[tuple(path[i:] + path[:i])] = weight
+
+    def cycles(self) -> List[Tuple[Tuple[EdgeKey, ...], float]]:
+        """
+        Get the profitable cycles ordered by expected return.
+
+        Returns:
+            List of (edges, log weight) tuples, most profitable first
+        """
+        return sorted(self._cycles.items(), key=lambda item: item[1])
+
+    def _convert(self, amount: float, src: str, dst: str) -> Optional[float]:
+        # 両通貨を直接結ぶ板の売買の気配の中値で換算する
+        if src == dst:
+            return amount
+        for symbol, inverse in (('{}/{}'.format(src, dst), False), ('{}/{}'.format(dst, src), True)):
+            tops = [ top[0] for (_, s, _), top in self._quotes.items() if s == symbol ]
+            if tops:
+                price = sum(tops) / len(tops)
+                return amount / price if inverse else amount * price
+        return None
+
+    def start_amount(self, cycle: Tuple[EdgeKey, ...], volume: float) -> Optional[float]:
+        """
+        Get how much of its start currency a cycle spends.
+
+        Args:
+            cycle: Edges of the cycle
+            volume: Trade volume in `currency`
+
+        Returns:
+            Amount of the currency the first leg spends, or None if it has
+            no notional and cannot be converted from `currency`
+        """
+        src, _ = self._nodes[cycle[0]]
+        if src in self._notional:
+            return self._notional[src]
+        return self._convert(volume, self._currency, src)
+
+    def deal(self, cycle: Tuple[EdgeKey, ...], start: float) -> Optional[Dict[str, Any]]:
+        """
+        Build a multi-leg deal for a cycle.
+
+        Args:
+            cycle: Edges of the cycle
+            start: Amount of the start currency spent by the first leg
+
+        Returns:
+            Deal data with one entry per leg, or None if a book is too thin
+        """
+        # 最初の脚で使う額から各脚の数量を順に求める
+        src, _ = self._nodes[cycle[0]]
+        held = start
+
+        legs = []
+        for i, edge in enumerate(cycle):
+            name, symbol, side = edge
+            price, available = self._quotes[edge]
+            fees = self._api[name].trading_fees / 100.0
+            amount = held / price if side == 'buy' else held
+            if amount > available:
+                return None
+            held = (amount if side == 'buy' else amount * price) * (1.0 - fees)
+            legs.append(Leg(
+                leg_id='{}:{}'.format(i, name),
+                exchange_name=name,
+                symbol=symbol,
+                side=side,
+                quote=Quote(price, available),
+                amount=amount,
+            ))
+
+        profit = held - start
+        return Deal(
+            deal_id=uuid.uuid4().hex,
+            legs=legs,
+            currency=src,
+            volume=start,
+            expected_profit=profit,
+            profit_rate=(exp(-self._cycles.get(cycle, 0.0)) - 1.0) * 100.0,
+            allowed_exitcost=0,
+        )
+
+    def deals(self, volume: float, *, balances: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """
+        Build deals for all profitable cycles the books and balances can
+        fill and that are not cooling down.
+
+        Args:
+            volume: Trade volume in `currency`
+            balances: Balances every leg is checked against, unchecked if None
+
+        Returns:
+            List of deals, most profitable first
+        """
+        now = clock.time()
+        self._built = {}
+        result = []
+        for cycle, _ in self.cycles():
+            if now - self._requested.get(cycle, float('-inf')) < self._cooldown:
+                continue
+            start = self.start_amount(cycle, volume)
+            deal = self.deal(cycle, start) if start else None
+            if deal is None or (balances is not None and not funded(deal, balances)):
+                continue
+            self._built[deal['deal_id']] = cycle
+            result.append(deal)
+        return result
+
+    def requested(self, deal: Dict[str, Any]) -> None:
+        """
+        Start the cooldown of the cycle a requested deal was built from.
+
+        Args:
+            deal: Deal returned by `deals`
+        """
+        cycle = self._built.get(deal['deal_id'])
+        if cycle is not None:
+            now = clock.time()
+            self._requested[cycle] = now
+            # 冷却の終わった閉路は忘れる
+            self._requested = { k: t for k, t in self._requested.items() if now - t < self._cooldown }
+
+
+def funded(deal: Dict[str, Any], balances: Any) -> bool:
+    """
+    Tell whether every venue holds what the legs of a deal spend there.
+
+    The legs are placed together, so a venue's legs are summed: buys spend
+    the quote currency, sells the base currency.
+
+    Args:
+        deal: Multi-leg deal
+        balances: Balances of the venues
+
+    Returns:
+        True if no leg would be refused for lack of funds
+    """
+    for (name, currency), need in spending(deal).items():
+        if name not in balances:
+            return False
+        free = balances[name].get(currency, {}).get('free') or 0.0
+        if free < need:
+            return False
+    return True
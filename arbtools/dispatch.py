@@ -0,0 +1,191 @@
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, ContextManager, Optional, Tuple
+from arbtools import clock
+from arbtools.metrics import metrics
+from arbtools.records import Order
+
+
+class OrderDispatcher:
+    """
+    Dedicated path placing the orders of pair deals.
+
+    Every exchange has a worker thread started on its first order and kept
+    running, so sending a deal does not create threads. The orders of a
+    deal are handed to their venues' workers, which wait on a common
+    barrier and are released together. The worker of the venue with the
+    shorter one-way latency, half its measured order round trip, then
+    waits the difference so both orders reach their venues at about the
+    same time. Order parameters are built by `prepare` when a deal is
+    requested and kept for the `prepared` latest deals.
+    """
+
+    def __init__(self, apis: Dict[str, Any], build: Callable[[Dict[str, Any]], Dict[str, Dict[str, Any]]],
+                 timed: Callable[[str, str], ContextManager], *, latency: Optional[Any] = None,
+                 max_stagger: float = 0.5, barrier_timeout: float = 0.05, prepared: int = 64) -> None:
+        """
+        Initialize the OrderDispatcher.
+
+        Args:
+            apis: Exchange API instances by name
+            build: Function building the order parameters of a deal by
+                exchange name
+            timed: Context manager factory timing a gateway call as
+                timed(stage, exchange name)
+            latency: LatencyEstimator giving the order round trips
+            max_stagger: Longest delay put on an order, in seconds
+            barrier_timeout: Longest wait of a worker for the other legs
+            prepared: Deals whose parameters are kept ready
+        """
+        self._apis = apis
+        self._build = build
+        self._timed = timed
+        self._latency = latency
+        self._max_stagger = max_stagger
+        self._barrier_timeout = barrier_timeout
+        self._limit = prepared
+        self._prepared: 'OrderedDict[Any, Tuple[Tuple[Any, ...], Dict[str, Dict[str, Any]]]]' = OrderedDict()
+        self._queues: Dict[str, queue.SimpleQueue] = {}
+        self._lock = threading.Lock()
+
+    def set_latency(self, latency: Optional[Any]) -> None:
+
+        self._latency = latency
+
+    def _signature(self, data: Dict[str, Any]) -> Tuple[Any, ...]:
+        # 準備した後で値段や数量が変わっていないかを見る鍵
+        return tuple((data[side]['exchange_name'], data[side]['quote'][0])
+            for side in ('buy', 'sell')) + (data['volume'],)
+
+    def prepare(self, data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Build and keep the order parameters of a deal.
+
+        Args:
+            data: Pair deal data
+
+        Returns:
+            Order parameters by exchange name
+        """
+        params = self._build(data)
+        key = data.get('deal_id')
+        if key is not None:
+            with self._lock:
+                self._prepared[key] = (self._signature(data), params)
+                self._prepared.move_to_end(key)
+                while len(self._prepared) > self._limit:
+                    self._prepared.popitem(last=False)
+        return params
+
+    def _params(self, data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+
+        key = data.get('deal_id')
+        with self._lock:
+            prepared = self._prepared.pop(key, None) if key is not None else None
+        if prepared is not None and prepared[0] == self._signature(data):
+            metrics.incr('orders_prepared')
+            return prepared[1]
+        return self._build(data)
+
+    def delays(self, names: Any) -> Dict[str, float]:
+        """
+        Get how long each venue's order waits after the barrier.
+
+        Args:
+            names: Exchange names of the deal
+
+        Returns:
+            Seconds by exchange name, 0 for the slowest venue and for
+            venues whose round trip is not measured yet
+        """
+        rtts = { name: self._latency.rtt(name, 'order') if self._latency else None for name in names }
+        one_way = { name: rtt / 2.0 for name, rtt in rtts.items() if isinstance(rtt, (int, float)) }
+        if len(one_way) < 2:
+            return dict.fromkeys(names, 0.0)
+        slowest = max(one_way.values())
+        return { name: min(self._max_stagger, slowest - one_way[name]) if name in one_way else 0.0
+            for name in names }
+
+    def _worker(self, name: str) -> queue.SimpleQueue:
+
+        with self._lock:
+            jobs = self._queues.get(name)
+            if jobs is None:
+                jobs = self._queues[name] = queue.SimpleQueue()
+                threading.Thread(target=self._run, args=(jobs,), name='dispatch-' + name,
+                    daemon=True).start()
+            return jobs
+
+    def _run(self, jobs: queue.SimpleQueue) -> None:
+
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            future, f = job
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(f())
+                except BaseException as e:
+                    future.set_exception(e)
+
+    def _send(self, name: str, args: Dict[str, Any], barrier: threading.Barrier, delay: float) -> Any:
+
+        try:
+            barrier.wait(self._barrier_timeout)
+        except threading.BrokenBarrierError:
+            # 他の脚を待たずに出す
+            metrics.incr('dispatch_barrier_broken', name)
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            sent = clock.time()
+            with self._timed('create_order', name):
+                result = self._apis[name].create_order(**args)
+            return Order.from_ccxt(result, sent_at=sent, acked_at=clock.time())
+        except Exception as e:
+            print(f"Error creating order: {e}")
+            metrics.incr('create_order_errors', name)
+            return { 'create_orders_error': str(e) }
+
+    def dispatch(self, data: Dict[str, Any], ordered: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Place the orders of a pair deal that are not placed yet.
+
+        Args:
+            data: Pair deal data
+            ordered: Previously created orders, if any
+
+        Returns:
+            Created order, error dictionary or previous order by exchange name
+        """
+        params = self._params(data)
+        result: Dict[str, Any] = {}
+        pending = [ name for name in params
+            if not (ordered and name in ordered and 'id' in ordered[name]) ]
+        for name in params:
+            if name not in pending:
+                result[name] = ordered[name]
+        if not pending:
+            return result
+
+        delays = self.delays(pending)
+        barrier = threading.Barrier(len(pending))
+        futures = {}
+        for name in pending:
+            future: Future = Future()
+            self._worker(name).put((future, lambda name=name: self._send(name, params[name], barrier, delays[name])))
+            futures[name] = future
+        for name, future in futures.items():
+            result[name] = future.result()
+        return { name: result[name] for name in params }
+
+    def close(self) -> None:
+
+        with self._lock:
+            for jobs in self._queues.values():
+                jobs.put(None)
+            self._queues.clear()
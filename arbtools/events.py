@@ -0,0 +1,303 @@
+import time
+import queue
+import threading
+import traceback
+from collections import defaultdict
+from typing import Dict, Any, Callable, List, Optional
+from arbtools.metrics import Metrics, metrics as default_metrics
+from arbtools.records import Record
+
+POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+
+def _noop(*args, **kwargs):
+    return None
+
+
+def snapshot(arg: Any) -> Any:
+    """
+    Copy the dicts, lists and records of an event argument.
+
+    Queued listeners run after the emitter has moved on, and the trade
+    thread keeps updating a deal's orders, trace and state. A copy taken
+    when the event is emitted lets them see the deal as it was. Other
+    objects, e.g. plans, are passed as they are.
+
+    Args:
+        arg: Event argument
+
+    Returns:
+        Copy of the argument's containers
+    """
+    if isinstance(arg, Record):
+        record = arg.copy()
+        for key, value in arg.items():
+            record[key] = snapshot(value)
+        return record
+    if isinstance(arg, dict):
+        return { key: snapshot(value) for key, value in arg.items() }
+    if isinstance(arg, list):
+        return [ snapshot(value) for value in arg ]
+    return arg
+
+
+class Subscription:
+    """
+    One listener of one event.
+
+    Inline listeners run in the emitting thread. Queued listeners get a
+    bounded queue drained by their own thread and are handed a snapshot of
+    the argument taken when the event was emitted; when the queue is full,
+    'drop_oldest' discards the oldest event, 'drop_newest' the new one and
+    'block' makes the emitter wait up to `block_timeout` seconds before
+    dropping it.
+    """
+
+    def __init__(self, event: str, f: Callable, *, delivery: str = 'inline',
+                 queue_size: int = 1000, policy: str = 'drop_oldest',
+                 block_timeout: float = 1.0, metrics: Optional[Metrics] = None) -> None:
+        """
+        Initialize the Subscription.
+
+        Args:
+            event: Event name
+            f: Listener called as f(sender, arg)
+            delivery: 'inline' or 'queued'
+            queue_size: Most events waiting for a queued listener
+            policy: What to do with events for a full queue, see POLICIES
+            block_timeout: Longest wait of the emitter under 'block'
+            metrics: Registry of listener durations
+        """
+        if delivery not in ('inline', 'queued'):
+            raise ValueError('unknown delivery: {}'.format(delivery))
+        if policy not in POLICIES:
+            raise ValueError('unknown policy: {}'.format(policy))
+        self.event = event
+        self.f = f
+        self.delivery = delivery
+        self.policy = policy
+        func = getattr(f, 'func', f)
+        self.name = '{}/{}'.format(event, getattr(func, '__name__', type(func).__name__))
+        self._block_timeout = block_timeout
+        self._metrics = metrics or default_metrics
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        if delivery == 'queued':
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(target=self._run, name='listener-' + self.name, daemon=True)
+            self._thread.start()
+
+    def depth(self) -> int:
+
+        return self._queue.qsize() if self._queue else 0
+
+    def _call(self, sender: Any, arg: Any) -> Any:
+
+        started = time.perf_counter()
+        try:
+            return self.f(sender, arg)
+        except Exception:
+            # 聞き手の失敗で取引を止めない
+            with self._lock:
+                self.errors += 1
+            if self.delivery == 'queued':
+                traceback.print_exc()
+                return None
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.delivered += 1
+                self.seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+            self._metrics.observe('listener', elapsed, self.name)
+
+    def _run(self) -> None:
+
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._call(*item)
+            finally:
+                self._queue.task_done()
+
+    def _drop(self) -> None:
+
+        with self._lock:
+            self.dropped += 1
+        self._metrics.incr('listener_dropped', self.name)
+
+    def __call__(self, sender: Any, arg: Any) -> Any:
+
+        if self._queue is None:
+            return self._call(sender, arg)
+        item = (sender, snapshot(arg))
+        try:
+            if self.policy == 'block':
+                self._queue.put(item, timeout=self._block_timeout)
+            else:
+                self._queue.put_nowait(item)
+            return None
+        except queue.Full:
+            pass
+        if self.policy == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._drop()
+                self._queue.put_nowait(item)
+                return None
+            except (queue.Empty, queue.Full):
+                pass
+        self._drop()
+        return None
+
+    def join(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until a queued listener has handled every waiting event.
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            True if the queue was drained
+        """
+        if self._queue is None:
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return not self._queue.unfinished_tasks
+
+    def close(self) -> None:
+
+        if self._queue is not None:
+            try:
+                self._queue.put(None, timeout=self._block_timeout)
+            except queue.Full:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+
+        with self._lock:
+            return {
+                'delivery': self.delivery,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'queue_depth': self.depth(),
+                'mean_seconds': self.seconds / self.delivered if self.delivered else 0.0,
+                'max_seconds': self.max_seconds,
+            }
+
+
+class EventBus:
+    """
+    Publish/subscribe bus with any number of listeners per event.
+
+    `dispatchers` maps every event to the callable delivering it: the
+    subscription itself when there is only one, or a fan-out over the
+    subscriptions in the order they were made. Events without listeners
+    map to a no-op.
+    """
+
+    def __init__(self, metrics: Optional[Metrics] = None) -> None:
+
+        self._metrics = metrics
+        self._subscriptions: Dict[str, List[Subscription]] = defaultdict(list)
+        self.dispatchers: Dict[str, Callable] = defaultdict(lambda: _noop)
+
+    def _rebuild(self, event: str) -> None:
+
+        subscriptions = list(self._subscriptions.get(event, []))
+        if not subscriptions:
+            self.dispatchers.pop(event, None)
+        elif len(subscriptions) == 1:
+            self.dispatchers[event] = subscriptions[0]
+        else:
+            def _fanout(sender, arg):
+                result = None
+                for subscription in subscriptions:
+                    value = subscription(sender, arg)
+                    if subscription.delivery == 'inline':
+                        result = value
+                return result
+            self.dispatchers[event] = _fanout
+
+    def subscribe(self, event: str, f: Callable, **options: Any) -> Subscription:
+        """
+        Add a listener to an event.
+
+        Args:
+            event: Event name
+            f: Listener called as f(sender, arg)
+            **options: Subscription options, see Subscription
+
+        Returns:
+            The Subscription
+        """
+        subscription = Subscription(event, f, metrics=self._metrics, **options)
+        self._subscriptions[event].append(subscription)
+        self._rebuild(event)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+
+        subscriptions = self._subscriptions.get(subscription.event, [])
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+            subscription.close()
+            self._rebuild(subscription.event)
+
+    def publish(self, event: str, sender: Any, arg: Any) -> Any:
+        """
+        Deliver an event to its listeners.
+
+        Args:
+            event: Event name
+            sender: Emitting object
+            arg: Event argument
+
+        Returns:
+            Result of the last inline listener
+        """
+        return self.dispatchers[event](sender, arg)
+
+    def subscriptions(self) -> List[Subscription]:
+
+        return [ s for subscriptions in self._subscriptions.values() for s in subscriptions ]
+
+    def queue_depths(self) -> Dict[str, int]:
+        """
+        Get the waiting events of every queued listener, for Metrics.gauge.
+
+        Returns:
+            Queue depth by listener name
+        """
+        return { s.name: s.depth() for s in self.subscriptions() if s.delivery == 'queued' }
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the delivery statistics of every listener.
+
+        Returns:
+            Deliveries, drops, errors, queue depth and durations by listener name
+        """
+        return { s.name: s.stats() for s in self.subscriptions() }
+
+    def join(self, timeout: float = 5.0) -> bool:
+
+        return all([ s.join(timeout) for s in self.subscriptions() ])
+
+    def close(self) -> None:
+
+        for subscription in self.subscriptions():
+            subscription.close()
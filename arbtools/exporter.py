@@ -0,0 +1,126 @@
+import os
+import resource
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Optional
+from arbtools.metrics import Metrics, metrics as default_metrics
+
+PREFIX = 'blacksnake'
+
+
+def _labels(**labels: Any) -> str:
+
+    items = [ '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels.items() if v is not None ]
+    return '{' + ','.join(items) + '}' if items else ''
+
+def process_memory() -> int:
+    """
+    Get the resident memory of this process in bytes.
+
+    Returns:
+        Resident set size, or the peak size where /proc is unavailable
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def render(metrics: Metrics) -> str:
+    """
+    Render metrics in the Prometheus text exposition format.
+
+    Args:
+        metrics: Metrics registry to render
+
+    Returns:
+        Text with one sample per line
+    """
+    lines: List[str] = []
+
+    name = PREFIX + '_stage_seconds'
+    lines.append('# TYPE {} summary'.format(name))
+    for (stage, exchange), histogram in sorted(metrics.items(), key=lambda i: (i[0][0], i[0][1] or '')):
+        for q, value in zip((0.5, 0.95, 0.99), histogram.quantiles()):
+            lines.append('{}{} {}'.format(name, _labels(stage=stage, exchange=exchange, quantile=q), value))
+        labels = _labels(stage=stage, exchange=exchange)
+        lines.append('{}_count{} {}'.format(name, labels, histogram.count))
+        lines.append('{}_sum{} {}'.format(name, labels, histogram.total))
+
+    name = PREFIX + '_events_total'
+    lines.append('# TYPE {} counter'.format(name))
+    for (counter, exchange), value in sorted(metrics.counters().items(), key=lambda i: (i[0][0], i[0][1] or '')):
+        lines.append('{}{} {}'.format(name, _labels(name=counter, exchange=exchange), value))
+
+    for gauge, (value, label) in sorted(metrics.gauges().items()):
+        name = '{}_{}'.format(PREFIX, gauge)
+        lines.append('# TYPE {} gauge'.format(name))
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                labels = dict(zip(label, key)) if isinstance(label, tuple) else { label or 'key': key }
+                lines.append('{}{} {}'.format(name, _labels(**labels), v))
+        else:
+            lines.append('{} {}'.format(name, value))
+
+    name = PREFIX + '_process_resident_memory_bytes'
+    lines.append('# TYPE {} gauge'.format(name))
+    lines.append('{} {}'.format(name, process_memory()))
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """
+    HTTP endpoint serving metrics in the Prometheus text format.
+
+    The server listens on localhost by default and runs on a daemon thread,
+    so scraping never blocks the trade loop.
+    """
+
+    def __init__(self, port: int, *, host: str = '127.0.0.1',
+                 metrics: Optional[Metrics] = None) -> None:
+        """
+        Initialize the MetricsExporter.
+
+        Args:
+            port: Port to listen on, 0 for any free port
+            host: Address to listen on
+            metrics: Metrics registry to serve, defaults to the shared one
+        """
+        registry = metrics or default_metrics
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = render(registry).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+            name='metrics-exporter', daemon=True)
+
+    def address(self):
+
+        return self._server.server_address
+
+    def start(self) -> 'MetricsExporter':
+
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,136 @@
+import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Callable, Optional, Tuple
+from arbtools.metrics import Metrics, metrics as default_metrics
+
+
+class HedgedReads:
+    """
+    Duplicate slow idempotent reads to cut their tail latency.
+
+    A read that has not returned after the venue's observed `quantile` of
+    single-attempt latency is sent a second time, and the first successful
+    answer wins. Every read earns `budget` hedge tokens per venue, up to
+    `burst`, and every hedge spends one, so duplicates stay below `budget`
+    of the traffic to a venue and never break its rate limits. Since about
+    1 - `quantile` of healthy reads already outlast the delay, `budget` has
+    to exceed that share for the real outliers to be hedged. Venues with
+    fewer than `min_samples` observed attempts are not hedged.
+
+    Attempt latencies go to the '<stage>_attempt' histograms of `metrics`;
+    hedges, hedge wins and reads refused for lack of budget are counted as
+    hedged_reads, hedge_wins and hedge_budget_exhausted.
+    """
+
+    def __init__(self, *, stages: Tuple[str, ...] = ('fetch_order_book',),
+                 quantile: float = 0.95, budget: float = 0.1, burst: float = 5.0,
+                 min_samples: int = 50, min_delay: float = 0.005, max_workers: int = 16,
+                 metrics: Optional[Metrics] = None) -> None:
+        """
+        Initialize the HedgedReads.
+
+        Args:
+            stages: Gateway calls that may be hedged
+            quantile: Attempt latency quantile after which a read is hedged
+            budget: Hedge tokens earned per read
+            burst: Most tokens a venue can save up
+            min_samples: Attempts observed before a venue is hedged
+            min_delay: Shortest wait before hedging, in seconds
+            max_workers: Threads running the attempts
+            metrics: Registry of attempt latencies and counters
+        """
+        self._stages = stages
+        self._quantile = quantile
+        self._budget = budget
+        self._burst = burst
+        self._min_samples = min_samples
+        self._min_delay = min_delay
+        self._metrics = metrics or default_metrics
+        self._tokens: Dict[str, float] = defaultdict(lambda: burst)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+
+    def delay(self, stage: str, exchange: str) -> Optional[float]:
+        """
+        Get how long a read waits before it is hedged.
+
+        Args:
+            stage: Gateway call name
+            exchange: Exchange name
+
+        Returns:
+            Seconds, or None if the read is not hedged
+        """
+        if stage not in self._stages:
+            return None
+        histogram = self._metrics.histogram(stage + '_attempt', exchange)
+        if histogram.count < self._min_samples:
+            return None
+        return max(self._min_delay, histogram.quantiles((self._quantile,))[0])
+
+    def _earn(self, exchange: str) -> None:
+
+        with self._lock:
+            self._tokens[exchange] = min(self._burst, self._tokens[exchange] + self._budget)
+
+    def _spend(self, exchange: str) -> bool:
+
+        with self._lock:
+            if self._tokens[exchange] < 1.0:
+                return False
+            self._tokens[exchange] -= 1.0
+            return True
+
+    def _attempt(self, stage: str, exchange: str, f: Callable[[], Any]) -> Any:
+
+        started = time.perf_counter()
+        try:
+            return f()
+        finally:
+            self._metrics.observe(stage + '_attempt', time.perf_counter() - started, exchange)
+
+    def call(self, stage: str, exchange: str, f: Callable[[], Any]) -> Any:
+        """
+        Run a read, hedging it if it is slow.
+
+        Args:
+            stage: Gateway call name, e.g. 'fetch_order_book'
+            exchange: Exchange name
+            f: Read to run
+
+        Returns:
+            Result of the first attempt that succeeds
+        """
+        delay = self.delay(stage, exchange)
+        if delay is None:
+            return self._attempt(stage, exchange, f)
+
+        self._earn(exchange)
+        first = self._executor.submit(self._attempt, stage, exchange, f)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+        if not self._spend(exchange):
+            self._metrics.incr('hedge_budget_exhausted', exchange)
+            return first.result()
+
+        self._metrics.incr('hedged_reads', exchange)
+        second = self._executor.submit(self._attempt, stage, exchange, f)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self._metrics.incr('hedge_wins', exchange)
+                    # 遅い方の応答は捨てる
+                    return future.result()
+        return first.result()
+
+    def shutdown(self) -> None:
+
+        self._executor.shutdown(wait=False)
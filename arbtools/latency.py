@@ -0,0 +1,296 @@
+import time
+import threading
+from typing import Dict, Any, Callable, Iterable, Optional, Tuple
+from arbtools import clock
+
+# ゲートウェイ呼び出しごとの経路の種類
+KINDS = {
+    'fetch_time': 'public',
+    'fetch_order_book': 'public',
+    'fetch_balance': 'private',
+    'fetch_order': 'private',
+    'create_order': 'order',
+    'cancel_order': 'order',
+}
+
+
+class RoundTrip:
+    """
+    Smoothed round-trip time of one kind of request to one venue.
+
+    Follows the retransmission timer of RFC 6298: `srtt` is an exponential
+    average of the samples with weight `alpha`, `rttvar` an exponential
+    average of their deviation from it with weight `beta`, and
+    `timeout(k)` is srtt + k * rttvar.
+    """
+
+    __slots__ = ('srtt', 'rttvar', 'min_rtt', 'last', 'samples', '_alpha', '_beta')
+
+    def __init__(self, *, alpha: float = 0.125, beta: float = 0.25) -> None:
+
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.min_rtt: Optional[float] = None
+        self.last: Optional[float] = None
+        self.samples = 0
+        self._alpha = alpha
+        self._beta = beta
+
+    def observe(self, seconds: float) -> None:
+
+        if self.srtt is None:
+            self.srtt = seconds
+            self.rttvar = seconds / 2.0
+        else:
+            self.rttvar += self._beta * (abs(self.srtt - seconds) - self.rttvar)
+            self.srtt += self._alpha * (seconds - self.srtt)
+        self.min_rtt = seconds if self.min_rtt is None else min(self.min_rtt, seconds)
+        self.last = seconds
+        self.samples += 1
+
+    def timeout(self, k: float = 4.0) -> Optional[float]:
+
+        return None if self.srtt is None else self.srtt + k * self.rttvar
+
+    def stats(self) -> Dict[str, Any]:
+
+        return { 'srtt': self.srtt, 'rttvar': self.rttvar, 'min_rtt': self.min_rtt,
+            'last': self.last, 'samples': self.samples }
+
+
+class ClockOffset:
+    """
+    Smoothed offset of a venue's clock from the local one.
+
+    A sample is taken NTP style: the server time is compared with the
+    middle of the request, so its error is at most half the round trip.
+    Samples are averaged with a weight that shrinks as their round trip
+    grows past the fastest one seen, so a slow answer barely moves the
+    estimate.
+    """
+
+    __slots__ = ('offset', 'error', 'samples', '_alpha', '_best')
+
+    def __init__(self, *, alpha: float = 0.125) -> None:
+
+        self.offset: Optional[float] = None
+        self.error: Optional[float] = None
+        self.samples = 0
+        self._alpha = alpha
+        self._best: Optional[float] = None
+
+    def observe(self, sent: float, server_time: float, received: float) -> None:
+
+        rtt = max(received - sent, 0.0)
+        sample = server_time - (sent + received) / 2.0
+        self._best = rtt if self._best is None else min(self._best, rtt)
+        if self.offset is None:
+            self.offset = sample
+            self.error = rtt / 2.0
+        else:
+            weight = self._alpha * min(1.0, (self._best + 1e-3) / (rtt + 1e-3))
+            self.offset += weight * (sample - self.offset)
+            self.error += weight * (rtt / 2.0 - self.error)
+        self.samples += 1
+
+    def stats(self) -> Dict[str, Any]:
+
+        return { 'offset': self.offset, 'error': self.error, 'samples': self.samples }
+
+
+class LatencyEstimator:
+    """
+    Per-exchange round-trip times and clock offsets.
+
+    Round trips are kept per exchange and per kind of request, see KINDS:
+    'public' market data, 'private' account reads and 'order' placement or
+    cancel. APIFacade feeds every successful gateway call through
+    `observe`; once started, a background thread also asks every venue
+    that has fetchTime for its clock every `interval` seconds, which gives
+    the clock offsets and keeps the public round trips fresh while the bot
+    is idle.
+    """
+
+    def __init__(self, *, interval: float = 10.0, alpha: float = 0.125, beta: float = 0.25) -> None:
+        """
+        Initialize the LatencyEstimator.
+
+        Args:
+            interval: Seconds between two clock probes
+            alpha: Weight of a new round trip or clock sample
+            beta: Weight of a new round-trip deviation
+        """
+        self._interval = interval
+        self._alpha = alpha
+        self._beta = beta
+        self._rtts: Dict[Tuple[str, str], RoundTrip] = {}
+        self._offsets: Dict[str, ClockOffset] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def observe(self, exchange: str, stage: str, seconds: float) -> None:
+        """
+        Record the round trip of a gateway call.
+
+        Args:
+            exchange: Exchange name
+            stage: Gateway call name, e.g. 'create_order'
+            seconds: Duration of the call
+        """
+        kind = KINDS.get(stage)
+        if kind is None:
+            return
+        with self._lock:
+            rtt = self._rtts.get((exchange, kind))
+            if rtt is None:
+                rtt = self._rtts[(exchange, kind)] = RoundTrip(alpha=self._alpha, beta=self._beta)
+            rtt.observe(seconds)
+
+    def observe_time(self, exchange: str, sent: float, server_time: float, received: float) -> None:
+        """
+        Record a clock sample.
+
+        Args:
+            exchange: Exchange name
+            sent: Local time the request was sent
+            server_time: Time answered by the venue, in seconds
+            received: Local time the answer arrived
+        """
+        with self._lock:
+            offset = self._offsets.get(exchange)
+            if offset is None:
+                offset = self._offsets[exchange] = ClockOffset(alpha=self._alpha)
+            offset.observe(sent, server_time, received)
+
+    def rtt(self, exchange: str, kind: str) -> Optional[float]:
+        """
+        Get the smoothed round trip of a kind of request.
+
+        Args:
+            exchange: Exchange name
+            kind: 'public', 'private' or 'order'
+
+        Returns:
+            Seconds, or None before the first sample
+        """
+        rtt = self._rtts.get((exchange, kind))
+        return rtt.srtt if rtt else None
+
+    def timeout(self, exchanges: Iterable[str], kind: str = 'order', k: float = 4.0) -> Optional[float]:
+        """
+        Get how long an answer from several venues can take.
+
+        Args:
+            exchanges: Exchange names
+            kind: 'public', 'private' or 'order'
+            k: Round-trip deviations added to the smoothed round trip
+
+        Returns:
+            Largest srtt + k * rttvar of the venues, or None if none has
+            been measured
+        """
+        values = [ rtt.timeout(k) for rtt in (self._rtts.get((name, kind)) for name in exchanges) if rtt ]
+        return max(values) if values else None
+
+    def offset(self, exchange: str) -> Optional[float]:
+        """
+        Get how far a venue's clock is ahead of the local one.
+
+        Args:
+            exchange: Exchange name
+
+        Returns:
+            Seconds, or None before the first clock sample
+        """
+        offset = self._offsets.get(exchange)
+        return offset.offset if offset else None
+
+    def local_time(self, exchange: str, server_time: float) -> float:
+        """
+        Convert a venue's timestamp to the local clock.
+
+        Args:
+            exchange: Exchange name
+            server_time: Timestamp of the venue, in seconds
+
+        Returns:
+            Local time, the timestamp itself if the offset is unknown
+        """
+        return server_time - (self.offset(exchange) or 0.0)
+
+    def probe(self, apis: Iterable[Tuple[str, Any]]) -> Dict[str, Optional[str]]:
+        """
+        Take a clock sample of every venue that has fetchTime.
+
+        Args:
+            apis: (exchange name, exchange API) pairs
+
+        Returns:
+            Error message of a failed probe, or None, by exchange name
+        """
+        errors: Dict[str, Optional[str]] = {}
+        for name, api in apis:
+            if not getattr(api, 'has', {}).get('fetchTime'):
+                continue
+            try:
+                sent = clock.time()
+                started = time.perf_counter()
+                server_time = api.fetch_time()
+                elapsed = time.perf_counter() - started
+            except Exception as e:
+                errors[name] = str(e)
+                continue
+            # ccxtのfetch_timeはミリ秒で返る
+            self.observe_time(name, sent, server_time / 1000.0, sent + elapsed)
+            self.observe(name, 'fetch_time', elapsed)
+            errors[name] = None
+        return errors
+
+    def _run(self, apis: Callable[[], Iterable[Tuple[str, Any]]]) -> None:
+
+        while not self._stopped.wait(self._interval):
+            self.probe(apis())
+
+    def start(self, apis: Callable[[], Iterable[Tuple[str, Any]]]) -> 'LatencyEstimator':
+
+        if self._thread is None:
+            self.probe(apis())
+            self._thread = threading.Thread(target=self._run, args=(apis,),
+                name='latency', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+
+        self._stopped.set()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the estimates of every exchange.
+
+        Returns:
+            Round-trip statistics by kind and clock offset by exchange name
+        """
+        with self._lock:
+            result: Dict[str, Dict[str, Any]] = {}
+            for (name, kind), rtt in sorted(self._rtts.items()):
+                result.setdefault(name, {})[kind] = rtt.stats()
+            for name, offset in sorted(self._offsets.items()):
+                result.setdefault(name, {})['clock'] = offset.stats()
+            return result
+
+    def gauge(self, kind: str) -> Dict[str, float]:
+        """
+        Get one estimate by exchange name, for Metrics.gauge.
+
+        Args:
+            kind: 'public', 'private', 'order' for the smoothed round trip,
+                or 'offset' for the clock offset
+
+        Returns:
+            Values by exchange name
+        """
+        if kind == 'offset':
+            return { name: o.offset for name, o in self._offsets.items() if o.offset is not None }
+        return { name: rtt.srtt for (name, k), rtt in self._rtts.items() if k == kind and rtt.srtt is not None }
@@ -0,0 +1,112 @@
+from typing import Any, Optional, Tuple
+from arbtools.metrics import span
+
+
+def fetch_market(provider: Any, *, price_unit: float = 100, recorder: Optional[Any] = None,
+                 book: Optional[Any] = None, spreads: Optional[Any] = None) -> Tuple[Any, Any]:
+    """
+    Fetch the order books and balances of every exchange in one fan-out,
+    round the books and get their quotes.
+
+    Args:
+        provider: Provider of order books and balances
+        price_unit: Price unit passed to OrderBooks.round
+        recorder: Recorder receiving the rounded books
+        book: ConsolidatedBook updated with the rounded books
+        spreads: SpreadStats sampling the quotes
+
+    Returns:
+        Tuple of the quotes and balances of this cycle
+    """
+    with span('market'):
+        orderbooks, balances = provider.market()
+    with span('round'):
+        orderbooks = orderbooks.round(price_unit)
+    if recorder:
+        recorder.record(orderbooks)
+    if book is not None:
+        with span('consolidate'):
+            book.update_books(orderbooks)
+    with span('quotes'):
+        quotes = orderbooks.quotes()
+    if spreads is not None:
+        with span('spreads'):
+            spreads.update(quotes)
+    return quotes, balances
+
+
+def run_broker(broker: Any, quotes: Any, *, balances: Optional[Any] = None,
+               cycles: Optional[Any] = None, router: Optional[Any] = None,
+               journal: Optional[str] = None) -> Any:
+    """
+    Plan, request and process the deals of one broker.
+
+    Args:
+        broker: Broker planning and executing deals
+        quotes: Quotes of this cycle
+        balances: Balances to plan with, fetched by the broker if None
+        cycles: CycleFinder proposing multi-leg deals, already updated
+            with the books of this cycle
+        router: SmartRouter splitting the trade volume over several
+            venues; its deal replaces the pair deal when it has more
+            than two legs
+        journal: File the requests are saved to after processing
+
+    Returns:
+        The plan of this cycle
+    """
+    with span('planning'):
+        plan = broker.planning(quotes, balances=balances)
+
+    deal = plan.deal()
+    if router and balances is not None:
+        with span('route'):
+            routed = router.route(broker.trade_volume(), balances)
+        # 二つの取引所で済むなら、反対売買まで面倒を見るペアの取引を使う
+        if routed and len(routed['legs']) > 2:
+            deal = routed
+    with span('request'):
+        broker.request(deal)
+    if cycles:
+        with span('cycles'):
+            funds = balances if balances is not None else getattr(broker.snapshot(), 'balances', None)
+            for deal in cycles.deals(broker.trade_volume(), balances=funds):
+                if broker.request(deal) is broker:
+                    cycles.requested(deal)
+    with span('process_requests'):
+        broker.process_requests()
+    if journal:
+        with span('save_to'):
+            broker.save_to(journal)
+
+    return plan
+
+
+def run_cycle(provider: Any, broker: Any, *, price_unit: float = 100,
+              recorder: Optional[Any] = None, cycles: Optional[Any] = None,
+              router: Optional[Any] = None, spreads: Optional[Any] = None,
+              journal: Optional[str] = None) -> Any:
+    """
+    Run one cycle of the trade loop: fetch, plan, request and process.
+
+    Args:
+        provider: Provider of order books
+        broker: Broker planning and executing deals
+        price_unit: Price unit passed to OrderBooks.round
+        recorder: Recorder receiving the rounded books
+        cycles: CycleFinder proposing multi-leg deals
+        router: SmartRouter splitting deals over several venues
+        spreads: SpreadStats sampling the quotes of every cycle
+        journal: File the requests are saved to after processing
+
+    Returns:
+        The plan of this cycle
+    """
+    with span('cycle'):
+        quotes, balances = fetch_market(provider, price_unit=price_unit, recorder=recorder,
+            book=router.book() if router else None, spreads=spreads)
+        if cycles:
+            with span('symbol_books'):
+                cycles.refresh()
+        return run_broker(broker, quotes, balances=balances, cycles=cycles, router=router,
+            journal=journal)
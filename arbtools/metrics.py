@@ -0,0 +1,242 @@
+import time
+import threading
+from math import frexp
+from collections import defaultdict
+from typing import Dict, List, Any, Callable, Optional, Tuple, Union
+
+# 1バケットの相対誤差は 1/SUB_BUCKETS 以下
+SUB_BUCKETS = 8
+BUCKETS = 64 * SUB_BUCKETS
+
+
+def _bucket(micros: int) -> int:
+
+    if micros < 1:
+        return 0
+    mantissa, exponent = frexp(micros)
+    return min(BUCKETS - 1, exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS))
+
+def _bucket_value(index: int) -> float:
+
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    if exponent == 0:
+        return 0.0
+    low = 2.0 ** (exponent - 1) * (1.0 + sub / SUB_BUCKETS)
+    high = 2.0 ** (exponent - 1) * (1.0 + (sub + 1) / SUB_BUCKETS)
+    return (low + high) / 2.0
+
+
+class Histogram:
+    """
+    Rolling log-linear histogram of durations.
+
+    Observations go to the current window; when a window ends it replaces
+    the previous one, so quantiles cover between one and two windows of the
+    most recent data. Recording is a couple of arithmetic operations and a
+    list increment under a lock, cheap enough to leave on in production.
+    """
+
+    def __init__(self, window: float = 60.0) -> None:
+
+        self._window = window
+        # ゲートウェイや聞き手のスレッドからも記録される
+        self._lock = threading.Lock()
+        self._current = [0] * BUCKETS
+        self._previous = [0] * BUCKETS
+        self._rotated_at = time.monotonic()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _rotate(self, now: float) -> None:
+
+        if now - self._rotated_at >= 2 * self._window:
+            self._previous = [0] * BUCKETS
+        else:
+            self._previous = self._current
+        self._current = [0] * BUCKETS
+        self._rotated_at = now
+
+    def observe(self, seconds: float) -> None:
+
+        bucket = _bucket(int(seconds * 1e6))
+        now = time.monotonic()
+        with self._lock:
+            if now - self._rotated_at >= self._window:
+                self._rotate(now)
+            self._current[bucket] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantiles(self, qs: Tuple[float, ...] = (0.5, 0.95, 0.99)) -> List[float]:
+        """
+        Estimate quantiles over the recent windows.
+
+        Args:
+            qs: Quantiles between 0 and 1
+
+        Returns:
+            Durations in seconds, one per quantile
+        """
+        with self._lock:
+            counts = [ a + b for a, b in zip(self._current, self._previous) ]
+        n = sum(counts)
+        if not n:
+            return [ 0.0 for _ in qs ]
+        result = []
+        for q in qs:
+            rank = q * n
+            seen = 0
+            for index, count in enumerate(counts):
+                seen += count
+                if count and seen >= rank:
+                    result.append(_bucket_value(index) / 1e6)
+                    break
+        return result
+
+
+class _Span:
+
+    __slots__ = ('_histogram', '_started')
+
+    def __init__(self, histogram: Histogram) -> None:
+
+        self._histogram = histogram
+
+    def __enter__(self) -> '_Span':
+
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+
+        self._histogram.observe(time.perf_counter() - self._started)
+        return False
+
+
+class Metrics:
+    """
+    Registry of duration histograms keyed by stage and exchange name,
+    plus error counters and gauges read on demand.
+    """
+
+    def __init__(self, window: float = 60.0) -> None:
+
+        self._window = window
+        self._histograms: Dict[Tuple[str, Optional[str]], Histogram] = {}
+        self._counters: Dict[Tuple[str, Optional[str]], int] = defaultdict(int)
+        self._gauges: Dict[str, Tuple[Callable, Any]] = {}
+        # 記録は複数のスレッドから来るので、登録と加算と写しを守る
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str, exchange: Optional[str] = None) -> Histogram:
+
+        key = (stage, exchange)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self._window))
+        return histogram
+
+    def span(self, stage: str, exchange: Optional[str] = None) -> _Span:
+        """
+        Time a block of code.
+
+        Args:
+            stage: Stage name, e.g. 'market' or 'fetch_order_book'
+            exchange: Exchange name for per-exchange calls
+
+        Returns:
+            Context manager recording the block's duration
+        """
+        return _Span(self.histogram(stage, exchange))
+
+    def observe(self, stage: str, seconds: float, exchange: Optional[str] = None) -> None:
+
+        self.histogram(stage, exchange).observe(seconds)
+
+    def incr(self, name: str, exchange: Optional[str] = None, value: int = 1) -> None:
+        """
+        Increase a counter, e.g. the errors of one gateway call.
+
+        Args:
+            name: Counter name
+            exchange: Exchange name for per-exchange counters
+            value: Amount to add
+        """
+        with self._lock:
+            self._counters[(name, exchange)] += value
+
+    def counters(self) -> Dict[Tuple[str, Optional[str]], int]:
+
+        with self._lock:
+            return dict(self._counters)
+
+    def gauge(self, name: str, f: Callable, label: Union[str, Tuple[str, ...]] = '') -> None:
+        """
+        Register a gauge evaluated when metrics are read.
+
+        Args:
+            name: Gauge name
+            f: Callable returning a number, or a dictionary of numbers by label value
+            label: Label name for dictionary values, 'key' when empty, or a
+                tuple of label names for dictionaries keyed by tuples
+        """
+        with self._lock:
+            self._gauges[name] = (f, label)
+
+    def gauges(self) -> Dict[str, Tuple[Any, Any]]:
+
+        with self._lock:
+            gauges = list(self._gauges.items())
+        result = {}
+        for name, (f, label) in gauges:
+            try:
+                result[name] = (f(), label)
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+        return result
+
+    def items(self) -> List[Tuple[Tuple[str, Optional[str]], Histogram]]:
+
+        with self._lock:
+            return list(self._histograms.items())
+
+    def summary(self) -> Dict[Tuple[str, Optional[str]], Dict[str, float]]:
+        """
+        Summarize every histogram.
+
+        Returns:
+            Count, mean, p50, p95, p99 and max in seconds by (stage, exchange)
+        """
+        result = {}
+        for key, histogram in self.items():
+            p50, p95, p99 = histogram.quantiles()
+            result[key] = {
+                'count': histogram.count,
+                'mean': histogram.total / histogram.count if histogram.count else 0.0,
+                'p50': p50,
+                'p95': p95,
+                'p99': p99,
+                'max': histogram.max,
+            }
+        return result
+
+    def format(self) -> str:
+
+        lines = []
+        for (stage, exchange), s in sorted(self.summary().items(), key=lambda i: (i[0][0], i[0][1] or '')):
+            name = stage if exchange is None else '{}[{}]'.format(stage, exchange)
+            lines.append('{:36s} n={:<8d} p50={:8.1f}ms p95={:8.1f}ms p99={:8.1f}ms max={:8.1f}ms'.format(
+                name, s['count'], s['p50'] * 1e3, s['p95'] * 1e3, s['p99'] * 1e3, s['max'] * 1e3))
+        return '\n'.join(lines)
+
+
+# プロセス全体で共有する既定のレジストリ
+metrics = Metrics()
+
+def span(stage: str, exchange: Optional[str] = None) -> _Span:
+
+    return metrics.span(stage, exchange)
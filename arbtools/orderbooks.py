@@ -1,5 +1,6 @@
 import copy
 from math import ceil, floor
+from arbtools import clock
 from functools import partial
 from operator import itemgetter
 from itertools import groupby
@@ -8,9 +9,11 @@ from arbtools.quotes import Quotes
 
 class OrderBooks:
 
-    def __init__(self, api, data=None):
+    def __init__(self, api, data=None, price_unit=None):
 
         self._api = api
+        # 丸め済みの板なら丸めた単位を持つ
+        self._price_unit = price_unit
 
         items = (data if data else api.fetch_orderbooks()).items()
         error_key = 'fetch_orderbooks_error'
@@ -19,6 +22,9 @@ class OrderBooks:
 
     def round(self, price_unit=100):
 
+        if self._price_unit == price_unit:
+            return self
+
         def _round_price(prices, round_func, price_unit):
 
             def stepped(price_steps, values):
@@ -37,9 +43,14 @@ class OrderBooks:
         for key, data in self._data.items():
             asks = _round_price(data['asks'], ceil, price_unit)
             bids = _round_price(data['bids'], floor, price_unit)
-            result[key] = { 'asks': asks[:100], 'bids': bids[~100:] }
-
-        return OrderBooks(self._api, result)
+            result[key] = {
+                'asks': asks[:100],
+                'bids': bids[~100:],
+                'received_at': data.get('received_at'),
+                'rounded_at': clock.time(),
+            }
+
+        return OrderBooks(self._api, result, price_unit)
 
     def quotes(self):
 
@@ -0,0 +1,117 @@
+from typing import Dict, Any, Optional, Tuple
+from arbtools import clock
+
+# 約定確認を行う状態
+CONFIRM_STATES = ('confirm_open', 'confirm_close', 'confirm_legs', 'confirm_recover')
+
+
+def fill_state(data: Dict[str, Any]) -> Tuple[Tuple[str, Any, Any], ...]:
+    """
+    Summarize the orders of a deal to tell whether a poll saw a change.
+
+    Args:
+        data: Deal data
+
+    Returns:
+        (key, status, filled) of every order, sorted by key
+    """
+    orders = data.get('orders', {})
+    return tuple(sorted(
+        (key, order.get('status'), order.get('filled')) for key, order in orders.items()))
+
+
+class PollSchedule:
+    """
+    Next confirmation poll time of every request waiting for fills.
+
+    A request is polled `interval` seconds after its orders are placed and
+    whenever a poll sees a change. Polls that see nothing new back off by
+    `backoff` up to `max_interval`, so resting orders stop spending the
+    private API budget. `wake` makes a request due at once, e.g. when a fill
+    is pushed by the exchange. Requests are keyed by the identity of their
+    data, and the schedule holds the data itself so that an id reused by a
+    new request never inherits a stale poll time.
+    """
+
+    def __init__(self, *, interval: float = 0.2, max_interval: float = 30.0,
+                 backoff: float = 2.0) -> None:
+        """
+        Initialize the PollSchedule.
+
+        Args:
+            interval: Seconds from placement or a change to the next poll
+            max_interval: Longest wait between two polls
+            backoff: Factor the wait grows by after a poll without change
+        """
+        self._interval = interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        # id(data) -> (data, 次回の確認時刻, 待ち時間)
+        self._polls: Dict[int, Tuple[Any, float, float]] = {}
+
+    def __len__(self) -> int:
+
+        return len(self._polls)
+
+    def due(self, data: Dict[str, Any], now: Optional[float] = None) -> bool:
+        """
+        Tell whether a request should be polled.
+
+        Args:
+            data: Deal data
+            now: Current time, defaults to the clock
+
+        Returns:
+            True if the poll is due or the request is not scheduled
+        """
+        poll = self._polls.get(id(data))
+        if poll is None or poll[0] is not data:
+            return True
+        now = clock.time() if now is None else now
+        return now >= poll[1]
+
+    def placed(self, data: Dict[str, Any]) -> None:
+        """
+        Start fast polling for a request whose orders were just placed.
+
+        Args:
+            data: Deal data
+        """
+        self._polls[id(data)] = (data, clock.time() + self._interval, self._interval)
+
+    def polled(self, data: Dict[str, Any], changed: bool, deadline: Optional[float] = None) -> None:
+        """
+        Schedule the next poll after one has been made.
+
+        Args:
+            data: Deal data
+            changed: Whether the poll saw a new status or fill
+            deadline: Time the next poll must not be later than, such as
+                the hedge deadline of an unmatched fill
+        """
+        poll = self._polls.get(id(data))
+        wait = poll[2] if poll is not None and poll[0] is data else self._interval
+        wait = self._interval if changed else min(wait * self._backoff, self._max_interval)
+        due = clock.time() + wait
+        # 待ち時間は伸ばしても、期限を過ぎてから確認することはしない
+        self._polls[id(data)] = (data, due if deadline is None else min(due, deadline), wait)
+
+    def wake(self, data: Dict[str, Any]) -> None:
+        """
+        Make a request due at once, keeping its fast polling.
+
+        Args:
+            data: Deal data
+        """
+        self._polls[id(data)] = (data, clock.time(), self._interval)
+
+    def forget(self, data: Dict[str, Any]) -> None:
+        """
+        Drop a request that left its confirm state.
+
+        Args:
+            data: Deal data
+        """
+        poll = self._polls.get(id(data))
+        if poll is not None and poll[0] is data:
+            del self._polls[id(data)]
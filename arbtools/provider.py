@@ -1,19 +1,98 @@
 from functools import reduce
 from arbtools.orderbooks import OrderBooks
+from arbtools.balances import Balances
 from arbtools.broker import Broker
 from arbtools.apifacade import APIFacade
+from arbtools.cycles import CycleFinder
+from arbtools.hedging import HedgedReads
+from arbtools.latency import LatencyEstimator
+from arbtools.routing import ConsolidatedBook, SmartRouter
+from arbtools.sharedbooks import SharedBooks
+from arbtools.spreads import SpreadStats
+from arbtools.strategies import StrategyRunner
 
 class Provider:
 
-    def __init__(self, exchanges, gw_name='ccxt'):
+    def __init__(self, exchanges, gw_name='ccxt', *, connections=None):
 
-        self._api = APIFacade(exchanges, gw_name)
+        self._exchanges = exchanges
+        self._gw_name = gw_name
+        self._api = APIFacade(exchanges, gw_name, connections=connections)
+        self._shared = None
 
     def orderbooks(self):
 
+        if self._shared:
+            return OrderBooks(self._api, self._shared.read(), self._shared.price_unit)
         return OrderBooks(self._api)
 
-    def broker(self, trade):
+    def share_books(self, **options):
 
-        return Broker(self._api, trade)
+        # 板の取得と丸めを取引所ごとのプロセスに任せる
+        self._shared = SharedBooks(self._exchanges, self._gw_name, **options).start()
+        return self._shared
 
+    def balances(self):
+
+        return Balances(self._api)
+
+    def market(self):
+
+        # 板と残高を一度に並行して取りに行く
+        if self._shared:
+            _, balances = self._api.fetch_market(orderbooks=False)
+            orderbooks = OrderBooks(self._api, self._shared.read(), self._shared.price_unit)
+        else:
+            books, balances = self._api.fetch_market()
+            orderbooks = OrderBooks(self._api, books)
+        return orderbooks, Balances(self._api, balances)
+
+    def symbol_orderbooks(self, symbols):
+
+        return self._api.fetch_symbol_orderbooks(symbols)
+
+    def broker(self, trade, *, shadow=False):
+
+        return Broker(self._api, trade, shadow=shadow)
+
+    def strategies(self, **options):
+
+        # 一度の取得で複数の戦略を回す
+        return StrategyRunner(self, **options)
+
+    def cycle_finder(self, symbols, **options):
+
+        # 閉路で使う通貨の残高も読んでおく
+        self._api.add_currencies(symbols)
+        return CycleFinder(self._api, symbols, **options)
+
+    def _fees(self):
+
+        return { name: getattr(api, 'trading_fees', None) or 0.0 for name, api in self._api.items() }
+
+    def router(self, **options):
+
+        # 全取引所の板を一つにまとめ、複数の取引所に分けて発注する
+        return SmartRouter(ConsolidatedBook(self._fees()), **options)
+
+    def spread_stats(self, **options):
+
+        # 取引所の組ごとの利ざやの統計から、売買の水準を決める
+        return SpreadStats(self._fees(), **options)
+
+    def hedge_reads(self, **options):
+
+        hedging = HedgedReads(**options)
+        self._api.set_hedging(hedging)
+        return hedging
+
+    def measure_latency(self, **options):
+
+        # 往復時間と時計のずれを取引所ごとに測り続ける
+        latency = LatencyEstimator(**options)
+        self._api.set_latency(latency)
+        return latency.start(self._api.items)
+
+    def warm_connections(self, concurrency=2):
+
+        return self._api.warm_connections(concurrency)
@@ -1,5 +1,6 @@
 from functools import reduce
 from arbtools.balances import Balances
+from arbtools.records import Quote
 from arbtools.tradeplan import TradePlan
 
 
@@ -10,18 +11,30 @@ class Quotes:
         self._api = api
         self._data = {}
         self._errors = {}
+        self._trace = {}
 
         if hasattr(obj, '_errors') and isinstance(obj._errors, dict):
             self._errors = obj._errors
 
         if hasattr(obj, '_data') and isinstance(obj._data, dict):
+            received = {}
+            rounded = []
             for key, data in obj._data.items():
-                ask = data['asks'][0]
-                bid = data['bids'][~0]
+                ask = Quote(*data['asks'][0])
+                bid = Quote(*data['bids'][~0])
                 self._data[key] = { 'ask': ask, 'bid': bid }
+                if data.get('received_at'):
+                    received[key] = data['received_at']
+                if data.get('rounded_at'):
+                    rounded.append(data['rounded_at'])
+            self._trace = { 'received': received, 'rounded': max(rounded, default=None) }
         else:
             self._data = obj
 
+    def trace(self):
+
+        return self._trace
+
     def has_error(self):
 
         return len(self._errors) > 0
@@ -34,6 +47,10 @@ class Quotes:
 
         return self._data.items()
 
+    def get(self, name, default=None):
+
+        return self._data.get(name, default)
+
     def __getitem__(self, name):
 
         return self._data[name]
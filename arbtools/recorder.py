@@ -0,0 +1,390 @@
+import os
+import mmap
+import time
+import queue
+import struct
+import threading
+from bisect import bisect_right
+from heapq import merge
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+
+# チャンクファイル: ヘッダ + 可変長整数で符号化したレコードの列
+# レコード: 時刻差分, 板の段数, 価格(差分) の列, 数量の列
+MAGIC = b'BSR1'
+CHUNK_HEADER = struct.Struct('<4sddq')   # magic, tick, volume_unit, first timestamp
+INDEX_ENTRY = struct.Struct('<qIQ')      # first timestamp, chunk number, size
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+def _unzigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+def _put_varint(buf: bytearray, n: int) -> None:
+    while n > 0x7f:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+def _get_varint(data: Any, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+class _Codec:
+    """
+    Delta codec for the levels of one exchange within one chunk.
+
+    The first level of a side is stored relative to the first level of the
+    previous record, the following levels relative to the level before them.
+    Timestamps are stored relative to the previous record.
+    """
+
+    def __init__(self, tick: float, volume_unit: float, timestamp: int) -> None:
+
+        self._tick = tick
+        self._volume_unit = volume_unit
+        self._last_time = timestamp
+        self._last_first = {'asks': 0, 'bids': 0}
+
+    def encode(self, buf: bytearray, timestamp: int, book: Dict[str, Any]) -> None:
+
+        _put_varint(buf, _zigzag(timestamp - self._last_time))
+        self._last_time = timestamp
+        for side in ('asks', 'bids'):
+            levels = book[side]
+            _put_varint(buf, len(levels))
+            last = self._last_first[side]
+            for i, (price, _) in enumerate(levels):
+                ticks = int(round(price / self._tick))
+                _put_varint(buf, _zigzag(ticks - last))
+                if i == 0:
+                    self._last_first[side] = ticks
+                last = ticks
+            for _, volume in levels:
+                _put_varint(buf, int(round(volume / self._volume_unit)))
+
+    def decode(self, data: Any, pos: int) -> Tuple[int, Dict[str, Any], int]:
+
+        delta, pos = _get_varint(data, pos)
+        self._last_time += _unzigzag(delta)
+        book = {}
+        for side in ('asks', 'bids'):
+            n, pos = _get_varint(data, pos)
+            last = self._last_first[side]
+            prices = []
+            for i in range(n):
+                delta, pos = _get_varint(data, pos)
+                last += _unzigzag(delta)
+                if i == 0:
+                    self._last_first[side] = last
+                prices.append(last * self._tick)
+            levels = []
+            for price in prices:
+                volume, pos = _get_varint(data, pos)
+                levels.append((price, volume * self._volume_unit))
+            book[side] = levels
+        return self._last_time, book, pos
+
+
+class _ExchangeWriter:
+
+    def __init__(self, root: str, tick: float, volume_unit: float, chunk_records: int) -> None:
+
+        self._root = root
+        self._tick = tick
+        self._volume_unit = volume_unit
+        self._chunk_records = chunk_records
+        os.makedirs(root, exist_ok=True)
+        self._index = open(os.path.join(root, 'index.bin'), 'ab')
+        # 書きかけの索引項目は捨てる
+        self._chunk_no = self._index.tell() // INDEX_ENTRY.size
+        self._index.truncate(self._chunk_no * INDEX_ENTRY.size)
+        self._file = None
+        self._codec = None
+        self._records = 0
+        self._recover()
+
+    def _path(self, chunk_no: int) -> str:
+
+        return os.path.join(self._root, '{:08d}.chunk'.format(chunk_no))
+
+    def _recover(self) -> None:
+
+        # 前回閉じずに終わったチャンクは、読めるレコードまでを索引に載せる
+        path = self._path(self._chunk_no)
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < CHUNK_HEADER.size:
+            return
+        magic, tick, volume_unit, timestamp = CHUNK_HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            return
+        codec = _Codec(tick, volume_unit, timestamp)
+        pos = size = CHUNK_HEADER.size
+        try:
+            while pos < len(data):
+                _, _, pos = codec.decode(data, pos)
+                size = pos
+        except IndexError:
+            # 最後のレコードが途中で切れている
+            pass
+        if size == CHUNK_HEADER.size:
+            return
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+        self._index.write(INDEX_ENTRY.pack(timestamp, self._chunk_no, size))
+        self._index.flush()
+        self._chunk_no += 1
+
+    def _open_chunk(self, timestamp: int) -> None:
+
+        self.close_chunk()
+        # 残っているのはレコードの無いチャンクだけなので上書きする
+        self._file = open(self._path(self._chunk_no), 'wb')
+        self._file.write(CHUNK_HEADER.pack(MAGIC, self._tick, self._volume_unit, timestamp))
+        self._codec = _Codec(self._tick, self._volume_unit, timestamp)
+        self._chunk_start = timestamp
+        self._records = 0
+
+    def close_chunk(self) -> None:
+
+        if self._file is None:
+            return
+        size = self._file.tell()
+        self._file.close()
+        self._file = None
+        # 書き終えたチャンクだけを索引に載せる
+        self._index.write(INDEX_ENTRY.pack(self._chunk_start, self._chunk_no, size))
+        self._index.flush()
+        self._chunk_no += 1
+
+    def write(self, timestamp: int, book: Dict[str, Any]) -> None:
+
+        if self._file is None or self._records >= self._chunk_records:
+            self._open_chunk(timestamp)
+        buf = bytearray()
+        self._codec.encode(buf, timestamp, book)
+        self._file.write(buf)
+        self._records += 1
+
+    def flush(self) -> None:
+
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+
+        self.close_chunk()
+        self._index.close()
+
+
+class Recorder:
+    """
+    Append-only recorder of the order books seen by the trade loop.
+
+    `record` only queues a reference to the books; encoding and file I/O run
+    on a background thread. Every exchange gets its own directory of chunk
+    files plus an index of the first timestamp of every finished chunk. A
+    chunk left unindexed by a crash is indexed up to its last complete
+    record when the recorder is opened again.
+    """
+
+    def __init__(self, root: str, *, tick: float = 1.0, volume_unit: float = 1e-8,
+                 depth: int = 20, chunk_records: int = 3600, maxsize: int = 1024) -> None:
+        """
+        Initialize the Recorder and start the writer thread.
+
+        Args:
+            root: Directory to write recordings to
+            tick: Price resolution of the recorded levels
+            volume_unit: Volume resolution of the recorded levels
+            depth: Number of levels recorded per side
+            chunk_records: Number of records per chunk file
+            maxsize: Maximum number of queued cycles before new ones are dropped
+        """
+        self._root = root
+        self._tick = tick
+        self._volume_unit = volume_unit
+        self._depth = depth
+        self._chunk_records = chunk_records
+        self._writers: Dict[str, _ExchangeWriter] = {}
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+        self._thread.start()
+
+    def dropped(self) -> int:
+
+        return self._dropped
+
+    def record(self, orderbooks: Any, timestamp: Optional[float] = None) -> Any:
+        """
+        Queue the order books of one cycle for writing.
+
+        Args:
+            orderbooks: OrderBooks instance or dictionary of books by exchange name
+            timestamp: Receive time in seconds, defaults to now
+
+        Returns:
+            The given order books, so the call can be chained
+        """
+        data = getattr(orderbooks, '_data', orderbooks)
+        timestamp = time.time() if timestamp is None else timestamp
+        try:
+            self._queue.put_nowait((int(timestamp * 1000), data))
+        except queue.Full:
+            self._dropped += 1
+        return orderbooks
+
+    def _writer(self, name: str) -> _ExchangeWriter:
+
+        if name not in self._writers:
+            root = os.path.join(self._root, name)
+            self._writers[name] = _ExchangeWriter(
+                root, self._tick, self._volume_unit, self._chunk_records)
+        return self._writers[name]
+
+    def _run(self) -> None:
+
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                timestamp, data = item
+                for name, book in data.items():
+                    book = {
+                        'asks': book['asks'][:self._depth],
+                        'bids': book['bids'][-self._depth:][::-1],
+                    }
+                    self._writer(name).write(timestamp, book)
+                if self._queue.empty():
+                    for writer in self._writers.values():
+                        writer.flush()
+            except Exception as e:
+                print(f"Error recording orderbooks: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> 'Recorder':
+        """
+        Wait until every queued cycle has been written.
+
+        Returns:
+            Self for method chaining
+        """
+        self._queue.join()
+        return self
+
+    def close(self) -> None:
+        """
+        Write the remaining cycles and close all files.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        for writer in self._writers.values():
+            writer.close()
+
+
+class RecordReader:
+    """
+    Reader of recordings written by Recorder.
+
+    Chunk files are memory-mapped, so several processes reading the same
+    recording share its pages instead of copying it.
+    """
+
+    def __init__(self, root: str) -> None:
+        """
+        Initialize the RecordReader.
+
+        Args:
+            root: Directory the recordings were written to
+        """
+        self._root = root
+        self._index: Dict[str, List[Tuple[int, int, int]]] = {}
+        for name in sorted(os.listdir(root)):
+            path = os.path.join(root, name, 'index.bin')
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            self._index[name] = list(INDEX_ENTRY.iter_unpack(data))
+
+    def names(self) -> List[str]:
+
+        return list(self._index.keys())
+
+    def _chunk(self, name: str, chunk_no: int, size: int) -> mmap.mmap:
+
+        path = os.path.join(self._root, name, '{:08d}.chunk'.format(chunk_no))
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    def read(self, name: str, start: Optional[float] = None,
+             end: Optional[float] = None) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        """
+        Read the books of one exchange in time order.
+
+        Args:
+            name: Exchange name
+            start: First timestamp in seconds to read, inclusive
+            end: Last timestamp in seconds to read, exclusive
+
+        Yields:
+            Tuples of timestamp in seconds and book with 'asks' and 'bids'
+        """
+        entries = self._index.get(name, [])
+        start_ms = int(start * 1000) if start is not None else None
+        end_ms = int(end * 1000) if end is not None else None
+        first = 0
+        if start_ms is not None:
+            first = max(0, bisect_right([e[0] for e in entries], start_ms) - 1)
+
+        for chunk_start, chunk_no, size in entries[first:]:
+            if end_ms is not None and chunk_start >= end_ms:
+                return
+            data = self._chunk(name, chunk_no, size)
+            _, tick, volume_unit, timestamp = CHUNK_HEADER.unpack_from(data, 0)
+            codec = _Codec(tick, volume_unit, timestamp)
+            pos = CHUNK_HEADER.size
+            while pos < size:
+                timestamp, book, pos = codec.decode(data, pos)
+                if start_ms is not None and timestamp < start_ms:
+                    continue
+                if end_ms is not None and timestamp >= end_ms:
+                    return
+                book['bids'].reverse()
+                yield (timestamp / 1000.0, book)
+
+    def cycles(self, start: Optional[float] = None,
+               end: Optional[float] = None) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        """
+        Read the books of all exchanges grouped by recording time.
+
+        Args:
+            start: First timestamp in seconds to read, inclusive
+            end: Last timestamp in seconds to read, exclusive
+
+        Yields:
+            Tuples of timestamp in seconds and books by exchange name
+        """
+        def _stream(name):
+            for timestamp, book in self.read(name, start, end):
+                yield (timestamp, name, book)
+
+        streams = [ _stream(name) for name in self.names() ]
+        for timestamp, group in groupby(merge(*streams, key=itemgetter(0, 1)), key=itemgetter(0)):
+            yield (timestamp, { name: book for _, name, book in group })
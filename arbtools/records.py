@@ -0,0 +1,214 @@
+import copyreg
+from operator import attrgetter
+from typing import Dict, Any, Iterator, NamedTuple, Tuple
+
+
+class Quote(NamedTuple):
+    """
+    Best price level of a book side. Unpacks like the old [price, volume] lists.
+    """
+
+    price: float
+    volume: float
+
+# pickleは型と値のタプルをCのまま取り出す (NamedTupleの__getnewargs__はPythonで遅い)
+Quote._args = property(tuple)
+copyreg.pickle(Quote, attrgetter('__class__', '_args'))
+
+
+class Record:
+    """
+    Base class of slotted records with explicit fields.
+
+    Records keep the mapping interface of the dicts they replace, so code
+    reading `deal['buy']['quote']` or `'status' in order` keeps working.
+    A field set to None counts as missing, like an absent dict key. Records
+    are built from their field values, by keyword or in slot order, and
+    pickle as their type and a tuple of those values.
+    """
+
+    __slots__: Tuple[str, ...] = ()
+    _fields: frozenset = frozenset()
+    _values: Any = None
+
+    def __init_subclass__(cls, **kwargs) -> None:
+
+        super().__init_subclass__(**kwargs)
+        cls._fields = frozenset(cls.__slots__)
+        cls._values = attrgetter(*cls.__slots__)
+        # 項目を順に受け取る__init__を作る。pickleは型と値のタプルを
+        # Cのまま取り出し、読むときはこれを呼ぶだけにする
+        cls.__init__ = _positional_init(cls.__slots__)
+        cls._state = property(cls._values)
+        copyreg.pickle(cls, attrgetter('__class__', '_state'))
+
+    @classmethod
+    def _make(cls, values: Tuple[Any, ...]) -> 'Record':
+
+        # 後から増えた項目は古いpickleに無いので空にしておく
+        return cls(*values)
+
+    def __getitem__(self, key: str) -> Any:
+
+        value = getattr(self, key) if key in self._fields else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: object) -> bool:
+
+        return key in self._fields and getattr(self, key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+
+        return len(self.keys())
+
+    def __eq__(self, other: object) -> bool:
+
+        if isinstance(other, (Record, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+
+        fields = ', '.join('{}={!r}'.format(k, v) for k, v in self.items())
+        return '{}({})'.format(type(self).__name__, fields)
+
+    def get(self, key: str, default: Any = None) -> Any:
+
+        value = getattr(self, key) if key in self._fields else None
+        return default if value is None else value
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+
+        value = self.get(key)
+        if value is None:
+            self[key] = value = default
+        return value
+
+    def keys(self) -> list:
+
+        return [ name for name in self.__slots__ if getattr(self, name) is not None ]
+
+    def values(self) -> list:
+
+        return [ getattr(self, name) for name in self.keys() ]
+
+    def items(self) -> list:
+
+        return [ (name, getattr(self, name)) for name in self.keys() ]
+
+    def copy(self) -> 'Record':
+
+        return self._make(self._values(self))
+
+
+def _positional_init(names: Tuple[str, ...]) -> Any:
+
+    # namedtupleと同じく、項目ごとの代入を並べた関数を生成する
+    args = ', '.join('{}=None'.format(name) for name in names)
+    body = ''.join('    self.{0} = {0}\n'.format(name) for name in names)
+    namespace: Dict[str, Any] = {}
+    exec('def __init__(self, {}):\n{}'.format(args, body), namespace)
+    return namespace['__init__']
+
+def _restore(cls: type, values: Tuple[Any, ...]) -> Record:
+
+    # 以前の形式で保存した記録を読む
+    return cls._make(values)
+
+
+class Leg(Record):
+    """
+    One side of a deal: the venue and the quote it trades against.
+
+    Pair deals only fill exchange_name and quote; legs of multi-leg deals
+    also carry their id, symbol, side and amount.
+    """
+
+    __slots__ = ('exchange_name', 'quote', 'leg_id', 'symbol', 'side', 'amount')
+
+
+class Order(Record):
+    """
+    Order state as the trade loop needs it, without the raw exchange response.
+    last_trade is the local time of the order's last fill.
+    """
+
+    __slots__ = ('id', 'symbol', 'type', 'side', 'price', 'amount', 'filled', 'remaining',
+                 'average', 'status', 'fee_cost', 'timestamp', 'sent_at', 'acked_at', 'last_trade')
+
+    @classmethod
+    def from_ccxt(cls, raw: Dict[str, Any], **fields: Any) -> 'Order':
+        """
+        Convert an order returned by a gateway.
+
+        Args:
+            raw: Order in ccxt's unified layout
+            **fields: Send and acknowledge times, sent_at and acked_at, and
+                the local time of the last fill, last_trade
+
+        Returns:
+            Order holding the unified fields, dropping 'info'
+        """
+        get = raw.get
+        fee = get('fee') or {}
+        return cls._make((
+            get('id'), get('symbol'), get('type'), get('side'), get('price'),
+            get('amount'), get('filled'), get('remaining'), get('average'),
+            get('status'), fee.get('cost'), get('timestamp'),
+            fields.get('sent_at'), fields.get('acked_at'), fields.get('last_trade'),
+        ))
+
+
+class Deal(Record):
+    """
+    Deal requested to the Broker.
+
+    Pair deals fill buy and sell, multi-leg deals fill legs and currency.
+    Reverse deals keep a compact copy of the deal they close in open_deal.
+    Deals in recovery list their hedge orders as legs in hedges.
+    """
+
+    __slots__ = ('deal_id', 'expected_profit', 'profit_rate', 'allowed_exitcost',
+                 'buy', 'sell', 'volume', 'legs', 'currency', 'orders', 'timestamp',
+                 'trace', 'open_deal', 'hedges')
+
+    def compact(self) -> 'Deal':
+        """
+        Copy the deal without its nested open deal.
+
+        Returns:
+            Deal keeping what closing it needs: prices, volume, profit and
+            orders, and its trace for the trace log
+        """
+        deal = self.copy()
+        deal.open_deal = None
+        return deal
+
+
+def compact_deal(data: Any) -> Any:
+    """
+    Compact a deal about to be nested in a reverse deal.
+
+    Args:
+        data: Deal or, for journals written before records, a plain dict
+
+    Returns:
+        Compact copy of the deal
+    """
+    if isinstance(data, Deal):
+        return data.compact()
+    return { k: v for k, v in data.items() if k != 'open_deal' }
@@ -0,0 +1,217 @@
+from collections import deque
+from itertools import count
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+Status = Tuple[str, Dict[str, Any]]
+
+
+class RequestBook:
+    """
+    Queue of the broker's requests, indexed for admission checks.
+
+    Requests are (state, data) pairs processed in FIFO order. Besides the
+    queue the book keeps the requests of every state, the request of every
+    deal_id and, for every exchange, how many requests still have unfilled
+    orders there. The indexes are updated when a request enters or leaves
+    the book, i.e. on every TradeRule transition, so admission checks do
+    not walk the requests and queue operations are O(1).
+    """
+
+    def __init__(self, requests: Iterable[Status] = (), *,
+                 exchanges: Optional[Callable[[str, Dict[str, Any]], Iterable[str]]] = None) -> None:
+        """
+        Initialize the RequestBook.
+
+        Args:
+            requests: Initial requests, in order
+            exchanges: Function giving the exchanges a request has unfilled
+                orders on
+        """
+        self._exchanges = exchanges or (lambda state, data: ())
+        self._keys = count()
+        self._queue: deque = deque()
+        self._entries: Dict[int, Status] = {}
+        self._states: Dict[str, Dict[int, Status]] = {}
+        self._deals: Dict[Any, int] = {}
+        self._unfilled: Dict[int, Tuple[str, ...]] = {}
+        self._unclosed: Dict[str, int] = {}
+        # 出し入れのたびに増やし、保存し直すかの判断に使う
+        self._version = 0
+        for status in requests:
+            self.append(status)
+
+    def __len__(self) -> int:
+
+        return len(self._queue)
+
+    def __bool__(self) -> bool:
+
+        return bool(self._queue)
+
+    def __iter__(self) -> Iterator[Status]:
+
+        entries = self._entries
+        return (entries[key] for key in list(self._queue))
+
+    def __eq__(self, other: Any) -> bool:
+
+        if isinstance(other, RequestBook):
+            other = list(other)
+        return list(self) == other
+
+    def append(self, status: Status) -> None:
+        """
+        Queue a request and index it.
+
+        Args:
+            status: (state, data) pair
+        """
+        key = next(self._keys)
+        state, data = status
+        self._version += 1
+        self._queue.append(key)
+        self._entries[key] = status
+        self._states.setdefault(state, {})[key] = status
+        deal_id = data.get('deal_id') if hasattr(data, 'get') else None
+        if deal_id is not None:
+            self._deals[deal_id] = key
+        exchanges = self._exchanges(state, data)
+        if exchanges:
+            exchanges = tuple(set(exchanges))
+            self._unfilled[key] = exchanges
+            unclosed = self._unclosed
+            for name in exchanges:
+                unclosed[name] = unclosed.get(name, 0) + 1
+
+    def popleft(self) -> Status:
+        """
+        Take the oldest request out of the book.
+
+        Returns:
+            (state, data) pair
+        """
+        key = self._queue.popleft()
+        status = self._entries.pop(key)
+        self._version += 1
+        state, data = status
+        states = self._states[state]
+        del states[key]
+        if not states:
+            del self._states[state]
+        deal_id = data.get('deal_id') if hasattr(data, 'get') else None
+        if deal_id is not None and self._deals.get(deal_id) == key:
+            del self._deals[deal_id]
+        exchanges = self._unfilled.pop(key, ())
+        unclosed = self._unclosed
+        for name in exchanges:
+            if unclosed[name] > 1:
+                unclosed[name] -= 1
+            else:
+                del unclosed[name]
+        return status
+
+    def peek(self) -> Status:
+        """
+        Get the oldest request without taking it out.
+
+        Returns:
+            (state, data) pair
+        """
+        return self._entries[self._queue[0]]
+
+    def version(self) -> int:
+        """
+        Get a number that changes whenever a request enters or leaves the
+        book. Requests only change while they are out of the book, so an
+        unchanged version means unchanged requests.
+
+        Returns:
+            Version of the book
+        """
+        return self._version
+
+    def rotate(self) -> None:
+        """
+        Move the oldest request to the back, keeping its indexes.
+        """
+        self._queue.append(self._queue.popleft())
+
+    def copy(self) -> 'RequestBook':
+        """
+        Get a book with the same requests and indexes.
+
+        Returns:
+            New RequestBook
+        """
+        book = RequestBook(exchanges=self._exchanges)
+        book._keys = count(next(self._keys))
+        book._queue = deque(self._queue)
+        book._entries = dict(self._entries)
+        book._states = { state: dict(entries) for state, entries in self._states.items() }
+        book._deals = dict(self._deals)
+        book._unfilled = dict(self._unfilled)
+        book._unclosed = dict(self._unclosed)
+        book._version = self._version
+        return book
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Get the number of requests in every state.
+
+        Returns:
+            Count by state
+        """
+        return { state: len(entries) for state, entries in self._states.items() }
+
+    def any_state(self, states: Iterable[str]) -> bool:
+        """
+        Tell whether any request is in one of some states.
+
+        Args:
+            states: States to look for
+
+        Returns:
+            True if a request is in one of them
+        """
+        return any(state in self._states for state in states)
+
+    def in_states(self, states: Iterable[str]) -> List[Status]:
+        """
+        Get the requests in some states.
+
+        Args:
+            states: States to look for
+
+        Returns:
+            (state, data) pairs, oldest first per state
+        """
+        return [ status for state in states for status in self._states.get(state, {}).values() ]
+
+    def deal(self, deal_id: Any) -> Optional[Status]:
+        """
+        Get the request of a deal.
+
+        Args:
+            deal_id: Deal ID
+
+        Returns:
+            (state, data) pair, or None
+        """
+        key = self._deals.get(deal_id)
+        return self._entries.get(key) if key is not None else None
+
+    def unclosed(self, names: Iterable[str]) -> bool:
+        """
+        Tell whether some exchanges have unfilled orders.
+
+        Args:
+            names: Exchange names
+
+        Returns:
+            True if a request still has unfilled orders on one of them
+        """
+        return any(name in self._unclosed for name in names)
+
+    def unclosed_exchanges(self) -> Set[str]:
+
+        return set(self._unclosed)
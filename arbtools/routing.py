@@ -0,0 +1,232 @@
+import heapq
+import uuid
+from operator import itemgetter
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+from arbtools.records import Deal, Leg, Quote
+
+# (手数料込みの価格, 価格, 数量, 取引所名)
+Level = Tuple[float, float, float, str]
+
+
+class ConsolidatedBook:
+    """
+    Order book of every venue merged into one.
+
+    Each venue keeps its levels with fee-adjusted prices: an ask costs
+    price * (1 + fee), a bid returns price * (1 - fee). `update_books`
+    recomputes only the venues whose rounded book changed, and `asks` and
+    `bids` k-way merge the venues lazily, so a reader walking the best
+    levels pays O(log k) per level for k venues and never sorts the whole
+    book.
+    """
+
+    def __init__(self, fees: Optional[Dict[str, float]] = None) -> None:
+        """
+        Initialize the ConsolidatedBook.
+
+        Args:
+            fees: Trading fees in percent by exchange name
+        """
+        self._fees = dict(fees or {})
+        self._books: Dict[str, Tuple[Any, Any]] = {}
+        self._asks: Dict[str, List[Level]] = {}
+        self._bids: Dict[str, List[Level]] = {}
+        self.version = 0
+
+    def __len__(self) -> int:
+
+        return len(self._books)
+
+    def __contains__(self, name: str) -> bool:
+
+        return name in self._books
+
+    def names(self) -> List[str]:
+
+        return list(self._books)
+
+    def update(self, name: str, asks: List[Any], bids: List[Any]) -> bool:
+        """
+        Set the levels of a venue.
+
+        Args:
+            name: Exchange name
+            asks: Ask levels, lowest price first
+            bids: Bid levels, highest price last, as OrderBooks.round keeps them
+
+        Returns:
+            True if the venue's book changed
+        """
+        if self._books.get(name) == (asks, bids):
+            return False
+        fee = self._fees.get(name, 0.0) / 100.0
+        self._books[name] = (asks, bids)
+        self._asks[name] = [ (p * (1.0 + fee), p, v, name) for p, v in asks if v > 0 ]
+        self._bids[name] = [ (p * (1.0 - fee), p, v, name) for p, v in reversed(bids) if v > 0 ]
+        self.version += 1
+        return True
+
+    def remove(self, name: str) -> None:
+
+        if self._books.pop(name, None) is not None:
+            del self._asks[name]
+            del self._bids[name]
+            self.version += 1
+
+    def update_books(self, orderbooks: Any) -> List[str]:
+        """
+        Take the rounded books of a cycle.
+
+        Args:
+            orderbooks: OrderBooks, or rounded books by exchange name.
+                Venues without a book are removed.
+
+        Returns:
+            Names of the venues whose book changed
+        """
+        data = getattr(orderbooks, '_data', orderbooks)
+        changed = [ name for name, book in data.items()
+            if self.update(name, book['asks'], book['bids']) ]
+        for name in [ name for name in self._books if name not in data ]:
+            self.remove(name)
+            changed.append(name)
+        return changed
+
+    def asks(self) -> Iterator[Level]:
+        """
+        Walk the asks of every venue, cheapest after fees first.
+
+        Returns:
+            Iterator of (fee-adjusted price, price, volume, exchange name)
+        """
+        return heapq.merge(*self._asks.values())
+
+    def bids(self) -> Iterator[Level]:
+        """
+        Walk the bids of every venue, highest after fees first.
+
+        Returns:
+            Iterator of (fee-adjusted price, price, volume, exchange name)
+        """
+        return heapq.merge(*self._bids.values(), key=itemgetter(0), reverse=True)
+
+
+class SmartRouter:
+    """
+    Router splitting a target volume over several buy and sell venues.
+
+    The consolidated asks are matched against the consolidated bids while
+    the best remaining bid after fees is above the best remaining ask.
+    Each match takes the smallest of what is left of the target, of the two
+    levels, of the buyer's quote currency and of the seller's base
+    currency. Both sides are walked in price order and every venue's
+    capacity only cuts its own levels. The fee-adjusted profit of the
+    matched volume is therefore the largest the books and balances allow.
+    Venues whose part would be below `min_volume` are left out and the
+    volume is routed again over the rest.
+    """
+
+    def __init__(self, book: ConsolidatedBook, *, symbol: str = 'BTC/JPY',
+                 min_volume: float = 0.001) -> None:
+        """
+        Initialize the SmartRouter.
+
+        Args:
+            book: Consolidated book to route over
+            symbol: Symbol traded by every leg
+            min_volume: Smallest order a leg may place
+        """
+        self._book = book
+        self._symbol = symbol
+        self._base, self._quote = symbol.split('/')
+        self._min_volume = min_volume
+
+    def book(self) -> ConsolidatedBook:
+
+        return self._book
+
+    def _levels(self, levels: Iterator[Level], allowed: Set[str]) -> Iterator[List[Any]]:
+
+        for eff, price, volume, name in levels:
+            if name in allowed:
+                yield [eff, price, volume, name]
+
+    def _match(self, volume: float, balances: Any,
+               excluded: Set[Tuple[str, str]]) -> Tuple[Dict[Tuple[str, str], List[float]], float]:
+
+        names = [ name for name in self._book.names() if name in balances ]
+        cash = { name: balances[name].get(self._quote, {}).get('free') or 0.0 for name in names }
+        coins = { name: balances[name].get(self._base, {}).get('free') or 0.0 for name in names }
+        asks = self._levels(self._book.asks(), { n for n in names if (n, 'buy') not in excluded })
+        bids = self._levels(self._book.bids(), { n for n in names if (n, 'sell') not in excluded })
+        # (取引所名, 売買) -> [数量, 最も不利な価格]
+        fills: Dict[Tuple[str, str], List[float]] = {}
+        profit = 0.0
+        remaining = volume
+        ask, bid = next(asks, None), next(bids, None)
+        while remaining > 1e-12 and ask and bid and bid[0] > ask[0]:
+            buyer, seller = ask[3], bid[3]
+            amount = min(remaining, ask[2], bid[2], cash[buyer] / ask[0], coins[seller])
+            if amount > 1e-12:
+                for key, price in (((buyer, 'buy'), ask[1]), ((seller, 'sell'), bid[1])):
+                    fill = fills.setdefault(key, [0.0, price])
+                    fill[0] += amount
+                    fill[1] = max(fill[1], price) if key[1] == 'buy' else min(fill[1], price)
+                profit += amount * (bid[0] - ask[0])
+                cash[buyer] -= amount * ask[0]
+                coins[seller] -= amount
+                ask[2] -= amount
+                bid[2] -= amount
+                remaining -= amount
+            # 使い切った板と資金の尽きた取引所は飛ばす
+            if ask[2] <= 1e-12 or cash[buyer] / ask[0] <= 1e-12:
+                ask = next(asks, None)
+            if bid[2] <= 1e-12 or coins[seller] <= 1e-12:
+                bid = next(bids, None)
+        return fills, profit
+
+    def route(self, volume: float, balances: Any) -> Optional[Deal]:
+        """
+        Build the most profitable multi-leg deal for a volume.
+
+        Args:
+            volume: Most base currency to buy and sell
+            balances: Balances of the venues
+
+        Returns:
+            Deal with one leg per venue and side, or None if no volume of
+            at least min_volume crosses after fees
+        """
+        excluded: Set[Tuple[str, str]] = set()
+        while True:
+            fills, profit = self._match(volume, balances, excluded)
+            small = { key for key, (amount, _) in fills.items() if amount < self._min_volume }
+            if not small:
+                break
+            excluded |= small
+        if not fills:
+            return None
+
+        legs = []
+        cost = 0.0
+        for i, ((name, side), (amount, price)) in enumerate(sorted(fills.items(), key=lambda item: item[0][1])):
+            legs.append(Leg(
+                leg_id='{}:{}'.format(i, name),
+                exchange_name=name,
+                symbol=self._symbol,
+                side=side,
+                quote=Quote(price, amount),
+                amount=amount,
+            ))
+            if side == 'buy':
+                cost += price * amount
+        matched = sum(leg.amount for leg in legs if leg.side == 'buy')
+        return Deal(
+            deal_id=uuid.uuid4().hex,
+            legs=legs,
+            currency=self._quote,
+            volume=matched,
+            expected_profit=profit,
+            profit_rate=profit / cost * 100.0,
+            allowed_exitcost=0,
+        )
@@ -0,0 +1,316 @@
+"""
+Market-data fetchers running in their own processes.
+
+Each enabled exchange gets a process that fetches, parses and rounds its
+order book and publishes the result into a fixed-size shared-memory slot.
+The trading process reads the slots instead of calling the gateway, so
+JSON parsing and rounding spread over cores and a crashed fetcher only
+leaves its venue without quotes until it is restarted.
+
+A slot is a seqlock: the writer makes the sequence number odd, writes the
+book and makes it even again. A reader copies the book out between two
+reads of the sequence and retries if they differ or are odd, so it never
+sees a half-written book and never blocks the writer.
+"""
+import time
+import struct
+import importlib
+import multiprocessing
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional, Tuple
+from arbtools.metrics import metrics
+
+# seq, received_at, rounded_at, published_at, asksの数, bidsの数 (エラー時は-1)
+_HEADER = struct.Struct('<Qdddii')
+_SEQ = struct.Struct('<Q')
+_ERROR_SIZE = 256
+
+
+class BookSlot:
+    """
+    Shared-memory seqlock slot holding the latest rounded book of a venue.
+    """
+
+    def __init__(self, name: Optional[str] = None, *, depth: int = 100, create: bool = False) -> None:
+        """
+        Create or attach a slot.
+
+        Args:
+            name: Shared memory name, generated when creating
+            depth: Most price levels kept per side
+            create: Whether to allocate the shared memory
+        """
+        self.depth = depth
+        self._levels = _HEADER.size
+        self._error = self._levels + depth * 2 * 2 * 8
+        size = self._error + _ERROR_SIZE
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self._owner = create
+        if create:
+            self._shm.buf[:size] = bytes(size)
+        self.name = self._shm.name
+
+    def _begin(self) -> int:
+
+        buf = self._shm.buf
+        seq = _SEQ.unpack_from(buf, 0)[0] + 1
+        _SEQ.pack_into(buf, 0, seq)
+        return seq
+
+    def publish(self, book: Dict[str, Any]) -> None:
+        """
+        Write a rounded book. Only one process may write a slot.
+
+        Args:
+            book: Book with 'asks', 'bids', 'received_at' and 'rounded_at'
+        """
+        # round()はasksを安い順、bidsを高い順の末尾に持つので外側を捨てる
+        asks = book['asks'][:self.depth]
+        bids = book['bids'][-self.depth:] if book['bids'] else []
+        buf = self._shm.buf
+        seq = self._begin()
+        offset = self._levels
+        for levels in (asks, bids):
+            values = [ value for level in levels for value in level ]
+            struct.pack_into('<%dd' % len(values), buf, offset, *values)
+            offset += len(values) * 8
+        _HEADER.pack_into(buf, 0, seq, book.get('received_at') or 0.0,
+            book.get('rounded_at') or 0.0, time.time(), len(asks), len(bids))
+        _SEQ.pack_into(buf, 0, seq + 1)
+
+    def publish_error(self, message: str) -> None:
+        """
+        Write a fetch error in place of the book.
+
+        Args:
+            message: Error message
+        """
+        data = message.encode('utf-8')[:_ERROR_SIZE - 2]
+        buf = self._shm.buf
+        seq = self._begin()
+        struct.pack_into('<H', buf, self._error, len(data))
+        buf[self._error + 2:self._error + 2 + len(data)] = data
+        _HEADER.pack_into(buf, 0, seq, 0.0, 0.0, time.time(), -1, -1)
+        _SEQ.pack_into(buf, 0, seq + 1)
+
+    def _read(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+
+        buf = self._shm.buf
+        seq, received_at, rounded_at, published_at, n_asks, n_bids = _HEADER.unpack_from(buf, 0)
+        if seq == 0 or seq & 1:
+            return seq, None
+        if n_asks < 0:
+            length = struct.unpack_from('<H', buf, self._error)[0]
+            message = bytes(buf[self._error + 2:self._error + 2 + length]).decode('utf-8', 'replace')
+            return seq, { 'fetch_orderbooks_error': message, 'published_at': published_at }
+        values = struct.unpack_from('<%dd' % ((n_asks + n_bids) * 2), buf, self._levels)
+        it = iter(values)
+        levels = list(zip(it, it))
+        return seq, {
+            'asks': levels[:n_asks],
+            'bids': levels[n_asks:],
+            'received_at': received_at or None,
+            'rounded_at': rounded_at or None,
+            'published_at': published_at,
+        }
+
+    def read(self, retries: int = 100) -> Optional[Dict[str, Any]]:
+        """
+        Copy out a consistent book.
+
+        Args:
+            retries: Attempts before giving up on a slot being rewritten
+
+        Returns:
+            Book, error dictionary, or None if nothing was published yet
+        """
+        for _ in range(retries):
+            seq, book = self._read()
+            if seq == 0:
+                return None
+            if _SEQ.unpack_from(self._shm.buf, 0)[0] == seq and not seq & 1:
+                return book
+            # 書き込み中なので書き手に譲ってやり直す
+            time.sleep(0)
+        return None
+
+    @property
+    def seq(self) -> int:
+
+        return _SEQ.unpack_from(self._shm.buf, 0)[0]
+
+    def close(self) -> None:
+
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _sleep(seconds: float, stop: Any) -> None:
+    # 止める指示にすぐ応えられるよう短く区切って待つ
+    deadline = time.monotonic() + seconds
+    while not stop.value:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            return
+        time.sleep(min(left, 0.1))
+
+
+def _run_fetcher(name: str, config: Any, gw_name: str, gw_options: Dict[str, Any],
+                 slot_name: str, depth: int, price_unit: float, interval: float,
+                 max_backoff: float, stop: Any) -> None:
+    """
+    Fetch, round and publish the book of one venue until stopped.
+
+    The fetcher waits `interval` seconds between two fetches, and after
+    consecutive errors doubles the wait up to `max_backoff`.
+    """
+    # 遅延importで子プロセスの起動時に循環importしない
+    from arbtools.apifacade import APIFacade
+    from arbtools.orderbooks import OrderBooks
+
+    gw = importlib.import_module(gw_name)
+    for key, value in gw_options.items():
+        setattr(gw, key, value)
+    api = APIFacade({ name: config }, gw_name)
+    slot = BookSlot(slot_name, depth=depth)
+    errors = 0
+    try:
+        while not stop.value:
+            books = OrderBooks(api).round(price_unit)
+            if name in books._data:
+                slot.publish(books._data[name])
+                errors = 0
+                wait = interval
+            else:
+                slot.publish_error(books._errors.get(name, {}).get('fetch_orderbooks_error', 'no book'))
+                errors += 1
+                # 失敗が続くほど間を空けて取引所の制限を食い潰さない
+                wait = min(max_backoff, max(interval, 0.5) * 2 ** (errors - 1))
+            if wait:
+                _sleep(wait, stop)
+    finally:
+        slot.close()
+
+
+class SharedBooks:
+    """
+    Fetcher processes of every enabled exchange and their book slots.
+    """
+
+    def __init__(self, exchanges: Dict[str, Any], gw_name: str, *, price_unit: float = 100,
+                 depth: int = 100, interval: float = 1.0, max_backoff: float = 30.0,
+                 max_age: float = 10.0,
+                 gw_options: Optional[Dict[str, Any]] = None, context: str = 'spawn') -> None:
+        """
+        Initialize the SharedBooks.
+
+        Args:
+            exchanges: Dictionary of exchange configurations
+            gw_name: Name of the gateway module the fetchers import
+            price_unit: Price unit the books are rounded to
+            depth: Most price levels kept per side
+            interval: Seconds a fetcher waits between two fetches
+            max_backoff: Longest wait of a fetcher after failed fetches
+            max_age: Seconds after which a published book is an error
+            gw_options: Module attributes set on the gateway in every fetcher
+            context: Multiprocessing start method
+        """
+        # 設定オブジェクトは子プロセスへ送れる形にしておく
+        self._configs = { name: SimpleNamespace(enable=True, apikey=value.apikey,
+                secret=value.secret, fees=value.fees)
+            for name, value in exchanges.items() if value.enable }
+        self._gw_name = gw_name
+        self._gw_options = dict(gw_options or {})
+        self.price_unit = price_unit
+        self._depth = depth
+        self._interval = interval
+        self._max_backoff = max_backoff
+        self._max_age = max_age
+        self._context = multiprocessing.get_context(context)
+        # 止められた子がロックを握ったままにならないようロック無しの値で伝える
+        self._stop = self._context.RawValue('b', 0)
+        self._slots = { name: BookSlot(depth=depth, create=True) for name in self._configs }
+        self._processes: Dict[str, Any] = {}
+
+    def names(self) -> List[str]:
+
+        return list(self._slots)
+
+    def _spawn(self, name: str) -> None:
+
+        process = self._context.Process(target=_run_fetcher, name='fetcher-' + name,
+            args=(name, self._configs[name], self._gw_name, self._gw_options,
+                self._slots[name].name, self._depth, self.price_unit, self._interval, self._max_backoff, self._stop),
+            daemon=True)
+        process.start()
+        self._processes[name] = process
+
+    def start(self) -> 'SharedBooks':
+
+        for name in self._slots:
+            self._spawn(name)
+        return self
+
+    def check(self) -> List[str]:
+        """
+        Restart the fetchers that died.
+
+        Returns:
+            Names of the restarted fetchers
+        """
+        if self._stop.value:
+            return []
+        restarted = [ name for name, process in self._processes.items() if not process.is_alive() ]
+        for name in restarted:
+            print(f"Fetcher {name} exited with {self._processes[name].exitcode}, restarting")
+            metrics.incr('fetcher_restarts', name)
+            self._spawn(name)
+        return restarted
+
+    def wait(self, timeout: float = 10.0) -> bool:
+        """
+        Wait until every slot has been published once.
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            True if every slot has a book or an error
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(slot.seq for slot in self._slots.values()):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def read(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Read the latest book of every venue.
+
+        Returns:
+            Rounded book, or {'fetch_orderbooks_error': message}, by name
+        """
+        self.check()
+        now = time.time()
+        result = {}
+        for name, slot in self._slots.items():
+            book = slot.read()
+            if book is None:
+                book = { 'fetch_orderbooks_error': 'no book published' }
+            elif now - book['published_at'] > self._max_age:
+                book = { 'fetch_orderbooks_error': 'book is {:.1f}s old'.format(now - book['published_at']) }
+            result[name] = book
+        return result
+
+    def stop(self) -> None:
+
+        self._stop.value = 1
+        for process in self._processes.values():
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        for slot in self._slots.values():
+            slot.close()
@@ -0,0 +1,235 @@
+"""
+Simulated gateway module for Provider(exchanges, gw_name='arbtools.simgw').
+
+Every attribute of this module is an exchange class with the subset of the
+ccxt API that APIFacade uses. All instances share the SimMarket installed
+with `install`, which serves the current books and fills orders against them.
+"""
+import random
+import itertools
+import threading
+from typing import Dict, Any, Optional
+from arbtools import clock
+
+
+class Latency:
+    """
+    Normally distributed latency model, clipped at zero.
+
+    A share `tail` of the samples is multiplied by `tail_factor` to model
+    the slow outliers of real venues.
+    """
+
+    def __init__(self, mean: float = 0.05, stdev: float = 0.0, *, seed: Optional[int] = None,
+                 tail: float = 0.0, tail_factor: float = 10.0) -> None:
+
+        self._mean = mean
+        self._stdev = stdev
+        self._tail = tail
+        self._tail_factor = tail_factor
+        self._random = random.Random(seed)
+
+    def sample(self) -> float:
+
+        latency = self._mean
+        if self._stdev:
+            latency = max(0.0, self._random.gauss(self._mean, self._stdev))
+        if self._tail and self._random.random() < self._tail:
+            latency *= self._tail_factor
+        return latency
+
+
+class SimMarket:
+    """
+    Shared state of the simulated exchanges.
+
+    Orders become eligible for matching once their sampled latency has
+    elapsed on the clock, and then fill against the current book at their
+    limit price. `fill_ratio` is the share of a crossing level's volume an
+    order may take, which stands in for queue position. Fills do not consume
+    the served books.
+    """
+
+    def __init__(self, balances: Dict[str, Dict[str, float]], *,
+                 fees: Optional[Dict[str, float]] = None,
+                 latency: Optional[Latency] = None, fill_ratio: float = 1.0) -> None:
+        """
+        Initialize the SimMarket.
+
+        Args:
+            balances: Initial free balances by exchange name and currency
+            fees: Trading fees in percent by exchange name
+            latency: Latency from order placement to matching
+            fill_ratio: Share of a crossing level's volume an order may take
+        """
+        self._balances = { k: dict(v) for k, v in balances.items() }
+        self._fees = fees or {}
+        self._latency = latency or Latency(0.0)
+        self._fill_ratio = fill_ratio
+        self._books: Dict[str, Dict[str, Any]] = {}
+        self._orders: Dict[str, Dict[str, Any]] = {}
+        self._open: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self.calls = 0
+
+    def update(self, books: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Replace the books served by the exchanges and match resting orders.
+
+        Args:
+            books: Order books by exchange name
+        """
+        with self._lock:
+            self._books = books
+            for order in list(self._open.values()):
+                self._match(order)
+
+    def book(self, name: str) -> Dict[str, Any]:
+
+        with self._lock:
+            self.calls += 1
+            if name not in self._books:
+                raise Exception('{}: no orderbook'.format(name))
+            return self._books[name]
+
+    def balance(self, name: str) -> Dict[str, Any]:
+
+        with self._lock:
+            self.calls += 1
+            balance = self._balances.get(name, {})
+            return { k: { 'free': v, 'used': 0.0, 'total': v } for k, v in balance.items() }
+
+    def create_order(self, name: str, symbol: str, side: str, amount: float, price: float) -> Dict[str, Any]:
+
+        with self._lock:
+            self.calls += 1
+            order = {
+                'id': str(next(self._ids)),
+                'exchange_name': name,
+                # ccxtと同じくミリ秒
+                'timestamp': int(clock.time() * 1000),
+                'active_at': clock.time() + self._latency.sample(),
+                'symbol': symbol,
+                'type': 'limit',
+                'side': side,
+                'price': price,
+                'amount': amount,
+                'filled': 0.0,
+                'remaining': amount,
+                'status': 'open',
+                'fee': { 'cost': 0.0, 'currency': symbol.split('/')[1] },
+            }
+            self._orders[order['id']] = order
+            self._open[order['id']] = order
+            return dict(order)
+
+    def fetch_order(self, id_: str) -> Dict[str, Any]:
+
+        with self._lock:
+            self.calls += 1
+            order = self._orders[id_]
+            self._match(order)
+            return dict(order)
+
+    def cancel_order(self, id_: str) -> Dict[str, Any]:
+
+        with self._lock:
+            self.calls += 1
+            order = self._orders[id_]
+            if order['status'] == 'open':
+                order['status'] = 'canceled'
+                del self._open[id_]
+            return dict(order)
+
+    def _match(self, order: Dict[str, Any]) -> None:
+
+        if order['status'] != 'open' or clock.time() < order['active_at']:
+            return
+        name = order['exchange_name']
+        book = self._books.get(name)
+        if not book:
+            return
+
+        price = order['price']
+        if order['side'] == 'buy':
+            available = sum(v for p, v in book['asks'] if p <= price)
+        else:
+            available = sum(v for p, v in book['bids'] if p >= price)
+        volume = min(order['remaining'], available * self._fill_ratio)
+        if volume <= 0:
+            return
+
+        base, quote = order['symbol'].split('/')
+        cost = price * volume
+        fee = cost * (self._fees.get(name, 0.0) / 100.0)
+        balance = self._balances.setdefault(name, {})
+        sign = 1 if order['side'] == 'buy' else -1
+        balance[base] = balance.get(base, 0.0) + sign * volume
+        balance[quote] = balance.get(quote, 0.0) - sign * cost - fee
+
+        order['filled'] += volume
+        order['remaining'] -= volume
+        order['fee']['cost'] += fee
+        order['lastTradeTimestamp'] = int(clock.time() * 1000)
+        if order['remaining'] <= 1e-12:
+            order['remaining'] = 0.0
+            order['status'] = 'closed'
+            del self._open[order['id']]
+
+
+# 呼び出しは即座に返るので、APIFacadeにスレッドを使わせない
+parallel = False
+# 接続を持たないのでHTTPセッションは不要
+sessions = False
+
+_market: Optional[SimMarket] = None
+
+def install(market: SimMarket) -> SimMarket:
+
+    global _market
+    _market = market
+    return market
+
+
+class SimExchange:
+    """
+    Simulated exchange backed by the installed SimMarket.
+    """
+
+    id = None
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None) -> None:
+
+        self.options = options or {}
+
+    def fetch_order_book(self, symbol: str) -> Dict[str, Any]:
+
+        return _market.book(self.id)
+
+    def fetch_balance(self) -> Dict[str, Any]:
+
+        return _market.balance(self.id)
+
+    def create_order(self, symbol: str, type: str, side: str, amount: float, price: float) -> Dict[str, Any]:
+
+        return _market.create_order(self.id, symbol, side, amount, price)
+
+    def fetch_order(self, id: str, symbol: Optional[str] = None) -> Dict[str, Any]:
+
+        return _market.fetch_order(id)
+
+    def cancel_order(self, id: str, symbol: Optional[str] = None) -> Dict[str, Any]:
+
+        return _market.cancel_order(id)
+
+
+_classes: Dict[str, type] = {}
+
+def __getattr__(name: str) -> type:
+    # 取引所名ごとにSimExchangeの派生クラスを作る
+    if name.startswith('_'):
+        raise AttributeError(name)
+    if name not in _classes:
+        _classes[name] = type(name, (SimExchange,), { 'id': name })
+    return _classes[name]
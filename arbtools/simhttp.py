@@ -0,0 +1,128 @@
+"""
+HTTP gateway module for Provider(exchanges, gw_name='arbtools.simhttp').
+
+Exchange classes talk to an ExchangeSimulator over real sockets, so load
+tests exercise HTTP, JSON, the thread pools and timeouts the way a network
+gateway does. Set `base_url` (and optionally `timeout` and `pool_size`)
+before creating the Provider. Every exchange keeps up to `pool_size` idle
+keep-alive connections shared by all threads; a request takes one from the
+pool or opens a new one, and returns it when the response has been read.
+"""
+import json
+import threading
+import http.client
+from urllib.parse import urlparse, quote
+from typing import Dict, Any, List, Optional, Tuple
+
+base_url = 'http://127.0.0.1:8080'
+timeout = 10.0
+pool_size = 4
+# 接続は取引所ごとのプールで管理するのでHTTPセッションは受け取らない
+sessions = False
+
+_stats_lock = threading.Lock()
+stats = { 'connections': 0, 'requests': 0, 'errors': 0 }
+
+
+def _count(key: str) -> None:
+
+    with _stats_lock:
+        stats[key] += 1
+
+
+class HTTPExchange:
+    """
+    Exchange client for the simulator's REST routes.
+    """
+
+    id = None
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None) -> None:
+
+        self.options = options or {}
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> Tuple[bool, http.client.HTTPConnection]:
+
+        with self._lock:
+            if self._idle:
+                # 最後に返した接続から使う
+                return True, self._idle.pop()
+        url = urlparse(base_url)
+        _count('connections')
+        return False, http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+
+    def _release(self, connection: http.client.HTTPConnection) -> None:
+
+        with self._lock:
+            if len(self._idle) < pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def idle_connections(self) -> int:
+
+        return len(self._idle)
+
+    def _request(self, method: str, path: str, payload: Any = None) -> Any:
+
+        body = json.dumps(payload) if payload is not None else None
+        headers = { 'Content-Type': 'application/json' } if body else {}
+        _count('requests')
+        while True:
+            reused, connection = self._connection()
+            try:
+                connection.request(method, '/{}{}'.format(self.id, path), body=body, headers=headers)
+                response = connection.getresponse()
+                data = json.loads(response.read())
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                # サーバーが閉じた待機中の接続なら新しい接続でやり直す
+                if reused and method != 'POST':
+                    continue
+                _count('errors')
+                raise
+            except Exception:
+                # 壊れた接続は捨てて次回つなぎ直す
+                connection.close()
+                _count('errors')
+                raise
+        self._release(connection)
+        if response.status >= 400:
+            _count('errors')
+            raise Exception('{} {}: {}'.format(self.id, response.status, data.get('error')))
+        return data
+
+    def fetch_order_book(self, symbol: str) -> Dict[str, Any]:
+
+        return self._request('GET', '/orderbook?symbol=' + quote(symbol, safe=''))
+
+    def fetch_balance(self) -> Dict[str, Any]:
+
+        return self._request('GET', '/balance')
+
+    def create_order(self, symbol: str, type: str, side: str, amount: float, price: float) -> Dict[str, Any]:
+
+        payload = { 'symbol': symbol, 'type': type, 'side': side, 'amount': amount, 'price': price }
+        return self._request('POST', '/orders', payload)
+
+    def fetch_order(self, id: str, symbol: Optional[str] = None) -> Dict[str, Any]:
+
+        return self._request('GET', '/orders/' + quote(str(id), safe=''))
+
+    def cancel_order(self, id: str, symbol: Optional[str] = None) -> Dict[str, Any]:
+
+        return self._request('DELETE', '/orders/' + quote(str(id), safe=''))
+
+
+_classes: Dict[str, type] = {}
+
+def __getattr__(name: str) -> type:
+    # 取引所名ごとにHTTPExchangeの派生クラスを作る
+    if name.startswith('_'):
+        raise AttributeError(name)
+    if name not in _classes:
+        _classes[name] = type(name, (HTTPExchange,), { 'id': name })
+    return _classes[name]
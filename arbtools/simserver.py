@@ -0,0 +1,166 @@
+import json
+import time
+import random
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Optional
+from arbtools.simgw import Latency, SimMarket
+from arbtools.synthetic import SyntheticBooks
+
+
+class ExchangeSimulator:
+    """
+    Local HTTP server simulating the REST API of several exchanges.
+
+    Routes, per exchange name:
+
+        GET    /<name>/orderbook?symbol=BTC/JPY
+        GET    /<name>/balance
+        POST   /<name>/orders            {"symbol", "type", "side", "amount", "price"}
+        GET    /<name>/orders/<id>
+        DELETE /<name>/orders/<id>
+
+    Books come from SyntheticBooks and move every `tick_interval` seconds;
+    orders are matched against them by a SimMarket. Every request waits for
+    a sampled latency, and a share of requests fails with 500 or 429.
+    """
+
+    def __init__(self, names: List[str], *, port: int = 0, host: str = '127.0.0.1',
+                 latency: Optional[Latency] = None, error_rate: float = 0.0,
+                 tick_interval: float = 0.1, balances: Optional[Dict[str, Dict[str, float]]] = None,
+                 books: Optional[SyntheticBooks] = None, seed: Optional[int] = None) -> None:
+        """
+        Initialize the ExchangeSimulator.
+
+        Args:
+            names: Exchange names to simulate
+            port: Port to listen on, 0 for any free port
+            host: Address to listen on
+            latency: Latency added to every request
+            error_rate: Share of requests answered with an error
+            tick_interval: Seconds between book updates
+            balances: Initial free balances by exchange name and currency
+            books: Book generator, defaults to SyntheticBooks with tick 100
+            seed: Random seed for errors and books
+        """
+        self._names = list(names)
+        self._latency = latency or Latency(0.0)
+        self._error_rate = error_rate
+        self._tick_interval = tick_interval
+        self._random = random.Random(seed)
+        self._books = books or SyntheticBooks(self._names, tick=100, seed=seed)
+        balances = balances or { name: { 'JPY': 10000000.0, 'BTC': 10.0 } for name in self._names }
+        self.market = SimMarket(balances, latency=Latency(0.0))
+        self.market.update(self._books.step())
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, name='simserver', daemon=True),
+            threading.Thread(target=self._tick, name='simserver-tick', daemon=True),
+        ]
+
+    def base_url(self) -> str:
+
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self) -> 'ExchangeSimulator':
+
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+
+        self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _tick(self) -> None:
+
+        while not self._stopped.wait(self._tick_interval):
+            self.market.update(self._books.step())
+
+    def _fault(self) -> Optional[int]:
+
+        with self._lock:
+            self.requests += 1
+            delay = self._latency.sample()
+            failed = self._random.random() < self._error_rate
+            status = self._random.choice((500, 429)) if failed else None
+            if failed:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        return status
+
+    def _route(self, method: str, path: str, query: Dict[str, Any], body: Any) -> Any:
+
+        parts = [ p for p in path.split('/') if p ]
+        if not parts or parts[0] not in self._names:
+            raise KeyError(path)
+        name, rest = parts[0], parts[1:]
+        market = self.market
+
+        if method == 'GET' and rest == ['orderbook']:
+            return market.book(name)
+        if method == 'GET' and rest == ['balance']:
+            return market.balance(name)
+        if method == 'POST' and rest == ['orders']:
+            return market.create_order(name, body['symbol'], body['side'], body['amount'], body['price'])
+        if method == 'GET' and len(rest) == 2 and rest[0] == 'orders':
+            return market.fetch_order(rest[1])
+        if method == 'DELETE' and len(rest) == 2 and rest[0] == 'orders':
+            return market.cancel_order(rest[1])
+        raise KeyError(path)
+
+    def _handler(self) -> type:
+
+        simulator = self
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                status = simulator._fault()
+                if status:
+                    self._reply(status, { 'error': 'injected error {}'.format(status) })
+                    return
+                try:
+                    self._reply(200, simulator._route(method, url.path, parse_qs(url.query), body))
+                except KeyError as e:
+                    self._reply(404, { 'error': 'not found: {}'.format(e) })
+                except Exception as e:
+                    self._reply(500, { 'error': str(e) })
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def do_DELETE(self):
+                self._handle('DELETE')
+
+            def log_message(self, format, *args):
+                pass
+
+        return _Handler
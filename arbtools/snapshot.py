@@ -0,0 +1,145 @@
+import threading
+from typing import Dict, Any, Iterable, Optional
+from arbtools import clock
+
+
+class MarketSnapshot:
+    """
+    Immutable view of the market a plan is made from.
+
+    Holds the quotes and balances of one planning round together with the
+    time every venue's book was received, so the quotes and balances used
+    by later steps of a deal always belong together. `version` grows by one
+    with every snapshot published by a SnapshotBuffer.
+    """
+
+    __slots__ = ('version', 'quotes', 'balances', 'received', 'created_at')
+
+    def __init__(self, version: int, quotes: Any, balances: Any,
+                 received: Optional[Dict[str, float]] = None,
+                 created_at: Optional[float] = None) -> None:
+        """
+        Initialize the MarketSnapshot.
+
+        Args:
+            version: Version number
+            quotes: Quotes of the round
+            balances: Balances of the round
+            received: Receive time of every venue's book
+            created_at: Creation time, defaults to the clock
+        """
+        for name, value in (('version', version), ('quotes', quotes), ('balances', balances),
+                ('received', dict(received or {})),
+                ('created_at', clock.time() if created_at is None else created_at)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+
+        raise AttributeError('MarketSnapshot is immutable')
+
+    def skew(self, names: Optional[Iterable[str]] = None) -> Optional[float]:
+        """
+        Get the spread of the receive times of some venues' books.
+
+        Args:
+            names: Exchange names, defaults to every venue
+
+        Returns:
+            Seconds between the oldest and newest book, or None if fewer
+            than two of the venues have a receive time
+        """
+        keys = self.received if names is None else names
+        times = [ self.received[name] for name in keys if name in self.received ]
+        if len(times) < 2:
+            return None
+        return max(times) - min(times)
+
+    def age(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        Get the age of the oldest book.
+
+        Args:
+            now: Current time, defaults to the clock
+
+        Returns:
+            Seconds since the oldest book was received, or None
+        """
+        if not self.received:
+            return None
+        now = clock.time() if now is None else now
+        return now - min(self.received.values())
+
+    def replace(self, version: int, **fields: Any) -> 'MarketSnapshot':
+        """
+        Get a new version with some fields changed.
+
+        Args:
+            version: Version number of the copy
+            **fields: Fields to change
+
+        Returns:
+            New MarketSnapshot
+        """
+        values = { name: getattr(self, name) for name in ('quotes', 'balances', 'received') }
+        values.update(fields)
+        return MarketSnapshot(version, **values)
+
+
+def _received(quotes: Any) -> Dict[str, float]:
+
+    trace = quotes.trace() if hasattr(quotes, 'trace') else None
+    received = trace.get('received') if isinstance(trace, dict) else None
+    return dict(received) if isinstance(received, dict) else {}
+
+
+class SnapshotBuffer:
+    """
+    Double buffer of market snapshots.
+
+    Writers build the next snapshot aside and publish it by swapping one
+    reference, so readers holding the current snapshot never wait for a
+    writer and never see a half-updated market. The previous version stays
+    available for comparison.
+    """
+
+    def __init__(self) -> None:
+
+        self._current: Optional[MarketSnapshot] = None
+        self._previous: Optional[MarketSnapshot] = None
+        self._version = 0
+        # 書き手同士だけを直列化する
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[MarketSnapshot]:
+
+        return self._current
+
+    def previous(self) -> Optional[MarketSnapshot]:
+
+        return self._previous
+
+    def publish(self, **fields: Any) -> MarketSnapshot:
+        """
+        Publish the next snapshot.
+
+        Fields not given are carried over from the current snapshot, and
+        the receive times are taken from the quotes when they change.
+
+        Args:
+            **fields: quotes, balances or received
+
+        Returns:
+            The published snapshot
+        """
+        if 'quotes' in fields and 'received' not in fields:
+            fields['received'] = _received(fields['quotes'])
+        with self._lock:
+            self._version += 1
+            current = self._current
+            if current is None:
+                snapshot = MarketSnapshot(self._version, fields.get('quotes'),
+                    fields.get('balances'), fields.get('received'))
+            else:
+                snapshot = current.replace(self._version, **fields)
+            self._previous, self._current = current, snapshot
+        return snapshot
@@ -0,0 +1,385 @@
+import os
+import pickle
+import threading
+from bisect import bisect_right, insort
+from math import sqrt
+from typing import Dict, Any, List, Optional, Tuple
+from arbtools import clock
+
+# (買う取引所, 売る取引所)
+Pair = Tuple[str, str]
+
+
+class Ewma:
+    """
+    Exponentially weighted mean and variance of a series.
+    """
+
+    __slots__ = ('mean', 'var', 'samples', '_alpha')
+
+    def __init__(self, alpha: float) -> None:
+
+        self.mean: Optional[float] = None
+        self.var = 0.0
+        self.samples = 0
+        self._alpha = alpha
+
+    def observe(self, x: float) -> None:
+
+        if self.mean is None:
+            self.mean = x
+        else:
+            delta = x - self.mean
+            self.mean += self._alpha * delta
+            self.var = (1.0 - self._alpha) * (self.var + self._alpha * delta * delta)
+        self.samples += 1
+
+    def std(self) -> float:
+
+        return sqrt(self.var)
+
+
+class P2Quantile:
+    """
+    Streaming estimate of one quantile with the P-square algorithm.
+
+    Jain and Chlamtac's method keeps five markers, the minimum, the
+    maximum, the quantile and two points halfway to it, and moves them by
+    piecewise-parabolic interpolation as samples arrive. An update is O(1)
+    and no sample is stored.
+    """
+
+    __slots__ = ('p', 'count', '_q', '_n', '_np', '_dn')
+
+    def __init__(self, p: float) -> None:
+
+        self.p = p
+        self.count = 0
+        self._q: List[float] = []
+        self._n = [0, 1, 2, 3, 4]
+        self._np = [0.0, 2.0 * p, 4.0 * p, 2.0 + 2.0 * p, 4.0]
+        self._dn = [0.0, p / 2.0, p, (1.0 + p) / 2.0, 1.0]
+
+    def observe(self, x: float) -> None:
+
+        self.count += 1
+        q, n = self._q, self._n
+        if len(q) < 5:
+            insort(q, x)
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._np[i] += self._dn[i]
+        for i in (1, 2, 3):
+            d = self._np[i] - n[i]
+            if (d >= 1.0 and n[i + 1] - n[i] > 1) or (d <= -1.0 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                height = self._parabolic(i, step)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = height
+                n[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+
+        q, n = self._q, self._n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self) -> Optional[float]:
+
+        if not self._q:
+            return None
+        if len(self._q) < 5:
+            return self._q[int(round(self.p * (len(self._q) - 1)))]
+        return self._q[2]
+
+
+class WindowedQuantile:
+    """
+    P-square quantile of roughly the latest `window` samples.
+
+    Two sketches are restarted in turn, half a window apart, and the older
+    one answers. The estimate therefore covers between half a window and a
+    whole window of samples, and forgets an old regime within one window.
+    """
+
+    __slots__ = ('p', 'window', '_sketches')
+
+    def __init__(self, p: float, window: int) -> None:
+
+        self.p = p
+        self.window = window
+        self._sketches = [P2Quantile(p)]
+
+    def observe(self, x: float) -> None:
+
+        for sketch in self._sketches:
+            sketch.observe(x)
+        oldest = self._sketches[0]
+        if len(self._sketches) == 1 and oldest.count >= self.window // 2:
+            self._sketches.append(P2Quantile(self.p))
+        elif oldest.count >= self.window:
+            # 古い方を捨て、新しい方が答える
+            self._sketches = [self._sketches[1], P2Quantile(self.p)]
+
+    def value(self) -> Optional[float]:
+
+        return self._sketches[0].value()
+
+    def samples(self) -> int:
+
+        return self._sketches[0].count
+
+
+class PairStats:
+    """
+    Statistics of the fee-adjusted spread of one buy and sell venue pair.
+
+    The spread is the profit rate in percent of buying at the buy venue's
+    best ask and selling at the sell venue's best bid, the same rate
+    TradePlan gives its deals. A run is a stretch of cycles in which that
+    spread stays profitable; `persistence` averages how long runs last.
+    """
+
+    __slots__ = ('ewma', 'quantiles', 'persistence', 'runs', 'since', 'last')
+
+    def __init__(self, quantiles: Tuple[float, ...], *, window: int, alpha: float) -> None:
+
+        self.ewma = Ewma(alpha)
+        self.quantiles = { p: WindowedQuantile(p, window) for p in quantiles }
+        self.persistence = Ewma(alpha)
+        self.runs = 0
+        self.since: Optional[float] = None
+        self.last: Optional[float] = None
+
+    def observe(self, rate: float, now: float) -> None:
+
+        self.ewma.observe(rate)
+        for quantile in self.quantiles.values():
+            quantile.observe(rate)
+        if rate > 0.0:
+            if self.since is None:
+                self.since = now
+        elif self.since is not None:
+            self.persistence.observe(now - self.since)
+            self.runs += 1
+            self.since = None
+        self.last = rate
+
+    def quantile(self, p: float) -> Optional[float]:
+
+        quantile = self.quantiles.get(p)
+        return quantile.value() if quantile else None
+
+    def samples(self) -> int:
+
+        return min(q.samples() for q in self.quantiles.values())
+
+    def stats(self) -> Dict[str, Any]:
+
+        return {
+            'last': self.last,
+            'mean': self.ewma.mean,
+            'std': self.ewma.std(),
+            'samples': self.ewma.samples,
+            'quantiles': { p: self.quantile(p) for p in self.quantiles },
+            'persistence': self.persistence.mean,
+            'runs': self.runs,
+        }
+
+
+class SpreadStats:
+    """
+    Rolling spread statistics of every venue pair, and the trade thresholds
+    derived from them.
+
+    `update` takes one sample of every ordered (buy, sell) pair from a
+    cycle's quotes, so each cycle costs O(1) per pair and no history is
+    kept. The entry rate of a pair is the `entry_quantile` of its recent
+    spreads: deals are taken only when the spread is unusually wide for
+    the current regime. The exit cost of a deal is judged on the reverse
+    pair, whose `exit_quantile` spread is what closing the position
+    typically costs; the share of the entry profit allowed for it becomes
+    the deal's allowed exit cost ratio. Pairs with fewer than
+    `min_samples` samples give no thresholds, and the static ones apply.
+
+    The statistics are pickled by `save_to` and read back by `load_from`,
+    so a restarted bot does not have to warm up again.
+    """
+
+    def __init__(self, fees: Optional[Dict[str, float]] = None, *, window: int = 1000,
+                 entry_quantile: float = 0.9, exit_quantile: float = 0.5,
+                 min_samples: int = 100, min_exit_ratio: float = 10.0) -> None:
+        """
+        Initialize the SpreadStats.
+
+        Args:
+            fees: Trading fees in percent by exchange name
+            window: Samples the quantiles cover; the averages weigh
+                samples with alpha = 2 / (window + 1)
+            entry_quantile: Spread quantile a deal's profit rate has to reach
+            exit_quantile: Reverse spread quantile expected when closing
+            min_samples: Samples of a pair before its thresholds are used,
+                at most half a window
+            min_exit_ratio: Smallest allowed exit cost ratio in percent
+        """
+        self._fees = dict(fees or {})
+        self._window = window
+        self._alpha = 2.0 / (window + 1)
+        self._entry = entry_quantile
+        self._exit = exit_quantile
+        # 分位点は半窓分以上の標本を持つので、それ以上は待たない
+        self._min_samples = min(min_samples, window // 2)
+        self._min_exit_ratio = min_exit_ratio
+        self._pairs: Dict[Pair, PairStats] = {}
+        self._lock = threading.Lock()
+
+    def _rate(self, buy: str, ask: Any, sell: str, bid: Any) -> float:
+
+        fee_buy = self._fees.get(buy, 0.0) / 100.0
+        fee_sell = self._fees.get(sell, 0.0) / 100.0
+        return (bid[0] * (1.0 - fee_sell) - ask[0] * (1.0 + fee_buy)) / ask[0] * 100.0
+
+    def update(self, quotes: Any, now: Optional[float] = None) -> int:
+        """
+        Take one sample of every venue pair.
+
+        Args:
+            quotes: Quotes of this cycle
+            now: Time of the sample, the clock's time if None
+
+        Returns:
+            Number of pairs updated
+        """
+        now = clock.time() if now is None else now
+        asks = { name: quote['ask'] for name, quote in quotes.items() if quote.get('ask') }
+        bids = { name: quote['bid'] for name, quote in quotes.items() if quote.get('bid') }
+        updated = 0
+        with self._lock:
+            for buy, ask in asks.items():
+                for sell, bid in bids.items():
+                    if buy == sell:
+                        continue
+                    pair = self._pairs.get((buy, sell))
+                    if pair is None:
+                        pair = self._pairs[(buy, sell)] = PairStats((self._entry, self._exit),
+                            window=self._window, alpha=self._alpha)
+                    pair.observe(self._rate(buy, ask, sell, bid), now)
+                    updated += 1
+        return updated
+
+    def pair(self, buy: str, sell: str) -> Optional[PairStats]:
+
+        return self._pairs.get((buy, sell))
+
+    def _warm(self, buy: str, sell: str) -> Optional[PairStats]:
+
+        pair = self._pairs.get((buy, sell))
+        return pair if pair and pair.samples() >= self._min_samples else None
+
+    def entry_rate(self, buy: str, sell: str) -> Optional[float]:
+        """
+        Get the profit rate a deal of a pair has to reach.
+
+        Args:
+            buy: Exchange name to buy at
+            sell: Exchange name to sell at
+
+        Returns:
+            Rate in percent, or None before the pair is warm
+        """
+        pair = self._warm(buy, sell)
+        return pair.quantile(self._entry) if pair else None
+
+    def exitcost_ratio(self, buy: str, sell: str, profit_rate: float) -> Optional[float]:
+        """
+        Get the share of a deal's profit its reverse trade may cost.
+
+        Args:
+            buy: Exchange name the deal buys at
+            sell: Exchange name the deal sells at
+            profit_rate: Expected profit rate of the deal in percent
+
+        Returns:
+            Ratio in percent between min_exit_ratio and 100, or None
+            before the reverse pair is warm or for an unprofitable deal
+        """
+        pair = self._warm(sell, buy)
+        if pair is None or profit_rate <= 0.0:
+            return None
+        cost = -pair.quantile(self._exit)
+        return min(100.0, max(self._min_exit_ratio, cost / profit_rate * 100.0))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the statistics of every pair.
+
+        Returns:
+            Statistics by 'buy>sell' pair name
+        """
+        with self._lock:
+            return { '{}>{}'.format(*key): pair.stats() for key, pair in sorted(self._pairs.items()) }
+
+    def gauge(self, kind: str) -> Dict[str, float]:
+        """
+        Get one statistic by pair, for Metrics.gauge.
+
+        Args:
+            kind: 'mean', 'std', 'entry' or 'persistence'
+
+        Returns:
+            Values by 'buy>sell' pair name
+        """
+        values = {}
+        for (buy, sell), pair in list(self._pairs.items()):
+            if kind == 'mean':
+                value = pair.ewma.mean
+            elif kind == 'std':
+                value = pair.ewma.std()
+            elif kind == 'entry':
+                value = self.entry_rate(buy, sell)
+            else:
+                value = pair.persistence.mean
+            if value is not None:
+                values['{}>{}'.format(buy, sell)] = value
+        return values
+
+    def save_to(self, file_name: str) -> 'SpreadStats':
+
+        with self._lock:
+            data = pickle.dumps(self._pairs)
+        # 書き込み中に落ちても前回の統計が残るよう、別ファイルに書いてから置き換える
+        temp_name = file_name + '.tmp'
+        with open(temp_name, 'wb') as f:
+            f.write(data)
+        os.replace(temp_name, file_name)
+        return self
+
+    def load_from(self, file_name: str) -> 'SpreadStats':
+
+        try:
+            with open(file_name, 'rb') as f:
+                pairs = pickle.load(f)
+        except Exception:
+            # 読めない統計は捨てて、何もない状態から始める
+            return self
+        # 設定した分位点を持たない古い統計は捨てる
+        wanted = { self._entry, self._exit }
+        pairs = { key: pair for key, pair in pairs.items() if set(pair.quantiles) == wanted }
+        for pair in pairs.values():
+            # 止まっていた間を利ざやの続いた時間に数えない
+            pair.since = None
+        with self._lock:
+            self._pairs = pairs
+        return self
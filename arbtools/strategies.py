@@ -0,0 +1,184 @@
+from typing import Dict, Any, List, Optional, Tuple
+from arbtools.loop import fetch_market, run_broker
+from arbtools.metrics import span
+
+
+def _select(books: Dict[str, Any], symbols: List[str]) -> Dict[str, Any]:
+
+    # 取引所ごとの板から、探索器が扱う銘柄と取得エラーだけを残す
+    return { name: { k: v for k, v in data.items() if k in symbols or k == 'fetch_orderbooks_error' }
+        for name, data in books.items() }
+
+
+class Strategy:
+    """
+    One trade configuration run by a StrategyRunner.
+    """
+
+    __slots__ = ('name', 'broker', 'share', 'shadow', 'journal', 'cycles')
+
+    def __init__(self, name: str, broker: Any, *, share: float = 1.0, shadow: bool = False,
+                 journal: Optional[str] = None, cycles: Optional[Any] = None) -> None:
+        """
+        Initialize the Strategy.
+
+        Args:
+            name: Strategy name, used as the metrics label
+            broker: Broker of the strategy
+            share: Fraction of the capital the strategy trades with
+            shadow: Whether the strategy only reports its deals
+            journal: File the strategy's requests are saved to
+            cycles: CycleFinder proposing multi-leg deals
+        """
+        self.name = name
+        self.broker = broker
+        self.share = share
+        self.shadow = shadow
+        self.journal = journal
+        self.cycles = cycles
+
+
+class StrategyRunner:
+    """
+    Several strategies trading on one fetch of the market.
+
+    Every cycle the order books and balances, and the books of the cycle
+    symbols, are fetched once through the provider's APIFacade and handed
+    to each strategy's Broker and CycleFinder. A strategy
+    plans with its share of the capital, the free balances plus what the
+    live strategies' open deals hold, less what its own open deals hold,
+    so one strategy's positions never eat into another's share. It keeps
+    its own requests and journal, and shadow strategies plan without
+    ordering, so running more parameter sets does not add market-data or
+    balance calls.
+    """
+
+    def __init__(self, provider: Any, *, price_unit: float = 100,
+                 recorder: Optional[Any] = None, router: Optional[Any] = None,
+                 spreads: Optional[Any] = None) -> None:
+        """
+        Initialize the StrategyRunner.
+
+        Args:
+            provider: Provider shared by the strategies
+            price_unit: Price unit passed to OrderBooks.round
+            recorder: Recorder receiving the rounded books
+            router: SmartRouter splitting the deals of every strategy over
+                several venues
+            spreads: SpreadStats sampling the quotes once per cycle for
+                every strategy
+        """
+        self._provider = provider
+        self._price_unit = price_unit
+        self._recorder = recorder
+        self._router = router
+        self._spreads = spreads
+        self._strategies: Dict[str, Strategy] = {}
+
+    def add(self, name: str, trade: Any, *, share: float = 1.0, shadow: bool = False,
+            journal: Optional[str] = None, cycles: Optional[Any] = None) -> Any:
+        """
+        Add a strategy.
+
+        Args:
+            name: Strategy name
+            trade: Trade configuration of the strategy
+            share: Fraction of the capital the strategy trades with
+            shadow: Whether the strategy only reports its deals
+            journal: File the strategy's requests are saved to and loaded from
+            cycles: CycleFinder proposing multi-leg deals
+
+        Returns:
+            Broker of the strategy, for registering listeners
+
+        Raises:
+            ValueError: If the name is taken, the share is not in (0, 1] or
+                the live strategies would share more than all the capital
+        """
+        if name in self._strategies:
+            raise ValueError('duplicate strategy: {}'.format(name))
+        if not 0.0 < share <= 1.0:
+            raise ValueError('share of {} must be in (0, 1]: {}'.format(name, share))
+        if not shadow:
+            # 影の戦略は資金を使わないので配分に数えない
+            allocated = sum(s.share for s in self._strategies.values() if not s.shadow)
+            if allocated + share > 1.0 + 1e-9:
+                raise ValueError('live strategies share {:.2f} of the capital'.format(allocated + share))
+        broker = self._provider.broker(trade, shadow=shadow)
+        if journal:
+            broker.load_from(journal)
+        self._strategies[name] = Strategy(name, broker, share=share, shadow=shadow,
+            journal=journal, cycles=cycles)
+        return broker
+
+    def strategies(self) -> List[Strategy]:
+
+        return list(self._strategies.values())
+
+    def __getitem__(self, name: str) -> Any:
+
+        return self._strategies[name].broker
+
+    def request_counts(self) -> Dict[str, int]:
+        """
+        Get the number of requests of every live strategy, for Metrics.gauge.
+
+        Returns:
+            Count by strategy name
+        """
+        return { s.name: sum(s.broker.request_counts().values())
+            for s in self._strategies.values() if not s.shadow }
+
+    def request_states(self) -> Dict[Tuple[str, str], int]:
+        """
+        Get the requests of every strategy by state, for Metrics.gauge.
+
+        Returns:
+            Count by (strategy name, state)
+        """
+        return { (s.name, state): n for s in self._strategies.values()
+            for state, n in s.broker.request_counts().items() }
+
+    def queue_depths(self) -> Dict[Tuple[str, str], int]:
+        """
+        Get the waiting events of every strategy's queued listeners, for
+        Metrics.gauge.
+
+        Returns:
+            Queue depth by (strategy name, listener name)
+        """
+        return { (s.name, listener): n for s in self._strategies.values()
+            for listener, n in s.broker.events().queue_depths().items() }
+
+    def run_cycle(self) -> Dict[str, Any]:
+        """
+        Fetch the market once and run every strategy on it.
+
+        Returns:
+            Plan of every strategy by name
+        """
+        plans = {}
+        with span('cycle'):
+            quotes, balances = fetch_market(self._provider, price_unit=self._price_unit,
+                recorder=self._recorder, book=self._router.book() if self._router else None,
+                spreads=self._spreads)
+            finders = [ s.cycles for s in self._strategies.values() if s.cycles ]
+            if finders:
+                # 閉路の板も一度だけ取り、各戦略の探索器に渡す
+                with span('symbol_books'):
+                    symbols = sorted({ symbol for f in finders for symbol in f.symbols() })
+                    books = self._provider.symbol_orderbooks(symbols)
+                    for f in finders:
+                        f.update(_select(books, f.symbols()))
+            # 取引中の資金も元手に数え、各戦略の割合から自分の取引中の分を引く
+            own = { s.name: s.broker.reserved() for s in self._strategies.values() if not s.shadow }
+            reserved: Dict[Tuple[str, str], float] = {}
+            for needs in own.values():
+                for key, amount in needs.items():
+                    reserved[key] = reserved.get(key, 0.0) + amount
+            for s in self._strategies.values():
+                with span('strategy', s.name):
+                    plans[s.name] = run_broker(s.broker, quotes,
+                        balances=balances.partition(s.share, reserved, own.get(s.name)),
+                        cycles=s.cycles, router=self._router, journal=s.journal)
+        return plans
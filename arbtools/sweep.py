@@ -0,0 +1,127 @@
+import os
+import copy
+import itertools
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+from arbtools.backtest import Backtest, exchange_configs
+from arbtools.recorder import RecordReader
+
+
+def grid(params: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Expand lists of parameter values into every combination.
+
+    Args:
+        params: Candidate values by trade parameter name
+
+    Returns:
+        List of parameter dictionaries
+    """
+    keys = list(params.keys())
+    return [ dict(zip(keys, values)) for values in itertools.product(*params.values()) ]
+
+
+# ワーカープロセスごとに一度だけ復号した記録 (板は読むだけなので各点で使い回す)
+_feed: List[Tuple[float, Dict[str, Any]]] = []
+_options: Dict[str, Any] = {}
+
+def _init_worker(root: str, options: Dict[str, Any]) -> None:
+
+    global _feed, _options
+    _feed = list(RecordReader(root).cycles(options['start'], options['end']))
+    _options = options
+
+def _run_point(point: Dict[str, Any]) -> Dict[str, Any]:
+
+    options = _options
+    trade = SimpleNamespace(**{ **options['trade'], **point })
+    feed = _feed
+    # 各点を同じ乱数状態から始め、どの点も同じレイテンシ列で約定させる
+    backtest = Backtest(
+        exchange_configs(options['fees']), trade, feed,
+        balances=options['balances'], **copy.deepcopy(options['backtest']))
+    return { **point, **backtest.run().summary() }
+
+
+class Sweep:
+    """
+    Parameter sweep replaying one recording once per grid point.
+
+    Grid points run in a process pool, one worker per core by default. Every
+    worker decodes the recording once and replays it for each of its points.
+    """
+
+    def __init__(self, root: str, fees: Dict[str, float], balances: Dict[str, Dict[str, float]],
+                 trade: Dict[str, Any], params: Dict[str, List[Any]], *,
+                 start: Optional[float] = None, end: Optional[float] = None,
+                 processes: Optional[int] = None, **backtest: Any) -> None:
+        """
+        Initialize the Sweep.
+
+        Args:
+            root: Directory of the recording
+            fees: Trading fees in percent by exchange name
+            balances: Initial free balances by exchange name and currency
+            trade: Base trade parameters shared by all points
+            params: Candidate values by trade parameter name
+            start: First timestamp in seconds to replay
+            end: Last timestamp in seconds to replay
+            processes: Number of worker processes, defaults to the core count
+            **backtest: Additional arguments for Backtest
+        """
+        self._root = root
+        self._points = grid(params)
+        self._processes = processes or os.cpu_count()
+        self._options = {
+            'fees': fees,
+            'balances': balances,
+            'trade': dict(trade),
+            'start': start,
+            'end': end,
+            'backtest': backtest,
+        }
+
+    def points(self) -> List[Dict[str, Any]]:
+
+        return self._points
+
+    def run(self, rank_by: str = 'pnl') -> List[Dict[str, Any]]:
+        """
+        Run every grid point and rank the results.
+
+        Args:
+            rank_by: Summary key to sort by, highest first
+
+        Returns:
+            List of parameter and summary dictionaries
+        """
+        processes = min(self._processes, len(self._points)) or 1
+        chunksize = max(1, len(self._points) // (processes * 4))
+        initargs = (self._root, self._options)
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=initargs) as executor:
+            rows = list(executor.map(_run_point, self._points, chunksize=chunksize))
+        return sorted(rows, key=lambda row: row[rank_by], reverse=True)
+
+
+def table(rows: List[Dict[str, Any]], columns: Optional[List[str]] = None) -> str:
+    """
+    Format sweep results as a text table.
+
+    Args:
+        rows: Results of Sweep.run
+        columns: Columns to show, defaults to all
+
+    Returns:
+        Table with one line per row
+    """
+    if not rows:
+        return ''
+    columns = columns or list(rows[0].keys())
+    def _cell(value):
+        return '{:.4g}'.format(value) if isinstance(value, float) else str(value)
+    cells = [ [ _cell(row[c]) for c in columns ] for row in rows ]
+    widths = [ max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns) ]
+    lines = [ '|'.join(c.rjust(w) for c, w in zip(columns, widths)) ]
+    lines += [ '|'.join(c.rjust(w) for c, w in zip(r, widths)) for r in cells ]
+    return '\n'.join(lines)
@@ -0,0 +1,97 @@
+import random
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+
+
+class SyntheticBooks:
+    """
+    Generator of random-walk order books for several exchanges.
+
+    All exchanges follow one common mid price; each adds its own mean
+    reverting premium, so prices diverge across venues now and then the
+    way real arbitrage opportunities do. Books have ccxt's layout: asks
+    ascending and bids descending, as [price, volume] lists.
+    """
+
+    def __init__(self, names: List[str], *, depth: int = 20, tick: float = 1.0,
+                 mid: float = 1000000.0, volatility: float = 0.0005,
+                 premium: float = 0.002, volume: float = 0.5,
+                 seed: Optional[int] = None) -> None:
+        """
+        Initialize the SyntheticBooks.
+
+        Args:
+            names: Exchange names
+            depth: Number of levels per side
+            tick: Price step between levels
+            mid: Initial mid price
+            volatility: Standard deviation of the mid price return per step
+            premium: Standard deviation of the per-exchange premium
+            volume: Mean volume per level
+            seed: Random seed for reproducible books
+        """
+        self._names = list(names)
+        self._depth = depth
+        self._tick = tick
+        self._mid = mid
+        self._volatility = volatility
+        self._premium = premium
+        self._volume = volume
+        self._random = random.Random(seed)
+        self._premiums = { name: 0.0 for name in self._names }
+
+    def names(self) -> List[str]:
+
+        return self._names
+
+    def step(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Advance the random walk one step and build new books.
+
+        Returns:
+            Dictionary of order books by exchange name
+        """
+        rnd = self._random
+        self._mid *= 1.0 + rnd.gauss(0.0, self._volatility)
+
+        books = {}
+        for name in self._names:
+            premium = self._premiums[name] * 0.9 + rnd.gauss(0.0, self._premium * 0.44)
+            self._premiums[name] = premium
+            books[name] = self.book(self._mid * (1.0 + premium))
+        return books
+
+    def book(self, mid: float) -> Dict[str, Any]:
+        """
+        Build a book around a mid price.
+
+        Args:
+            mid: Mid price
+
+        Returns:
+            Order book with 'asks' and 'bids'
+        """
+        rnd = self._random
+        tick = self._tick
+        best_bid = (mid // tick) * tick
+        best_ask = best_bid + tick
+        level = lambda: round(rnd.expovariate(1.0 / self._volume), 8) or 1e-8
+        return {
+            'asks': [ [best_ask + i * tick, level()] for i in range(self._depth) ],
+            'bids': [ [best_bid - i * tick, level()] for i in range(self._depth) ],
+        }
+
+    def cycles(self, count: int, *, start: float = 0.0,
+               interval: float = 1.0) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        """
+        Generate books for a number of cycles.
+
+        Args:
+            count: Number of cycles
+            start: Timestamp of the first cycle in seconds
+            interval: Seconds between cycles
+
+        Yields:
+            Tuples of timestamp in seconds and books by exchange name
+        """
+        for i in range(count):
+            yield (start + i * interval, self.step())
@@ -0,0 +1,163 @@
+import os
+import pickle
+from typing import Dict, Any, Iterator, List, Optional
+from arbtools import clock
+
+# 取引データの 'trace' に記録する時刻
+#   received: 取引所ごとの板の受信時刻
+#   rounded:  板を丸めた時刻
+#   planned:  TradePlanを作った時刻
+#   requested: Brokerがリクエストを受け付けた時刻
+#   sent / acked / filled: 注文キーごとの送信・受付・約定確認の時刻
+#   traded: 注文キーごとに取引所が報告した最後の約定時刻(手元の時計に換算)
+
+
+def mark(data: Dict[str, Any], event: str, key: Optional[str] = None,
+         timestamp: Optional[float] = None, *, overwrite: bool = False) -> None:
+    """
+    Record the time of an event in a deal's trace.
+
+    Args:
+        data: Deal data
+        event: Event name, e.g. 'requested' or 'sent'
+        key: Order key for per-leg events
+        timestamp: Time in seconds, defaults to now
+        overwrite: Replace an earlier time of the same event
+    """
+    timestamp = clock.time() if timestamp is None else timestamp
+    trace = data.setdefault('trace', {})
+    if key is None:
+        if overwrite or event not in trace:
+            trace[event] = timestamp
+        return
+    events = trace.setdefault(event, {})
+    if overwrite or key not in events:
+        events[key] = timestamp
+
+def _names(data: Dict[str, Any]) -> list:
+
+    if 'legs' in data:
+        return [ leg['exchange_name'] for leg in data['legs'] ]
+    return [ data[side]['exchange_name'] for side in ('buy', 'sell') if side in data ]
+
+def fill_skew(data: Dict[str, Any]) -> Optional[float]:
+    """
+    Get how far apart the orders of a deal filled.
+
+    Args:
+        data: Deal data
+
+    Returns:
+        Spread of the fill times reported by the exchanges when every order
+        has one, else of the times the fills were seen, or None while an
+        order has not filled
+    """
+    trace = data.get('trace', {})
+    orders = data.get('orders', {})
+    for event in ('traded', 'filled'):
+        times = trace.get(event, {})
+        if orders and all(key in times for key in orders):
+            values = [ times[key] for key in orders ]
+            return max(values) - min(values)
+    return None
+
+def summarize(data: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """
+    Turn a deal's trace into durations between its stages.
+
+    Args:
+        data: Deal data
+
+    Returns:
+        Durations in seconds, None where a stage has not happened:
+        book_age (oldest traded book at planning), skew (receive time spread
+        of the traded books), plan, queue (request to first send), send
+        (spread of the sends), ack (first send to last ack), fill (first ack
+        to last fill), fill_skew (spread of the fills, see fill_skew) and
+        tick_to_trade (oldest traded book to first send)
+    """
+    trace = data.get('trace', {})
+    received = trace.get('received', {})
+    received = [ received[name] for name in _names(data) if received.get(name) ]
+    sent = list(trace.get('sent', {}).values())
+    acked = list(trace.get('acked', {}).values())
+    filled = list(trace.get('filled', {}).values())
+    orders = data.get('orders', {})
+
+    def _between(start, end):
+        return end - start if (start is not None and end is not None) else None
+
+    first = lambda xs: min(xs) if xs else None
+    last = lambda xs: max(xs) if xs else None
+    all_filled = len(filled) >= len(orders) > 0
+
+    return {
+        'book_age': _between(first(received), trace.get('planned')),
+        'skew': _between(first(received), last(received)),
+        'plan': _between(trace.get('rounded'), trace.get('planned')),
+        'queue': _between(trace.get('requested'), first(sent)),
+        'send': _between(first(sent), last(sent)),
+        'ack': _between(first(sent), last(acked)),
+        'fill': _between(first(acked), last(filled)) if all_filled else None,
+        'fill_skew': fill_skew(data),
+        'tick_to_trade': _between(first(received), first(sent)),
+    }
+
+def finished(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Summarize the traces of a finished deal.
+
+    Args:
+        data: Deal data in 'finish_trade'
+
+    Returns:
+        One row per traced deal: the deal a reverse deal closed, then the
+        deal itself. Every row holds deal_id, kind ('open', 'close',
+        'legs' or 'pair'), expected_profit, finished_at and the durations
+        of summarize
+    """
+    now = clock.time()
+    open_deal = data.get('open_deal')
+    if open_deal:
+        deals = [ ('open', open_deal), ('close', data) ]
+    else:
+        deals = [ ('legs' if 'legs' in data else 'pair', data) ]
+    return [ {
+        'deal_id': deal.get('deal_id'),
+        'kind': kind,
+        'expected_profit': deal.get('expected_profit'),
+        'finished_at': now,
+        **summarize(deal),
+    } for kind, deal in deals ]
+
+def append_log(path: str, data: Dict[str, Any]) -> None:
+    """
+    Append the summary of a finished deal to a trace log.
+
+    Args:
+        path: Log file, created if missing
+        data: Deal data in 'finish_trade'
+    """
+    # 一度に書き足すので、途中で落ちても前の行は読める
+    chunk = b''.join(pickle.dumps(row) for row in finished(data))
+    with open(path, 'ab') as f:
+        f.write(chunk)
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read the rows of a trace log.
+
+    Args:
+        path: Log file written by append_log
+
+    Yields:
+        Rows of finished, oldest first; nothing if the file is missing
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                return
@@ -1,7 +1,7 @@
 import uuid
-from collections import defaultdict
 from functools import reduce
 from arbtools.positions import Positions
+from arbtools.records import Deal, Leg
 
 
 class TradePlan:
@@ -12,53 +12,70 @@ class TradePlan:
         self._quotes = quotes
         self._balances = balances
         self._allowed_exitcost_ratio = 50
+        self._trace = {}
 
         def _best(acc, item):
 
-            buy = acc['buy']
-            sell = acc['sell']
-            vol = acc['volume'] or volume
+            buy, sell, vol = acc
+            vol = vol or volume
 
             exchange_name, quote = item
 
             ask = quote['ask']
             bid = quote['bid']
 
-            if ask and ((not buy) or buy['quote'] > ask):
-                buy = { 'exchange_name': exchange_name, 'quote': ask }
+            if ask and ((not buy) or buy.quote > ask):
+                buy = Leg(exchange_name=exchange_name, quote=ask)
                 vol = min(vol, ask[1])
 
-            if bid and ((not sell) or sell['quote'] < bid):
-                sell = { 'exchange_name': exchange_name, 'quote': bid }
+            if bid and ((not sell) or sell.quote < bid):
+                sell = Leg(exchange_name=exchange_name, quote=bid)
                 vol = min(vol, bid[1])
 
-            return { 'buy': buy, 'sell': sell, 'volume': vol }
+            return (buy, sell, vol)
 
-        self._deal = reduce(_best, quotes.items(), defaultdict(lambda: None))
+        if hasattr(quotes, 'best_ask'):
+            # 取引所横断の索引があれば全件を見ずに最良の組を取る
+            self._buy, self._sell, self._volume = self._from_index(quotes, volume)
+        else:
+            self._buy, self._sell, self._volume = reduce(_best, quotes.items(), (None, None, None))
+
+    def _from_index(self, index, volume):
+
+        ask, bid = index.best_ask(), index.best_bid()
+        buy = Leg(exchange_name=ask[0], quote=ask[1]) if ask else None
+        sell = Leg(exchange_name=bid[0], quote=bid[1]) if bid else None
+        if not len(index):
+            return (buy, sell, None)
+        return (buy, sell, min([volume] + [ leg.quote[1] for leg in (buy, sell) if leg ]))
 
 
     def set_allowed_exitcost_ratio(self, ratio):
 
         self._allowed_exitcost_ratio = ratio
 
+    def set_trace(self, trace):
+
+        self._trace = trace
+
     def best(self, side):
 
         side = 'buy' if side in ('buy', 'ask') else 'sell'
 
-        return self._deal[side]
+        return self._buy if side == 'buy' else self._sell
 
     def target_volume(self):
 
-        return self._deal['volume']
+        return self._volume
 
     def available_volume(self):
 
-        return min(self._deal[side]['quote'][1] for side in ('buy', 'sell'))
+        return min(self._buy.quote[1], self._sell.quote[1])
 
     def spread(self):
 
-        buy_price, _ = self._deal['buy']['quote']
-        sell_price, _ = self._deal['sell']['quote']
+        buy_price = self._buy.quote[0]
+        sell_price = self._sell.quote[0]
 
         return buy_price - sell_price
 
@@ -70,19 +87,18 @@ class TradePlan:
 
         volume = self.target_volume()
 
-        def _to_cost(side):
+        def _to_cost(leg):
 
-            name = self._deal[side]['exchange_name']
-            price, _ = self._deal[side]['quote']
+            price = leg.quote[0]
 
-            return (price * volume) * (self._api[name].trading_fees / 100.0)
+            return (price * volume) * (self._api[leg.exchange_name].trading_fees / 100.0)
 
-        return sum(map(_to_cost, ['buy', 'sell']))
+        return sum(map(_to_cost, [self._buy, self._sell]))
 
     def expected_profit(self):
 
         profit = -(self.volumed_spread() + self.trade_cost())
-        buy_price, _ = self._deal['buy']['quote']
+        buy_price = self._buy.quote[0]
         invest = buy_price * self.target_volume()
 
         rate = (profit / invest) * 100.0
@@ -101,10 +117,13 @@ class TradePlan:
         allowed_exitcost = profit * allowed_exitcost_rate
         if profit < 0:
             allowed_exitcost = -(profit * (1.0/allowed_exitcost_rate))
-        return {
-            'deal_id': uuid.uuid4().hex,
-            'expected_profit': profit,
-            'profit_rate': rate,
-            'allowed_exitcost': allowed_exitcost,
-            **self._deal,
-        }
+        return Deal(
+            deal_id=uuid.uuid4().hex,
+            expected_profit=profit,
+            profit_rate=rate,
+            allowed_exitcost=allowed_exitcost,
+            buy=self._buy,
+            sell=self._sell,
+            volume=self._volume,
+            trace=dict(self._trace),
+        )
@@ -1,10 +1,59 @@
 import datetime
 from functools import partial, reduce
 from typing import Dict, List, Callable, Any, Optional, Tuple, Union
+from arbtools import clock
+from arbtools import trace
+from arbtools.metrics import metrics
+from arbtools.records import Leg, Quote, compact_deal
 
 
 JST = datetime.timezone(datetime.timedelta(hours=+9), 'JST')
 
+# 約定・取消などで以後変化しない注文状態
+DONE_STATUSES = ('closed', 'canceled', 'expired', 'rejected')
+
+def trade_option(trade: Any, name: str, default: float) -> float:
+    """
+    Read a numeric trade option, falling back to a default.
+    
+    Args:
+        trade: Trade configuration
+        name: Option name
+        default: Value used when the option is not configured
+        
+    Returns:
+        The configured value or the default
+    """
+    # 設定にない(またはモックの)値は既定値にする
+    value = getattr(trade, name, None)
+    return value if isinstance(value, (int, float)) else default
+
+def _option(kwargs: Dict[str, Any], name: str, default: float) -> float:
+    broker = kwargs.get('broker')
+    return trade_option(broker._trade if broker else None, name, default)
+
+def _deadline(kwargs: Dict[str, Any], name: str, default: float, data: Dict[str, Any]) -> float:
+    # 測った往復時間より短い待ち時間では、約定の知らせが届く前に諦めてしまう
+    deadline = _option(kwargs, name, default)
+    broker = kwargs.get('broker')
+    measured = broker.order_timeout(data) if broker else None
+    return max(deadline, measured) if isinstance(measured, (int, float)) else deadline
+
+def _elapsed(since: Optional[float]) -> float:
+    return clock.time() - since if since is not None else 0.0
+
+def leg_count(data: Dict[str, Any]) -> int:
+    """
+    Get the number of orders a deal places.
+    
+    Args:
+        data: Trade data
+        
+    Returns:
+        Number of legs for multi-leg deals, 2 for buy/sell pairs
+    """
+    return len(data['legs']) if 'legs' in data else 2
+
 def nop(api: Any, status: Tuple[str, Dict[str, Any]], next_state: Optional[str], **kwargs) -> None:
     """
     No-operation function for the state machine.
@@ -36,10 +85,14 @@ def execute_order(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str,
     current_state, data = status
 
     if not 'timestamp' in data:
-        data['timestamp'] = datetime.datetime.now(JST)
+        data['timestamp'] = clock.now(JST)
 
     ordered = data['orders'] if 'orders' in data else None
     orders = api.create_orders(data, ordered)
+    for key, order in orders.items():
+        if 'sent_at' in order:
+            trace.mark(data, 'sent', key, order['sent_at'], overwrite=True)
+            trace.mark(data, 'acked', key, order['acked_at'], overwrite=True)
 
     def _count_open(acc: int, item: Tuple[str, Dict[str, Any]]) -> int:
         """Count the number of successfully opened orders."""
@@ -48,10 +101,15 @@ def execute_order(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str,
             return acc
         return acc + 1
 
-    if reduce(_count_open, orders.items(), 0) < 2:
+    data['orders'] = orders
+    if reduce(_count_open, orders.items(), 0) < leg_count(data):
         next_state = current_state
+        # 発注できない脚が続くなら、出せた脚を取り消して戻す
+        requested = data.get('trace', {}).get('requested')
+        if _elapsed(requested) > _deadline(kwargs, 'open_timeout', 10.0, data):
+            next_state = 'recover'
 
-    return (next_state, { 'orders': orders, **data })
+    return (next_state, data)
 
 def confirm_order(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str, **kwargs) -> Tuple[str, Dict[str, Any]]:
     """
@@ -80,12 +138,220 @@ def confirm_order(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str,
         return acc + (order['status'] == 'closed')
 
     data['orders'] = orders
+    for key, order in orders.items():
+        if order.get('status') == 'closed':
+            trace.mark(data, 'filled', key)
+            if order.get('last_trade'):
+                trace.mark(data, 'traded', key, order['last_trade'])
     broker.emit('confirm_order', data)
-    if reduce(_count_closed, orders.items(), 0) < 2:
-        next_state = current_state
+    closed = reduce(_count_closed, orders.items(), 0)
+    if closed == leg_count(data):
+        # 脚の約定時刻の開きを取引ごとに記録する
+        skew = trace.fill_skew(data)
+        if skew is not None:
+            metrics.observe('fill_skew', skew)
+    if closed < leg_count(data):
+        next_state = 'recover' if _is_stale(data, closed, kwargs) else current_state
 
     return (next_state, data)
 
+def _is_stale(data: Dict[str, Any], closed: int, kwargs: Dict[str, Any]) -> bool:
+    """
+    Tell whether the unfilled legs of a deal should be recovered.
+    
+    A leg is stale when the exchange ended it unfilled, when another leg
+    filled more than 'hedge_timeout' seconds ago, or when nothing completed
+    within 'confirm_timeout' seconds of the last placement. 'hedge_timeout'
+    is raised to the measured order round trip of the deal's venues when
+    that is longer.
+    
+    Args:
+        data: Trade data
+        closed: Number of closed orders
+        kwargs: Arguments of the state function, including the broker
+        
+    Returns:
+        True if the deal should go to 'recover'
+    """
+    orders = data.get('orders', {})
+    if any(order.get('status') in DONE_STATUSES[1:] for order in orders.values()):
+        return True
+    trace_ = data.get('trace', {})
+    filled = trace_.get('filled', {})
+    if closed and filled and _elapsed(min(filled.values())) > _deadline(kwargs, 'hedge_timeout', 10.0, data):
+        return True
+    acked = trace_.get('acked', {})
+    placed = max(acked.values()) if acked else trace_.get('requested')
+    return _elapsed(placed) > _option(kwargs, 'confirm_timeout', 600.0)
+
+def hedge_deadline(data: Dict[str, Any], broker: Any) -> Optional[float]:
+    """
+    Get the time by which a deal's unmatched fill has to be hedged.
+    
+    This is the deadline _is_stale and confirm_recovery check, so the
+    broker can poll the deal by then however far its polls backed off.
+    
+    Args:
+        data: Trade data
+        broker: Broker handling the deal
+        
+    Returns:
+        Time of the deadline, or None if no fill waits for its other legs
+    """
+    trace_ = data.get('trace', {})
+    if data.get('hedges'):
+        since = trace_.get('acked', {}).get(data['hedges'][-1]['leg_id'])
+    else:
+        filled = trace_.get('filled', {})
+        since = min(filled.values()) if filled and len(filled) < leg_count(data) else None
+    if since is None:
+        return None
+    return since + _deadline({'broker': broker}, 'hedge_timeout', 10.0, data)
+
+def net_exposure(data: Dict[str, Any]) -> float:
+    """
+    Get the base currency bought minus sold by the orders of a deal.
+    
+    Args:
+        data: Trade data
+        
+    Returns:
+        Positive if more was bought than sold
+    """
+    total = 0.0
+    for order in data.get('orders', {}).values():
+        filled = order.get('filled') or 0.0
+        total += filled if order.get('side') == 'buy' else -filled
+    return total
+
+def _hedgeable(data: Dict[str, Any]) -> bool:
+    # 分割発注した取引はBTC/JPYだけなので、残りをヘッジできる
+    return 'legs' not in data or all(leg['symbol'] == 'BTC/JPY' for leg in data['legs'])
+
+def _hedge_leg(data: Dict[str, Any], exposure: float, quotes: Any, balances: Any) -> Optional[Leg]:
+    """
+    Pick the venue offsetting an exposure at the best price.
+    
+    Args:
+        data: Trade data
+        exposure: Base currency to sell if positive, to buy if negative
+        quotes: Current market quotes
+        balances: Current account balances
+        
+    Returns:
+        Hedge leg, or None if no venue can take the amount
+    """
+    side = 'sell' if exposure > 0 else 'buy'
+    amount = abs(exposure)
+    best = None
+    for name, quote in (quotes.items() if quotes else []):
+        level = quote['bid'] if side == 'sell' else quote['ask']
+        if not level or level[1] < amount:
+            continue
+        if balances and name in balances:
+            currency, need = ('BTC', amount) if side == 'sell' else ('JPY', level[0] * amount)
+            if balances[name][currency]['free'] < need:
+                continue
+        if best is None or (level[0] > best[1][0] if side == 'sell' else level[0] < best[1][0]):
+            best = (name, level)
+    if best is None:
+        return None
+    name, level = best
+    leg_id = 'hedge{}:{}'.format(len(data.get('hedges') or []), name)
+    return Leg(leg_id=leg_id, exchange_name=name, symbol='BTC/JPY', side=side,
+               quote=Quote(*level), amount=amount)
+
+def recover(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str, **kwargs) -> Tuple[str, Dict[str, Any]]:
+    """
+    Cancel the stale legs of a deal and hedge what filled unmatched.
+    
+    Live orders are canceled first; the deal stays in 'recover' until every
+    cancel is confirmed. A remaining exposure of at least 'min_volume' is
+    then offset by a hedge order at the venue with the best price. Without
+    exposure, a reverse deal that filled nothing goes back to 'close_pair'
+    and any other deal finishes. Multi-leg deals over several symbols are
+    only canceled.
+    
+    Args:
+        api: API facade for exchange communication
+        status: Current state and data tuple
+        next_state: Next state to transition to
+        **kwargs: Additional arguments including broker, quotes, and balances
+        
+    Returns:
+        Tuple of next state and updated data
+    """
+    current_state, data = status
+    broker = kwargs['broker']
+
+    orders = dict(data.get('orders', {}))
+    live = { k: v for k, v in orders.items() if 'id' in v and v.get('status') not in DONE_STATUSES }
+    if live:
+        orders.update(api.cancel_orders(data, live))
+        data['orders'] = orders
+        if any(orders[k].get('status') not in DONE_STATUSES for k in live):
+            return (current_state, data)
+
+    exposure = net_exposure(data)
+    # 多通貨の脚はヘッジせず、取り消しまでで終える
+    if not _hedgeable(data) or abs(exposure) < _option(kwargs, 'min_volume', 0.001):
+        if 'open_deal' in data and not any(o.get('filled') for o in orders.values()):
+            broker.emit('abandoned', data)
+            return ('close_pair', data['open_deal'])
+        broker.emit('recovered', data)
+        return ('finish_trade', data)
+
+    leg = _hedge_leg(data, exposure, kwargs.get('quotes'), kwargs.get('balances'))
+    if leg is None:
+        return (current_state, data)
+    order = api.create_orders({ 'legs': [leg] }, None)[leg['leg_id']]
+    if 'id' not in order:
+        return (current_state, data)
+
+    trace.mark(data, 'sent', leg['leg_id'], order.get('sent_at'))
+    trace.mark(data, 'acked', leg['leg_id'], order.get('acked_at'))
+    data['orders'] = { **orders, leg['leg_id']: order }
+    data['hedges'] = list(data.get('hedges') or []) + [leg]
+    broker.emit('recover', data)
+
+    return (next_state, data)
+
+def confirm_recovery(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str, **kwargs) -> Tuple[str, Dict[str, Any]]:
+    """
+    Confirm the latest hedge order of a deal in recovery.
+    
+    A hedge left unfilled for 'hedge_timeout' seconds goes back to
+    'recover', which cancels it and hedges the rest at the new best price.
+    
+    Args:
+        api: API facade for exchange communication
+        status: Current state and data tuple
+        next_state: Next state to transition to
+        **kwargs: Additional arguments including broker reference
+        
+    Returns:
+        Tuple of next state and updated data
+    """
+    current_state, data = status
+    broker = kwargs['broker']
+
+    orders = api.fetch_orders(data, data['orders'])
+    data['orders'] = orders
+    key = data['hedges'][-1]['leg_id']
+    order = orders.get(key, {})
+    if order.get('status') == 'closed':
+        trace.mark(data, 'filled', key)
+        if abs(net_exposure(data)) < _option(kwargs, 'min_volume', 0.001):
+            broker.emit('recovered', data)
+            return (next_state, data)
+        return ('recover', data)
+
+    acked = data.get('trace', {}).get('acked', {}).get(key)
+    if order.get('status') in DONE_STATUSES or _elapsed(acked) > _deadline(kwargs, 'hedge_timeout', 10.0, data):
+        return ('recover', data)
+
+    return (current_state, data)
+
 def close_pair(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str, **kwargs) -> Tuple[str, Dict[str, Any]]:
     """
     Close a trading pair by planning and executing a reverse trade.
@@ -104,6 +370,10 @@ def close_pair(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str, **
     quotes = kwargs['quotes']
     balances = kwargs['balances']
 
+    if 'open_deal' in data:
+        # 発注途中の反対売買は計画し直さず、残りの脚を出す
+        return execute_order(api, status, next_state, **kwargs)
+
     def _reverse_order(broker: Any, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
         Plan a reverse trade to close the position.
@@ -122,10 +392,8 @@ def close_pair(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str, **
         plan = broker.specified(quotes, buy, sell, volume, balances=balances)
         result = None
         if plan:
-            result = {
-                'open_deal': data,
-                **plan.deal()
-            }
+            result = plan.deal()
+            result['open_deal'] = compact_deal(data)
         return result
 
     result = _reverse_order(broker, data)
@@ -150,8 +418,9 @@ def close_pair(api: Any, status: Tuple[str, Dict[str, Any]], next_state: str, **
         return (allowed_exitcost+expected_profit) >= 0
 
     if can_reverse_trade(result):
+        trace.mark(result, 'requested')
         rev_status = (current_state, result)
-        new_status = execute_order(api, rev_status, next_state)
+        new_status = execute_order(api, rev_status, next_state, **kwargs)
 
     return new_status
 
@@ -168,6 +437,10 @@ def finish_trade(api: Any, status: Tuple[str, Dict[str, Any]], next_state: Optio
     Returns:
         None to indicate the trade is complete
     """
+    broker = kwargs.get('broker')
+    if broker is not None:
+        # 終わった取引の時刻の記録を、取引が消える前に渡す
+        broker.emit('finished', status[1])
     return None
 
 class TradeRule:
@@ -184,6 +457,10 @@ class TradeRule:
         'close_pair': partial(close_pair, next_state='confirm_close'),
         'confirm_close': partial(confirm_order, next_state='finish_trade'),
         'finish_trade': partial(finish_trade, next_state=None),
+        'open_legs': partial(execute_order, next_state='confirm_legs'),
+        'confirm_legs': partial(confirm_order, next_state='finish_trade'),
+        'recover': partial(recover, next_state='confirm_recover'),
+        'confirm_recover': partial(confirm_recovery, next_state='finish_trade'),
     }
 
     def __init__(self, broker: Any) -> None:
@@ -223,12 +500,19 @@ class TradeRule:
         """
         Create a new trade status for the given data.
         
+        Multi-leg deals close themselves when every leg fills, so they skip
+        the reverse trade and go through 'open_legs' and 'confirm_legs'.
+        
         Args:
             data: Trade data to create status for
             
         Returns:
             Tuple of initial state and data
         """
+        if 'legs' in data:
+            self._broker.emit('found_legs', data)
+            return ('open_legs', data)
+
         self._broker.emit('found_open', data)
         return ('open_pair', data)
 
@@ -267,4 +551,8 @@ class TradeRule:
             if new_status and new_status[0] == 'finish_trade':
                 self._broker.emit('close_pair', new_status[1])
 
+        if status_name == 'confirm_legs':
+            if new_status and new_status[0] == 'finish_trade':
+                self._broker.emit('close_legs', new_status[1])
+
         return new_status
@@ -0,0 +1,48 @@
+#!/user/bin/env python
+import argparse
+import config
+from arbtools.backtest import Backtest, exchange_configs
+from arbtools.recorder import RecordReader
+from arbtools.simgw import Latency
+from arbtools.synthetic import SyntheticBooks
+
+
+def feed_from(args, names):
+
+    if args.synthetic:
+        return SyntheticBooks(names, tick=100, seed=args.seed).cycles(args.synthetic)
+    return RecordReader(args.records).cycles(args.start, args.end)
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay market data through the trading logic.')
+    parser.add_argument('records', nargs='?', default='records')
+    parser.add_argument('--start', type=float, default=None)
+    parser.add_argument('--end', type=float, default=None)
+    parser.add_argument('--synthetic', type=int, default=0, help='number of synthetic cycles')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    cfg = config.load()
+    fees = { k: v.fees for k, v in cfg.exchanges.items() if v.enable }
+    params = cfg.backtest
+    balances = { name: { 'JPY': params.jpy, 'BTC': params.btc } for name in fees }
+    latency = Latency(params.latency or 0.0, params.latency_stdev or 0.0, seed=args.seed)
+
+    backtest = Backtest(
+        exchange_configs(fees), cfg.trade, feed_from(args, list(fees)),
+        balances=balances, latency=latency, fill_ratio=params.fill_ratio or 1.0)
+    result = backtest.run()
+
+    for deal in sorted(result.closed(), key=lambda deal: deal['found_at']):
+        row = {
+            'deal_id': deal['deal_id'][:8],
+            'holding': deal['closed_at'] - deal['found_at'],
+            'expected': deal['expected_profit'],
+            'pnl': deal['pnl'],
+        }
+        print("{deal_id}|{holding:9.1f}s|{expected:9.2f}|{pnl:9.2f}".format(**row))
+    for key, value in result.summary().items():
+        print("{:12s}: {}".format(key, value))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/user/bin/env python
+"""
+Benchmarks of the per-cycle hot path on synthetic books.
+
+    python benchmarks/hotpath.py --exchanges 3,10,50 --output baseline.json
+    python benchmarks/hotpath.py --compare baseline.json --threshold 0.2
+
+Results are written as JSON keyed by '<benchmark>/<exchange count>'. In
+compare mode every benchmark slower than the baseline by more than the
+threshold is reported and the exit status is 1. Benchmarks that could not
+run, and keys found on one side only, are listed and marked in the table.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools import simgw
+from arbtools.backtest import exchange_configs
+from arbtools.balances import Balances
+from arbtools.orderbooks import OrderBooks
+from arbtools.provider import Provider
+from arbtools.quotes import Quotes
+from arbtools.records import Deal, Leg, Order, Quote
+from arbtools.synthetic import SyntheticBooks
+from arbtools.tradeplan import TradePlan
+
+
+def measure(f, *, number=None, repeat=5, budget=0.2):
+    # 1回の計測がおよそbudget秒になるように回数を決める
+    if number is None:
+        number = 1
+        while True:
+            started = time.perf_counter()
+            for _ in range(number):
+                f()
+            if time.perf_counter() - started > budget / 10 or number >= 1 << 20:
+                break
+            number *= 2
+        number = max(1, int(number * budget / 10 / max(time.perf_counter() - started, 1e-9)))
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            f()
+        samples.append((time.perf_counter() - started) / number)
+    samples.sort()
+    return {
+        'number': number,
+        'min_us': samples[0] * 1e6,
+        'median_us': samples[len(samples) // 2] * 1e6,
+    }
+
+
+class Fixture:
+    """
+    Provider, Broker and synthetic books for one exchange count.
+    """
+
+    def __init__(self, exchanges, depth, tick, open_deals):
+
+        self.names = [ 'exchange{:02d}'.format(i) for i in range(exchanges) ]
+        self.generator = SyntheticBooks(self.names, depth=depth, tick=tick, seed=exchanges)
+        self.books = self.generator.step()
+        self.market = simgw.install(simgw.SimMarket(
+            { name: { 'JPY': 1e9, 'BTC': 100.0 } for name in self.names }))
+        self.market.update(self.books)
+
+        configs = exchange_configs({ name: 0.1 for name in self.names })
+        self.provider = Provider(configs, gw_name='arbtools.simgw')
+        self.api = self.provider._api
+        self.trade = SimpleNamespace(volume=0.01, target_profit_rate=-100.0,
+            allowed_exitcost_ratio=50, max_order=open_deals + 1)
+        self.broker = self.provider.broker(self.trade)
+
+        self.orderbooks = OrderBooks(self.api, self.books)
+        self.rounded = self.orderbooks.round(tick)
+        self.quotes = self.rounded.quotes()
+        self.balances = Balances(self.api)
+        self.broker._last_quotes = self.quotes
+        self.broker._last_balances = self.balances
+        self.deal = self.plan().deal()
+        self.open_requests = self._open_requests(open_deals)
+
+    def plan(self):
+
+        quotes = self.broker._tradable(0.01, self.quotes, self.balances)
+        return TradePlan(self.api, 0.01, quotes, self.balances)
+
+    def _open_requests(self, count):
+        # 約定しない価格で発注済みの取引を用意する
+        requests = []
+        for i in range(count):
+            buy, sell = self.names[i % len(self.names)], self.names[(i + 1) % len(self.names)]
+            orders = {
+                buy: Order.from_ccxt(self.market.create_order(buy, 'BTC/JPY', 'buy', 0.01, 1.0)),
+                sell: Order.from_ccxt(self.market.create_order(sell, 'BTC/JPY', 'sell', 0.01, 1e12)),
+            }
+            data = Deal(
+                deal_id=str(i),
+                buy=Leg(exchange_name=buy, quote=Quote(1.0, 1.0)),
+                sell=Leg(exchange_name=sell, quote=Quote(1e12, 1.0)),
+                volume=0.01,
+                expected_profit=0.0,
+                profit_rate=0.0,
+                allowed_exitcost=0.0,
+                orders=orders,
+            )
+            requests.append(('confirm_open', data))
+        return requests
+
+
+def benchmarks(fx, tick):
+
+    fx.broker._requests = list(fx.open_requests)
+    book = fx.broker._book
+
+    def request():
+        fx.broker._book = book.copy()
+        fx.broker.request(fx.deal)
+
+    def process_requests():
+        fx.broker._book = book.copy()
+        fx.broker.process_requests()
+
+    def process_requests_due():
+        # 確認の時刻を待たずに、すべての取引の約定を確認させる
+        fx.broker._book = book.copy()
+        for _, data in fx.open_requests:
+            fx.broker._polls.wake(data)
+        fx.broker.process_requests()
+
+    def best_quotes():
+        # 1取引所の板だけが変わったときの索引の更新
+        fx.broker._seen.pop(fx.names[0], None)
+        best = fx.broker._refresh_best(0.01, fx.quotes, fx.balances)
+        return best.best_ask(), best.best_bid()
+
+    def save_to_changed():
+        # 取引が出入りした回の書き込み
+        fx.broker._book = book.copy()
+        fx.broker.save_to(path)
+
+    path = os.path.join(tempfile.mkdtemp(), 'deals.pcl')
+    fx.broker._requests = list(fx.open_requests)
+    fx.broker.save_to(path)
+
+    cases = {
+        'orderbooks_round': lambda: fx.orderbooks.round(tick),
+        'quotes': lambda: Quotes(fx.api, fx.rounded),
+        'broker_tradable': lambda: fx.broker._tradable(0.01, fx.quotes, fx.balances),
+        'best_quotes': best_quotes,
+        'tradeplan_deal': lambda: fx.plan().deal(),
+        'broker_request': request,
+        'process_requests': process_requests,
+        'process_requests_due': process_requests_due,
+        'save_to': lambda: fx.broker.save_to(path),
+        'save_to_changed': save_to_changed,
+        'load_from': lambda: fx.broker.load_from(path),
+    }
+
+    # 実行できない計測は理由とともに返す
+    skipped = {}
+    try:
+        import notificators
+        cases['format_found_open'] = lambda: notificators._format_found_open(fx.deal)
+        cases['format_open'] = lambda: notificators._format_open(fx.deal)
+    except ImportError as e:
+        for name in ('format_found_open', 'format_open'):
+            skipped[name] = str(e)
+
+    return cases, skipped
+
+
+def run(exchange_counts, depth, tick, open_deals, repeat):
+
+    results = {}
+    skipped = {}
+    for count in exchange_counts:
+        fx = Fixture(count, depth, tick, open_deals)
+        cases, reasons = benchmarks(fx, tick)
+        for name, f in cases.items():
+            result = measure(f, repeat=repeat)
+            result.update({ 'exchanges': count, 'depth': depth, 'open_deals': open_deals })
+            results['{}/{}'.format(name, count)] = result
+        for name, reason in reasons.items():
+            skipped['{}/{}'.format(name, count)] = reason
+    for key, reason in sorted(skipped.items()):
+        print('skipped {}: {}'.format(key, reason), file=sys.stderr)
+    return results, skipped
+
+def compare(results, baseline, threshold, skipped=None):
+
+    skipped = skipped or {}
+    regressions = []
+    missing = []
+    new = []
+    for key in sorted(set(results) | set(baseline) | set(skipped)):
+        if key not in results:
+            # 今回測れなかったものも表に残す
+            before = '{:12.2f}'.format(baseline[key]['min_us']) if key in baseline else '{:>12s}'.format('-')
+            flag = 'SKIPPED' if key in skipped else 'MISSING'
+            print('{:32s} {} {:>12s} {:>8s} {}'.format(key, before, '-', '-', flag))
+            if key in baseline:
+                missing.append(key)
+            continue
+        if key not in baseline:
+            after = '{:12.2f}'.format(results[key]['min_us'])
+            print('{:32s} {:>12s} {} {:>8s} {}'.format(key, '-', after, '-', 'NEW'))
+            new.append(key)
+            continue
+        before = baseline[key]['min_us']
+        after = results[key]['min_us']
+        ratio = after / before if before else 1.0
+        flag = 'REGRESSION' if ratio > 1.0 + threshold else ''
+        print('{:32s} {:12.2f} {:12.2f} {:7.2f}x {}'.format(key, before, after, ratio, flag))
+        if flag:
+            regressions.append(key)
+    if missing:
+        print('not measured in this run: {}'.format(', '.join(missing)), file=sys.stderr)
+    if new:
+        print('not in the baseline: {}'.format(', '.join(new)), file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the trading hot path.')
+    parser.add_argument('--exchanges', default='3,10,50')
+    parser.add_argument('--depth', type=int, default=100)
+    parser.add_argument('--tick', type=float, default=1.0)
+    parser.add_argument('--open-deals', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None, help='write results as JSON')
+    parser.add_argument('--compare', default=None, help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    counts = [ int(n) for n in args.exchanges.split(',') ]
+    results, skipped = run(counts, args.depth, args.tick, args.open_deals, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, skipped)
+        sys.exit(1 if regressions else 0)
+
+    if not args.output:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 #!/user/bin/env python
 import pickle
+from arbtools.trace import summarize, read_log
 
 
 def load_deals():
@@ -18,18 +19,37 @@ def singleleg_sides(deal):
                 sides.append(result['side'].lower())
     return sides
 
+def millis(seconds):
+    return '{:8.1f}'.format(seconds * 1000) if seconds is not None else '       -'
+
 def main():
     deals = load_deals()
     for i, deal in enumerate(deals):
         sides = singleleg_sides(deal)
         state_name, data = deal
+        durations = summarize(data)
         args = {
             'n': i,
             'state_name': state_name,
             'sides': '/'.join(sides),
-            'profit': data['expected_profit']
+            'profit': data['expected_profit'],
+            'tick_to_trade': millis(durations['tick_to_trade']),
+            'ack': millis(durations['ack']),
+            'fill': millis(durations['fill']),
+        }
+        print("{n:2d}|{state_name:13s}|{sides:4s}|{profit:7.2f}|{tick_to_trade}|{ack}|{fill}".format(**args))
+    # 終わった取引は取引の一覧から消えるので、記録から読む
+    for i, row in enumerate(read_log('traces.pcl')):
+        args = {
+            'n': i,
+            'kind': row['kind'],
+            'deal_id': (row['deal_id'] or '')[:8],
+            'profit': row['expected_profit'] or 0.0,
+            'tick_to_trade': millis(row['tick_to_trade']),
+            'ack': millis(row['ack']),
+            'fill': millis(row['fill']),
         }
-        print("{n:2d}|{state_name:13s}|{sides:4s}|{profit:7.2f}".format(**args))
+        print("{n:2d}|{kind:5s}|{deal_id:8s}|{profit:7.2f}|{tick_to_trade}|{ack}|{fill}".format(**args))
 
 if __name__ == '__main__':
     main()
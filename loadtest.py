@@ -0,0 +1,85 @@
+#!/user/bin/env python
+import time
+import argparse
+from types import SimpleNamespace
+from arbtools import simhttp
+from arbtools.connections import ConnectionManager
+from arbtools.backtest import exchange_configs
+from arbtools.loop import run_cycle
+from arbtools.metrics import metrics
+from arbtools.provider import Provider
+from arbtools.simgw import Latency
+from arbtools.simserver import ExchangeSimulator
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive the trade loop against local simulated exchanges.')
+    parser.add_argument('--venues', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--interval', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=20.0, help='mean latency in ms')
+    parser.add_argument('--latency-stdev', type=float, default=5.0, help='latency stdev in ms')
+    parser.add_argument('--tail', type=float, default=0.0, help='share of requests 10x slower')
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--hedge', action='store_true', help='hedge slow order book reads')
+    parser.add_argument('--hedge-quantile', type=float, default=0.95)
+    parser.add_argument('--hedge-budget', type=float, default=0.1)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--pool-size', type=int, default=4, help='idle connections kept per venue')
+    parser.add_argument('--processes', action='store_true', help='fetch books in one process per venue')
+    parser.add_argument('--warm', type=int, default=0, help='connections opened per venue before the run')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    names = [ 'venue{:02d}'.format(i) for i in range(args.venues) ]
+    simulator = ExchangeSimulator(names, error_rate=args.error_rate, seed=args.seed,
+        latency=Latency(args.latency / 1000.0, args.latency_stdev / 1000.0,
+            seed=args.seed, tail=args.tail)).start()
+    simhttp.base_url = simulator.base_url()
+    simhttp.timeout = args.timeout
+    simhttp.pool_size = args.pool_size
+
+    connections = ConnectionManager(pool_size=args.pool_size) if args.warm else None
+    provider = Provider(exchange_configs(dict.fromkeys(names, 0.1)), gw_name='arbtools.simhttp',
+        connections=connections)
+    if connections:
+        provider.warm_connections(args.warm)
+    trade = SimpleNamespace(volume=0.01, target_profit_rate=0.1, allowed_exitcost_ratio=50, max_order=5)
+    broker = provider.broker(trade)
+    if args.hedge:
+        provider.hedge_reads(quantile=args.hedge_quantile, budget=args.hedge_budget)
+    shared = None
+    if args.processes:
+        shared = provider.share_books(
+            gw_options={ 'base_url': simhttp.base_url, 'timeout': args.timeout })
+        shared.wait()
+
+    cycles = 0
+    started = time.perf_counter()
+    try:
+        while time.perf_counter() - started < args.duration:
+            run_cycle(provider, broker)
+            cycles += 1
+            if args.interval:
+                time.sleep(args.interval)
+    finally:
+        elapsed = time.perf_counter() - started
+        if shared:
+            shared.stop()
+        simulator.stop()
+
+    print(metrics.format())
+    print('')
+    print('cycles          : {} ({:.1f}/s)'.format(cycles, cycles / elapsed))
+    print('server requests : {} ({:.1f}/s)'.format(simulator.requests, simulator.requests / elapsed))
+    print('server errors   : {}'.format(simulator.errors))
+    print('client requests : {requests}, errors: {errors}, connections: {connections}'.format(**simhttp.stats))
+    print('open requests   : {}'.format(broker.request_counts()))
+    counters = metrics.counters()
+    if args.hedge:
+        hedges = { name: sum(v for (n, _), v in counters.items() if n == name)
+            for name in ('hedged_reads', 'hedge_wins', 'hedge_budget_exhausted') }
+        print('hedges          : {hedged_reads}, won: {hedge_wins}, over budget: {hedge_budget_exhausted}'.format(**hedges))
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,17 @@
 import traceback
 import time
 import datetime
+from functools import partial
 import schedule
 import config
 import cui
 from arbtools import Provider
+from arbtools import trace
+from arbtools.connections import ConnectionManager
+from arbtools.exporter import MetricsExporter
+from arbtools.loop import run_cycle
+from arbtools.metrics import metrics, span
+from arbtools.recorder import Recorder
 from notificators import MutimediaNotificator
 
 
@@ -13,10 +20,15 @@ def scheduled_task(notify):
     msg = cui.get_last_message('show_positions')
     notify.broadcast_message(None, msg)
 
+def show_metrics():
+
+    print(metrics.format())
+
 def planned(sender, plan):
 
-    cui.show_arbitrage(plan)
-    cui.show_positions(plan)
+    with span('cui'):
+        cui.show_arbitrage(plan)
+        cui.show_positions(plan)
 
 def reverse_planned(sender, data):
 
@@ -52,39 +64,152 @@ def close_pair(sender, data, notify):
 
     notify.broadcast_message('close_pair', data)
 
+def recover(sender, data, notify):
+
+    notify.broadcast_message('recover', data)
+
+def recovered(sender, data, notify):
+
+    notify.broadcast_message('recovered', data)
+
+def finished(sender, data):
+
+    # 終わった取引の所要時間をdeals.pyで読めるように残す
+    trace.append_log('traces.pcl', data)
+
+def strategy_trade(base, overrides):
+
+    # 戦略ごとの設定は共通のtrade:に上書きする
+    trade = { k: base[k] for k in base.keys() }
+    trade.update(overrides or {})
+    return config.Property(trade)
+
+def shadow_deal(sender, deal):
+
+    print('shadow', sorted(sender.exchange_pair(deal)), deal['profit_rate'])
+
 def trade_loop(interval):
 
     while True:
 
-        schedule.run_pending()
-
-        quotes = provider.orderbooks().round().quotes()
-        plan = broker.planning(quotes)
+        with span('schedule'):
+            schedule.run_pending()
 
-        broker.request(plan.deal())
-        broker.process_requests().save_to('deals.pcl')
+        if runner:
+            runner.run_cycle()
+        else:
+            run_cycle(provider, broker, recorder=recorder, cycles=cycles, router=router,
+                spreads=spreads, journal='deals.pcl')
 
         time.sleep(interval)
 
 if __name__ == '__main__':
 
     cfg = config.load()
-    notify = MutimediaNotificator(cfg.notify)
+    connections = None
+    if cfg.connections and cfg.connections.enable:
+        connections = ConnectionManager(
+            pool_size=cfg.connections.pool_size or 4,
+            keepalive=cfg.connections.keepalive or 30.0)
+    notify = MutimediaNotificator(cfg.notify, connections=connections)
+    shared = None
+    brokers = []
+    recorder = None
     try:
-        provider = Provider(cfg.exchanges)
-        broker = provider.broker(cfg.trade).load_from('deals.pcl')
-
-        broker.on('planned', planned)
-        broker.on('reverse_planned', reverse_planned)
-        broker.on('confirm_order', confirm_order)
-        broker.on('quote_error', quote_error, notify=notify)
-        broker.on('balance_error', balance_error, notify=notify)
-        broker.on('found_open', found_open, notify=notify)
-        broker.on('open_pair', open_pair, notify=notify)
-        broker.on('found_close', found_close, notify=notify)
-        broker.on('close_pair', close_pair, notify=notify)
+        provider = Provider(cfg.exchanges, connections=connections)
+        if cfg.system.record_dir:
+            recorder = Recorder(cfg.system.record_dir, tick=100)
+        cycles = None
+        cycle_finder = None
+        if cfg.cycles and cfg.cycles.enable:
+            # 見送り中の閉路は戦略ごとに覚えるので、戦略ごとに作る
+            cycle_finder = partial(provider.cycle_finder,
+                list(cfg.cycles.symbols), max_legs=cfg.cycles.max_legs or 3,
+                notional=dict(cfg.cycles.notional or {}), cooldown=cfg.cycles.cooldown or 60.0)
+        router = None
+        if cfg.routing and cfg.routing.enable:
+            router = provider.router(min_volume=cfg.trade.min_volume or 0.001)
+        spreads = None
+        if cfg.spreads and cfg.spreads.enable:
+            spreads = provider.spread_stats(
+                window=cfg.spreads.window or 1000,
+                entry_quantile=cfg.spreads.entry_quantile or 0.9,
+                exit_quantile=cfg.spreads.exit_quantile or 0.5,
+                min_samples=cfg.spreads.min_samples or 100,
+                min_exit_ratio=cfg.spreads.min_exit_ratio or 10.0)
+            spreads.load_from(cfg.spreads.journal or 'spreads.pcl')
+        runner = None
+        if cfg.strategies and cfg.strategies.enable:
+            runner = provider.strategies(recorder=recorder, router=router, spreads=spreads)
+            for s in cfg.strategies.list:
+                runner.add(s['name'], strategy_trade(cfg.trade, s.get('trade')),
+                    share=s.get('share', 1.0), shadow=s.get('shadow', False),
+                    journal=s.get('journal') or 'deals-{}.pcl'.format(s['name']),
+                    cycles=cycle_finder() if cycle_finder else None)
+            brokers = [ s.broker for s in runner.strategies() ]
+            broker = brokers[0]
+        else:
+            broker = provider.broker(cfg.trade).load_from('deals.pcl')
+            brokers = [broker]
+            cycles = cycle_finder() if cycle_finder else None
+        if connections:
+            # 最初の注文が接続を待たないよう起動時につないでおく
+            for k, v in provider.warm_connections(cfg.connections.warm or 2).items():
+                if v:
+                    print(k, v)
+            connections.start()
+        if cfg.system.metrics_port:
+            MetricsExporter(cfg.system.metrics_port).start()
+            if runner:
+                # 戦略ごとの取引と通知の待ち行列を見えるようにする
+                metrics.gauge('requests', runner.request_states, ('strategy', 'state'))
+                metrics.gauge('listener_queue', runner.queue_depths, ('strategy', 'listener'))
+                metrics.gauge('strategy_requests', runner.request_counts, 'strategy')
+            else:
+                metrics.gauge('requests', broker.request_counts, 'state')
+                metrics.gauge('listener_queue', broker.events().queue_depths, 'listener')
+            if connections:
+                metrics.gauge('http_connections', lambda: connections.gauge('connections'), 'name')
+                metrics.gauge('http_requests', lambda: connections.gauge('requests'), 'name')
+        if cfg.hedging and cfg.hedging.enable:
+            provider.hedge_reads(
+                stages=tuple(cfg.hedging.stages or ['fetch_order_book']),
+                quantile=cfg.hedging.quantile or 0.95,
+                budget=cfg.hedging.budget or 0.1)
+        if cfg.latency and cfg.latency.enable:
+            latency = provider.measure_latency(interval=cfg.latency.interval or 10.0)
+            if cfg.system.metrics_port:
+                for kind in ('public', 'private', 'order', 'offset'):
+                    metrics.gauge('latency_' + kind, partial(latency.gauge, kind), 'exchange')
+        if cfg.system.fetch_processes:
+            shared = provider.share_books(interval=cfg.system.fetch_interval or cfg.system.interval)
+            shared.wait()
+        if spreads:
+            for b in brokers:
+                b.set_spreads(spreads)
+            schedule.every(1).minutes.do(spreads.save_to, cfg.spreads.journal or 'spreads.pcl')
+            if cfg.system.metrics_port:
+                for kind in ('mean', 'std', 'entry', 'persistence'):
+                    metrics.gauge('spread_' + kind, partial(spreads.gauge, kind), 'pair')
+
+        for b in brokers:
+            b.on('planned', planned)
+            b.on('reverse_planned', reverse_planned)
+            b.on('confirm_order', confirm_order)
+            b.on('quote_error', quote_error, notify=notify, delivery='queued')
+            b.on('balance_error', balance_error, notify=notify, delivery='queued')
+            b.on('found_open', found_open, notify=notify, delivery='queued')
+            b.on('open_pair', open_pair, notify=notify, delivery='queued')
+            b.on('found_close', found_close, notify=notify, delivery='queued')
+            b.on('close_pair', close_pair, notify=notify, delivery='queued')
+            b.on('recover', recover, notify=notify, delivery='queued')
+            b.on('recovered', recovered, notify=notify, delivery='queued')
+            b.on('shadow_deal', shadow_deal)
+            b.on('finished', finished, delivery='queued')
 
         schedule.every().day.at('07:00').do(scheduled_task, notify=notify)
+        if cfg.system.metrics_interval:
+            schedule.every(cfg.system.metrics_interval).minutes.do(show_metrics)
 
         trade_loop(cfg.system.interval)
 
@@ -92,4 +217,16 @@ if __name__ == '__main__':
         msg = traceback.format_exc()
         notify.broadcast_message(None, msg)
         print(msg)
-
+    finally:
+        for b in brokers:
+            # キューに残った通知を送り切ってから配信スレッドを止める
+            b.events().join()
+            b.events().close()
+        if recorder:
+            # 書きかけのチャンクを索引に載せて閉じる
+            recorder.close()
+        if shared:
+            # 共有メモリを解放して子プロセスを止める
+            shared.stop()
+        if connections:
+            connections.stop()
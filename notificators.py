@@ -1,5 +1,6 @@
 from functools import reduce
 from collections import defaultdict
+from urllib.parse import urlsplit
 import requests
 import json
 
@@ -108,6 +109,38 @@ def _format_close(data):
         "ポジションクローズにより{5:,.0f}円の利益が確定しました。"
     ]).format(*param)
 
+def _format_recover(data):
+    leg = data['hedges'][-1]
+    param = (
+        leg['exchange_name'],
+        leg['side'],
+        leg['quote'][0],
+        leg['amount'],
+        data['deal_id'],
+    )
+    return "\n".join([
+        "<<片側約定のヘッジ>>",
+        "[{0:}] {1:}",
+        "価格: {2:,.0f}",
+        "VOL: {3:}",
+        "取引ID: {4:}",
+    ]).format(*param)
+
+def _format_recovered(data):
+    canceled = [ key for key, order in data.get('orders', {}).items()
+        if order.get('status') == 'canceled' ]
+    param = (
+        len(data.get('hedges') or []),
+        ', '.join(canceled) if canceled else '-',
+        data['deal_id'],
+    )
+    return "\n".join([
+        "<<片側約定のリカバリ完了>>",
+        "ヘッジ注文: {0:}",
+        "取消注文: {1:}",
+        "取引ID: {2:}",
+    ]).format(*param)
+
 class Notificator:
 
     def __init__(self):
@@ -116,7 +149,9 @@ class Notificator:
             'found_open': self._format_found_open,
             'open_pair': self._format_open,
             'found_close': self._format_found_close,
-            'close_pair': self._format_close
+            'close_pair': self._format_close,
+            'recover': self._format_recover,
+            'recovered': self._format_recovered,
         }
 
     def _format_open(self, data):
@@ -130,10 +165,22 @@ class Notificator:
 
     def _format_found_close(self, data):
         return _format_found_close(data)
+
+    def _format_recover(self, data):
+        return _format_recover(data)
+
+    def _format_recovered(self, data):
+        return _format_recovered(data)
     
     def _post_message(self, message):
         raise NotImplementedError("Subclasses must implement _post_message")
 
+    def ping(self):
+
+        # 通知せずに接続だけ保つため、通知先のホストにHEADを送る
+        url = urlsplit(self.url)
+        return self._session.head('{}://{}/'.format(url.scheme, url.netloc), timeout=10)
+
     def post_message(self, trigger_name, data):
         func = self._formatter.get(trigger_name, lambda x: str(x))
         message = func(data)
@@ -143,9 +190,11 @@ class Notificator:
 
 class LINENotificator(Notificator):
 
-    def __init__(self, params):
+    def __init__(self, params, session=None):
 
         super().__init__()
+        # セッションが無ければ毎回接続するrequestsの関数を使う
+        self._session = session or requests
         self.enable = params.enable
         self.token = params.token
         self.url = params.url
@@ -160,13 +209,14 @@ class LINENotificator(Notificator):
             'files': None
         }
 
-        return requests.post(self.url, **payload)
+        return self._session.post(self.url, **payload)
 
 class SlackNotificator(Notificator):
 
-    def __init__(self, params):
+    def __init__(self, params, session=None):
         super().__init__()
 
+        self._session = session or requests
         self.enable = params.enable
         self.url = params.url
 
@@ -177,7 +227,7 @@ class SlackNotificator(Notificator):
             "icon_emoji": ":moneybag:",
         }
 
-        requests.post(self.url, json.dumps(payload))
+        self._session.post(self.url, json.dumps(payload))
 
 
 class MutimediaNotificator:
@@ -187,12 +237,16 @@ class MutimediaNotificator:
         'slack': SlackNotificator,
     }
 
-    def __init__(self, notify_params):
+    def __init__(self, notify_params, connections=None):
 
         def instantie(acc, item):
             name, params = item
             if params.enable:
-                acc[name] = self.classes[name](params)
+                # 通知先ごとに接続を使い回す
+                session = connections.session('notify_' + name) if connections else None
+                acc[name] = self.classes[name](params, session=session)
+                if connections:
+                    connections.watch('notify_' + name, acc[name].ping)
             return acc
         self._notificators = reduce(instantie, notify_params.items(), {})
 
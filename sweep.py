@@ -0,0 +1,38 @@
+#!/user/bin/env python
+import argparse
+import yaml
+import config
+from arbtools.simgw import Latency
+from arbtools.sweep import Sweep, table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep trade parameters over recorded data.')
+    parser.add_argument('grid', help='YAML file of candidate values by trade parameter')
+    parser.add_argument('records', nargs='?', default='records')
+    parser.add_argument('--start', type=float, default=None)
+    parser.add_argument('--end', type=float, default=None)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rank-by', default='pnl')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.grid) as f:
+        params = yaml.safe_load(f)
+
+    cfg = config.load()
+    fees = { k: v.fees for k, v in cfg.exchanges.items() if v.enable }
+    bt = cfg.backtest
+    balances = { name: { 'JPY': bt.jpy, 'BTC': bt.btc } for name in fees }
+    trade = { k: cfg.trade[k] for k in cfg.trade.keys() }
+
+    sweep = Sweep(args.records, fees, balances, trade, params,
+        start=args.start, end=args.end, processes=args.processes,
+        latency=Latency(bt.latency or 0.0, bt.latency_stdev or 0.0, seed=args.seed),
+        fill_ratio=bt.fill_ratio or 1.0)
+    rows = sweep.run(rank_by=args.rank_by)
+    print(table(rows[:args.top]))
+
+if __name__ == '__main__':
+    main()
@@ -38,6 +38,25 @@ class TestAPIFacade(unittest.TestCase):
         
         self.assertEqual(self.api_facade._product, 'BTC/JPY')
 
+    def test_connections(self):
+        """Test that exchanges get pooled sessions and keep-alive pings."""
+        connections = MagicMock()
+        with patch.dict('sys.modules', {'test_gw': self.mock_gw}):
+            api_facade = APIFacade(self.exchange_config, 'test_gw', connections=connections)
+
+        options = self.mock_gw.exchange1.call_args[0][0]
+        self.assertEqual(options['session'], connections.session.return_value)
+        self.assertEqual(connections.watch.call_count, 2)
+
+        ping = dict(c[0] for c in connections.watch.call_args_list)['exchange1']
+        self.mock_exchange1.has = {'fetchTime': False}
+        ping()
+        self.mock_exchange1.load_markets.assert_called_once()
+        self.mock_exchange1.fetch_order_book.assert_called_once_with('BTC/JPY')
+
+        api_facade.warm_connections(3)
+        connections.warm.assert_called_once_with(3)
+
     def test_names_and_keys(self):
         """Test names and keys methods."""
         self.assertEqual(set(self.api_facade.names()), {'exchange1', 'exchange2'})
@@ -83,6 +102,17 @@ class TestAPIFacade(unittest.TestCase):
         self.assertEqual(result['exchange1']['bids'], [[100, 1]])
         self.assertEqual(result['exchange2']['asks'], [[102, 1]])
 
+    def test_fetch_orderbooks_leaves_gateway_book(self):
+        """Test that the receive time is not written into the gateway's book."""
+        book = {'bids': [[100, 1]], 'asks': [[101, 1]]}
+        self.mock_exchange1.fetch_order_book.return_value = book
+        self.mock_exchange2.fetch_order_book.return_value = book
+
+        result = self.api_facade.fetch_orderbooks()
+
+        self.assertIn('received_at', result['exchange1'])
+        self.assertEqual(book, {'bids': [[100, 1]], 'asks': [[101, 1]]})
+
     def test_fetch_orderbooks_error_handling(self):
         """Test fetch_orderbooks error handling."""
         self.mock_exchange1.fetch_order_book.side_effect = Exception("Test error")
@@ -117,6 +147,24 @@ class TestAPIFacade(unittest.TestCase):
         self.assertIn('fetch_balances_error', result['exchange1'])
         self.assertEqual(result['exchange1']['fetch_balances_error'], "Test error")
 
+    def test_fetch_market(self):
+        """Test that books and balances are fetched in one fan-out."""
+        self.mock_exchange1.fetch_order_book.return_value = {'bids': [[100, 1]], 'asks': [[101, 1]]}
+        self.mock_exchange2.fetch_order_book.side_effect = Exception("Test error")
+        self.mock_exchange1.fetch_balance.return_value = {'JPY': 100000, 'BTC': 1.0}
+        self.mock_exchange2.fetch_balance.return_value = {'JPY': 200000, 'BTC': 2.0}
+
+        books, balances = self.api_facade.fetch_market()
+
+        self.assertEqual(books['exchange1']['asks'], [[101, 1]])
+        self.assertEqual(books['exchange2']['fetch_orderbooks_error'], "Test error")
+        self.assertEqual(balances['exchange2']['JPY'], 200000)
+
+        books, balances = self.api_facade.fetch_market(orderbooks=False)
+        self.assertEqual(books, {})
+        self.assertEqual(self.mock_exchange1.fetch_order_book.call_count, 1)
+        self.assertEqual(balances['exchange1']['BTC'], 1.0)
+
     def test_create_orders_params(self):
         """Test _create_orders_params method."""
         data = {
@@ -148,5 +196,41 @@ class TestAPIFacade(unittest.TestCase):
         self.assertEqual(result['exchange2']['amount'], 0.01)
         self.assertEqual(result['exchange2']['price'], 101)
 
+    def test_create_orders_legs(self):
+        """Test create_orders with a multi-leg deal."""
+        self.mock_exchange1.create_order.side_effect = lambda **args: {'id': args['symbol']}
+        data = {
+            'legs': [
+                {'leg_id': '0:exchange1', 'exchange_name': 'exchange1', 'symbol': 'BTC/JPY',
+                 'side': 'sell', 'quote': [100, 1.0], 'amount': 0.01},
+                {'leg_id': '1:exchange1', 'exchange_name': 'exchange1', 'symbol': 'ETH/JPY',
+                 'side': 'buy', 'quote': [10, 1.0], 'amount': 0.1},
+            ],
+        }
+        
+        result = self.api_facade.create_orders(data, None)
+        
+        self.assertEqual(self.mock_exchange1.create_order.call_count, 2)
+        self.assertEqual(result['0:exchange1']['id'], 'BTC/JPY')
+        self.assertEqual(result['1:exchange1']['id'], 'ETH/JPY')
+
+    def test_cancel_orders(self):
+        """Test cancel_orders reads back the final state of every order."""
+        self.mock_exchange1.cancel_order.side_effect = Exception("Test error")
+        self.mock_exchange1.fetch_order.return_value = {'id': 'order1', 'status': 'closed', 'info': {}}
+        self.mock_exchange2.fetch_order.return_value = {'id': 'order2', 'status': 'canceled'}
+        data = {
+            'buy': {'exchange_name': 'exchange1', 'quote': [100, 1.0]},
+            'sell': {'exchange_name': 'exchange2', 'quote': [101, 1.0]},
+        }
+        
+        result = self.api_facade.cancel_orders(data, {
+            'exchange1': {'id': 'order1'}, 'exchange2': {'id': 'order2'}})
+        
+        self.mock_exchange2.cancel_order.assert_called_once_with('order2', 'BTC/JPY')
+        self.assertEqual(result['exchange1']['status'], 'closed')
+        self.assertEqual(result['exchange2']['status'], 'canceled')
+        self.assertNotIn('info', result['exchange1'])
+
 if __name__ == '__main__':
     unittest.main()
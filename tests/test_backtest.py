@@ -0,0 +1,104 @@
+import unittest
+from types import SimpleNamespace
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools import clock
+from arbtools.backtest import Backtest, exchange_configs, realized_pnl
+from arbtools.simgw import SimMarket, Latency
+from arbtools.synthetic import SyntheticBooks
+
+class TestSimMarket(unittest.TestCase):
+    """Test cases for the SimMarket class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.clock = clock.VirtualClock(100.0)
+        self.previous = clock.set_clock(self.clock)
+        self.market = SimMarket({'exchange1': {'JPY': 1000.0, 'BTC': 0.0}},
+            fees={'exchange1': 1.0}, latency=Latency(0.5))
+        self.market.update({'exchange1': {'asks': [[100, 1.0]], 'bids': [[99, 1.0]]}})
+
+    def tearDown(self):
+        clock.set_clock(self.previous)
+
+    def test_fill_after_latency(self):
+        """Test that orders fill only after their latency has elapsed."""
+        order = self.market.create_order('exchange1', 'BTC/JPY', 'buy', 0.5, 100)
+        self.assertEqual(self.market.fetch_order(order['id'])['status'], 'open')
+
+        self.clock.advance(0.5)
+        order = self.market.fetch_order(order['id'])
+        self.assertEqual(order['status'], 'closed')
+        self.assertEqual(order['filled'], 0.5)
+
+        balance = self.market.balance('exchange1')
+        self.assertEqual(balance['BTC']['free'], 0.5)
+        self.assertAlmostEqual(balance['JPY']['free'], 1000.0 - 50.0 - 0.5)
+
+    def test_no_fill_without_cross(self):
+        """Test that orders away from the book stay open."""
+        order = self.market.create_order('exchange1', 'BTC/JPY', 'sell', 0.5, 105)
+        self.clock.advance(1.0)
+        self.assertEqual(self.market.fetch_order(order['id'])['status'], 'open')
+        self.assertEqual(self.market.cancel_order(order['id'])['status'], 'canceled')
+
+class TestBacktest(unittest.TestCase):
+    """Test cases for the Backtest class."""
+
+    def test_realized_pnl(self):
+        """Test realized_pnl over the open and reverse deals."""
+        data = {
+            'orders': {
+                'exchange1': {'side': 'sell', 'price': 101, 'filled': 1.0, 'fee': {'cost': 1.0}},
+                'exchange2': {'side': 'buy', 'price': 100, 'filled': 1.0},
+            },
+            'open_deal': {
+                'orders': {
+                    'exchange1': {'side': 'buy', 'price': 100, 'filled': 1.0},
+                    'exchange2': {'side': 'sell', 'price': 102, 'filled': 1.0},
+                },
+            },
+        }
+        self.assertEqual(realized_pnl(data), 2.0)
+
+    def test_run(self):
+        """Test a replay of synthetic books."""
+        names = ['exchange1', 'exchange2', 'exchange3']
+        feed = SyntheticBooks(names, premium=0.004, seed=1).cycles(300, start=1000.0)
+        trade = SimpleNamespace(volume=0.01, target_profit_rate=0.1,
+            allowed_exitcost_ratio=50, max_order=3)
+        balances = { name: {'JPY': 1000000.0, 'BTC': 1.0} for name in names }
+
+        backtest = Backtest(exchange_configs(dict.fromkeys(names, 0.0)), trade, feed,
+            balances=balances)
+        result = backtest.run()
+        summary = result.summary()
+
+        self.assertEqual(summary['cycles'], 300)
+        self.assertGreater(summary['deals'], 0)
+        for deal in result.closed():
+            self.assertGreaterEqual(deal['closed_at'], deal['found_at'])
+        self.assertIsInstance(clock.get_clock(), clock.SystemClock)
+
+    def test_run_with_spreads(self):
+        """Test a replay whose thresholds come from spread statistics."""
+        names = ['exchange1', 'exchange2']
+        feed = SyntheticBooks(names, premium=0.004, seed=1).cycles(300, start=1000.0)
+        trade = SimpleNamespace(volume=0.01, target_profit_rate=0.1,
+            allowed_exitcost_ratio=50, max_order=3)
+        balances = { name: {'JPY': 1000000.0, 'BTC': 1.0} for name in names }
+
+        backtest = Backtest(exchange_configs(dict.fromkeys(names, 0.0)), trade, feed,
+            balances=balances, spreads={'window': 100, 'min_samples': 20})
+        backtest.run()
+
+        stats = backtest.spreads.stats()
+        self.assertEqual(sorted(stats), ['exchange1>exchange2', 'exchange2>exchange1'])
+        self.assertEqual(stats['exchange1>exchange2']['samples'], 300)
+        self.assertIsNotNone(backtest.spreads.entry_rate('exchange1', 'exchange2'))
+
+if __name__ == '__main__':
+    unittest.main()
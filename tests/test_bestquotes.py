@@ -0,0 +1,58 @@
+import unittest
+import random
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.bestquotes import BestQuotes
+from arbtools.records import Quote
+from arbtools.tradeplan import TradePlan
+
+class TestBestQuotes(unittest.TestCase):
+    """Test cases for the cross-venue best quote index."""
+
+    def test_update_and_remove(self):
+        """Test that updates and removals move the best pair."""
+        index = BestQuotes()
+        index.update('exchange1', Quote(100, 1.0), Quote(99, 1.0))
+        index.update('exchange2', Quote(101, 1.0), Quote(100, 1.0))
+        self.assertEqual(index.best_ask(), ('exchange1', Quote(100, 1.0)))
+        self.assertEqual(index.best_bid(), ('exchange2', Quote(100, 1.0)))
+
+        index.update('exchange1', None, Quote(99, 1.0))
+        self.assertEqual(index.best_ask(), ('exchange2', Quote(101, 1.0)))
+        self.assertEqual((index.long, index.short), (0b10, 0b11))
+
+        index.remove('exchange2')
+        self.assertIsNone(index.best_ask())
+        self.assertEqual(index.best_bid(), ('exchange1', Quote(99, 1.0)))
+        self.assertNotIn('exchange2', index)
+
+    def test_matches_tradeplan(self):
+        """Test that the index picks the same legs as a full scan."""
+        rng = random.Random(1)
+        names = [ 'exchange{}'.format(i) for i in range(8) ]
+        index = BestQuotes()
+        quotes = {}
+        for _ in range(500):
+            name = rng.choice(names)
+            ask = Quote(rng.randint(100, 110), rng.choice([1.0, 2.0])) if rng.random() > 0.2 else None
+            bid = Quote(rng.randint(95, 105), rng.choice([1.0, 2.0])) if rng.random() > 0.2 else None
+            if rng.random() < 0.05:
+                quotes.pop(name, None)
+                index.remove(name)
+            else:
+                quotes[name] = { 'ask': ask, 'bid': bid }
+                index.update(name, ask, bid)
+            ordered = { n: quotes[n] for n in sorted(quotes, key=index._bits.get) }
+
+            scan = TradePlan(None, 0.5, ordered, None)
+            indexed = TradePlan(None, 0.5, index, None)
+            self.assertEqual(indexed.best('buy'), scan.best('buy'))
+            self.assertEqual(indexed.best('sell'), scan.best('sell'))
+            self.assertEqual(indexed.target_volume(), scan.target_volume())
+        self.assertLessEqual(len(index._asks), 2 * len(index) + 65)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,6 @@
 import unittest
 from unittest.mock import MagicMock, patch
 import pickle
-from collections import defaultdict
 import sys
 import os
 
@@ -24,7 +23,6 @@ class TestBroker(unittest.TestCase):
         """Test broker initialization."""
         self.assertEqual(self.broker._api, self.api)
         self.assertEqual(self.broker._trade, self.trade)
-        self.assertIsInstance(self.broker._listeners, defaultdict)
         self.assertEqual(self.broker._requests, [])
         self.assertIsNone(self.broker._last_quotes)
         self.assertIsNone(self.broker._last_balances)
@@ -38,10 +36,10 @@ class TestBroker(unittest.TestCase):
         callback = MagicMock()
         self.broker.on('test_event', callback)
         
-        self.assertEqual(self.broker._listeners['test_event'], callback)
+        self.assertEqual([ s.f for s in self.broker.events().subscriptions() ], [callback])
         
         self.broker.on('test_event_with_kwargs', callback, param='value')
-        self.broker._listeners['test_event_with_kwargs'](self.broker, 'arg')
+        self.broker.emit('test_event_with_kwargs', 'arg')
         callback.assert_called_with(self.broker, 'arg', param='value')
 
     def test_emit_method(self):
@@ -51,9 +49,9 @@ class TestBroker(unittest.TestCase):
         self.broker.emit('test_event', 'test_arg')
         callback.assert_called_once_with(self.broker, 'test_arg')
 
-    def test_defaultdict_implementation(self):
-        """Test that the defaultdict implementation works correctly."""
-        result = self.broker._listeners['non_existent_event'](self.broker, 'arg')
+    def test_emit_without_listener(self):
+        """Test that an event without listeners is ignored."""
+        result = self.broker.emit('non_existent_event', 'arg')
         self.assertIsNone(result)  # Should return None and not raise an error
 
     def test_specified_with_none_quotes(self):
@@ -101,5 +99,18 @@ class TestBroker(unittest.TestCase):
                 self.broker.load_from('test_file.pcl')
                 mock_load.assert_called_once()
 
+    def test_save_unchanged(self):
+        """Test that save_to skips the write while no request moved."""
+        with patch('builtins.open', MagicMock()):
+            with patch('pickle.dump') as mock_dump:
+                self.broker.save_to('test_file.pcl')
+                self.broker.save_to('test_file.pcl')
+                self.assertEqual(mock_dump.call_count, 1)
+
+                self.broker._book.append(('open_pair', {'deal_id': '1'}))
+                self.broker.save_to('test_file.pcl')
+                self.broker.save_to('other_file.pcl')
+                self.assertEqual(mock_dump.call_count, 3)
+
 if __name__ == '__main__':
     unittest.main()
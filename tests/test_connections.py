@@ -0,0 +1,63 @@
+import unittest
+import time
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools import connections
+from arbtools.connections import ConnectionManager
+
+class TestConnectionManager(unittest.TestCase):
+    """Test cases for pooled connections and keep-alive pings."""
+
+    def setUp(self):
+        """Set up a manager watching one exchange."""
+        self.manager = ConnectionManager(pool_size=2, keepalive=0.05)
+        self.pings = 0
+        self.lock = threading.Lock()
+        self.manager.watch('exchange1', self._ping)
+
+    def tearDown(self):
+        self.manager.stop()
+
+    def _ping(self):
+        with self.lock:
+            self.pings += 1
+
+    def test_warm(self):
+        """Test that warming pings every name as many times as asked."""
+        self.assertEqual(self.manager.warm(concurrency=3), {'exchange1': None})
+        self.assertEqual(self.pings, 3)
+        self.assertEqual(self.manager.stats()['exchange1']['pings'], 3)
+
+    def test_warm_errors(self):
+        """Test that failed warm-ups are reported by name."""
+        def _fail():
+            raise Exception('refused')
+        self.manager.watch('exchange2', _fail)
+        errors = self.manager.warm(concurrency=1)
+        self.assertEqual(errors, {'exchange1': None, 'exchange2': 'refused'})
+        self.assertEqual(self.manager.stats()['exchange2']['errors'], 1)
+
+    def test_keepalive(self):
+        """Test that only idle names are pinged."""
+        self.assertEqual(self.manager.idle(), ['exchange1'])
+        self.manager.used('exchange1')
+        self.assertEqual(self.manager.idle(), [])
+
+        self.manager.start()
+        time.sleep(0.2)
+        self.assertGreater(self.pings, 0)
+
+    @unittest.skipIf(connections.requests is None, 'requests is not installed')
+    def test_session(self):
+        """Test that every name gets its own pooled session."""
+        session = self.manager.session('exchange1')
+        self.assertIs(self.manager.session('exchange1'), session)
+        self.assertIsNot(self.manager.session('notify_slack'), session)
+        self.assertEqual(self.manager.stats()['notify_slack']['connections'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools import clock
+from arbtools.balances import Balances
+from arbtools.cycles import CycleFinder
+from arbtools.provider import Provider
+
+class TestCycleFinder(unittest.TestCase):
+    """Test cases for the CycleFinder class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.api = MagicMock()
+        self.exchanges = {
+            'exchange1': MagicMock(trading_fees=0.0),
+            'exchange2': MagicMock(trading_fees=0.0),
+        }
+        self.api.__getitem__.side_effect = lambda name: self.exchanges[name]
+        self.finder = CycleFinder(self.api, ['BTC/JPY', 'ETH/JPY', 'ETH/BTC'])
+
+    def books(self, eth_btc_bid=0.06):
+        return {
+            'exchange1': {
+                'BTC/JPY': {'asks': [[1000000, 1.0]], 'bids': [[999000, 1.0]]},
+                'ETH/JPY': {'asks': [[50100, 10.0]], 'bids': [[50000, 10.0]]},
+            },
+            'exchange2': {
+                'ETH/BTC': {'asks': [[0.0501, 10.0]], 'bids': [[eth_btc_bid, 10.0]]},
+            },
+        }
+
+    def test_finds_triangular_cycle(self):
+        """Test that a profitable three-leg cycle is detected."""
+        self.finder.update(self.books())
+        cycles = self.finder.cycles()
+
+        self.assertEqual(len(cycles), 1)
+        edges, weight = cycles[0]
+        self.assertEqual(len(edges), 3)
+        self.assertLess(weight, 0)
+
+    def test_multi_level_books(self):
+        """Test that edges are priced from the best level of unrounded books."""
+        books = self.books()
+        books['exchange1']['BTC/JPY']['asks'].append([1100000, 5.0])
+        books['exchange1']['BTC/JPY']['bids'].append([900000, 5.0])
+        books['exchange2']['ETH/BTC']['asks'].append([0.07, 50.0])
+        books['exchange2']['ETH/BTC']['bids'].append([0.04, 50.0])
+        self.finder.update(books)
+
+        self.assertEqual(len(self.finder.cycles()), 1)
+        legs = { leg['symbol']: leg for leg in self.finder.deals(0.01)[0]['legs'] }
+        self.assertEqual(legs['ETH/BTC']['quote'], (0.06, 10.0))
+        self.assertEqual(legs['BTC/JPY']['quote'], (999000, 1.0))
+
+    def test_no_single_symbol_cycle(self):
+        """Test that a two-venue spread on one symbol is left to pair deals."""
+        self.finder.update({
+            'exchange1': {'BTC/JPY': {'asks': [[1000000, 1.0]], 'bids': [[999000, 1.0]]}},
+            'exchange2': {'BTC/JPY': {'asks': [[1020000, 1.0]], 'bids': [[1010000, 1.0]]}},
+        })
+
+        self.assertEqual(self.finder.cycles(), [])
+
+    def test_no_cycle_without_edge(self):
+        """Test that fair books produce no cycle."""
+        self.finder.update(self.books(eth_btc_bid=0.05))
+        self.assertEqual(self.finder.cycles(), [])
+
+    def test_incremental_update(self):
+        """Test that changed edges invalidate and re-evaluate cycles."""
+        self.finder.update(self.books())
+        self.assertEqual(len(self.finder.cycles()), 1)
+
+        self.finder.update({'exchange2': self.books(eth_btc_bid=0.05)['exchange2']})
+        self.assertEqual(self.finder.cycles(), [])
+
+        self.finder.update({'exchange2': self.books()['exchange2']})
+        self.assertEqual(len(self.finder.cycles()), 1)
+
+    def test_deals(self):
+        """Test multi-leg deal construction."""
+        self.finder.update(self.books())
+        deals = self.finder.deals(0.01)
+
+        self.assertEqual(len(deals), 1)
+        deal = deals[0]
+        self.assertEqual(len(deal['legs']), 3)
+        self.assertGreater(deal['expected_profit'], 0)
+        self.assertGreater(deal['profit_rate'], 0)
+        self.assertEqual(len({leg['leg_id'] for leg in deal['legs']}), 3)
+
+    def test_start_amount(self):
+        """Test that the volume is converted to the cycle's start currency."""
+        self.finder.update(self.books())
+        cycle, _ = self.finder.cycles()[0]
+        self.assertEqual(self.finder.start_amount(cycle, 0.01), 0.01)
+
+        finder = CycleFinder(self.api, [], currency='JPY', notional={'ETH': 0.5})
+        finder.update(self.books())
+        self.assertAlmostEqual(finder.start_amount(cycle, 9995.0), 0.01)
+        self.assertEqual(finder.deals(9995.0)[0]['currency'], 'BTC')
+        self.assertAlmostEqual(finder.deals(9995.0)[0]['volume'], 0.01)
+
+    def test_notional(self):
+        """Test that a configured notional sizes the first leg."""
+        finder = CycleFinder(self.api, [], notional={'BTC': 0.02})
+        finder.update(self.books())
+        deal = finder.deals(0.01)[0]
+
+        self.assertEqual(deal['volume'], 0.02)
+        self.assertEqual(deal['legs'][0]['amount'], 0.02)
+
+    def test_unfunded_cycle(self):
+        """Test that a cycle a venue cannot fund is not proposed."""
+        self.finder.update(self.books())
+        funds = {'JPY': {'free': 1000000.0}, 'BTC': {'free': 1.0}, 'ETH': {'free': 10.0}}
+        balances = {'exchange1': funds, 'exchange2': funds}
+        self.assertEqual(len(self.finder.deals(0.01, balances=balances)), 1)
+
+        balances['exchange2'] = {**funds, 'ETH': {'free': 0.01}}
+        self.assertEqual(self.finder.deals(0.01, balances=balances), [])
+        del balances['exchange2']
+        self.assertEqual(self.finder.deals(0.01, balances=balances), [])
+
+    def test_funded_from_fetched_balances(self):
+        """Test that fetched balances carry every currency of the cycle symbols."""
+        books = self.books()
+        gw = MagicMock()
+        for name in ('exchange1', 'exchange2'):
+            api = MagicMock(has={})
+            api.fetch_order_book.side_effect = lambda symbol, name=name: books[name].get(
+                symbol, {'asks': [], 'bids': []})
+            api.fetch_balance.return_value = {
+                'JPY': {'free': 1000000.0}, 'BTC': {'free': 1.0}, 'ETH': {'free': 10.0}}
+            setattr(gw, name, MagicMock(return_value=api))
+        exchanges = { name: MagicMock(enable=True, apikey='', secret='', fees=0.0)
+            for name in ('exchange1', 'exchange2') }
+        with patch.dict('sys.modules', {'test_gw': gw}):
+            provider = Provider(exchanges, 'test_gw')
+        finder = provider.cycle_finder(['BTC/JPY', 'ETH/JPY', 'ETH/BTC'])
+        finder.refresh()
+        _, balances = provider._api.fetch_market(orderbooks=False)
+
+        self.assertEqual(len(finder.deals(0.01, balances=Balances(provider._api, balances))), 1)
+
+    def test_cooldown(self):
+        """Test that a requested cycle is not proposed again until it cools down."""
+        previous = clock.set_clock(clock.VirtualClock(1000.0))
+        try:
+            finder = CycleFinder(self.api, [], cooldown=30.0)
+            finder.update(self.books())
+            deal = finder.deals(0.01)[0]
+            finder.requested(deal)
+
+            clock.get_clock().advance(10.0)
+            self.assertEqual(finder.deals(0.01), [])
+            clock.get_clock().advance(25.0)
+            self.assertEqual(len(finder.deals(0.01)), 1)
+        finally:
+            clock.set_clock(previous)
+
+    def test_errors(self):
+        """Test that fetch errors are kept out of the graph."""
+        books = self.books()
+        books['exchange1']['ETH/JPY'] = {'fetch_orderbooks_error': 'Test error'}
+        self.finder.update(books)
+
+        self.assertEqual(self.finder.cycles(), [])
+        self.assertIn(('exchange1', 'ETH/JPY'), self.finder.errors())
+
+if __name__ == '__main__':
+    unittest.main()
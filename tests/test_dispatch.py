@@ -0,0 +1,97 @@
+import time
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.apifacade import APIFacade
+from arbtools.dispatch import OrderDispatcher
+from arbtools.latency import LatencyEstimator
+from arbtools.records import Order
+
+class TestOrderDispatcher(unittest.TestCase):
+    """Test cases for the OrderDispatcher class."""
+
+    def setUp(self):
+        """Set up two exchanges recording when they get their orders."""
+        self.sent = {}
+        self.threads = {}
+
+        def _exchange(name):
+            exchange = MagicMock()
+            def create_order(**args):
+                self.sent[name] = time.perf_counter()
+                self.threads[name] = threading.current_thread().name
+                return {'id': name + '-1', 'side': args['side'], 'status': 'open'}
+            exchange.create_order.side_effect = create_order
+            return exchange
+
+        config = { name: MagicMock(enable=True) for name in ('exchange1', 'exchange2') }
+        self.gw = MagicMock()
+        self.gw.exchange1 = MagicMock(return_value=_exchange('exchange1'))
+        self.gw.exchange2 = MagicMock(return_value=_exchange('exchange2'))
+        with patch.dict('sys.modules', {'test_gw': self.gw}):
+            self.api = APIFacade(config, 'test_gw')
+        self.data = {
+            'deal_id': 'deal',
+            'buy': {'exchange_name': 'exchange1', 'quote': [100, 1.0]},
+            'sell': {'exchange_name': 'exchange2', 'quote': [101, 1.0]},
+            'volume': 0.01,
+        }
+
+    def tearDown(self):
+        """Stop the workers."""
+        self.api._dispatcher.close()
+
+    def test_dispatch(self):
+        """Test that both legs are placed from running workers."""
+        result = self.api.create_orders(self.data, None)
+        self.assertEqual(list(result), ['exchange1', 'exchange2'])
+        self.assertIsInstance(result['exchange1'], Order)
+        self.assertEqual(result['exchange2']['side'], 'sell')
+        self.assertEqual(self.threads, {'exchange1': 'dispatch-exchange1', 'exchange2': 'dispatch-exchange2'})
+
+        ordered = {'exchange1': result['exchange1'], 'exchange2': {'create_orders_error': 'busy'}}
+        self.sent.clear()
+        result = self.api.create_orders(self.data, ordered)
+        self.assertEqual(list(self.sent), ['exchange2'])
+        self.assertIs(result['exchange1'], ordered['exchange1'])
+
+    def test_prepared(self):
+        """Test that prepared parameters are used while the deal is unchanged."""
+        build = MagicMock(side_effect=self.api._create_orders_params)
+        dispatcher = OrderDispatcher(self.api._api, build, self.api._timed)
+        dispatcher.prepare(self.data)
+        dispatcher.dispatch(self.data, None)
+        self.assertEqual(build.call_count, 1)
+
+        dispatcher.prepare(self.data)
+        self.data['volume'] = 0.02
+        dispatcher.dispatch(self.data, None)
+        self.assertEqual(build.call_count, 3)
+        dispatcher.close()
+
+    def test_stagger(self):
+        """Test that the faster venue waits half the round-trip difference."""
+        latency = LatencyEstimator()
+        latency.observe('exchange1', 'create_order', 0.4)
+        latency.observe('exchange2', 'create_order', 0.2)
+        self.api.set_latency(latency)
+        self.assertEqual(self.api._dispatcher.delays(['exchange1', 'exchange2', 'exchange3']),
+            {'exchange1': 0.0, 'exchange2': 0.1, 'exchange3': 0.0})
+
+        self.api.create_orders(self.data, None)
+        self.assertAlmostEqual(self.sent['exchange2'] - self.sent['exchange1'], 0.1, delta=0.05)
+
+    def test_errors(self):
+        """Test that a failing venue gives an error for its leg only."""
+        self.api['exchange2'].create_order.side_effect = Exception('rejected')
+        result = self.api.create_orders(self.data, None)
+        self.assertEqual(result['exchange2'], {'create_orders_error': 'rejected'})
+        self.assertEqual(result['exchange1']['id'], 'exchange1-1')
+
+if __name__ == '__main__':
+    unittest.main()
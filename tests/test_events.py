@@ -0,0 +1,116 @@
+import unittest
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.broker import Broker
+from arbtools.events import EventBus
+from arbtools.metrics import Metrics
+from arbtools.records import Deal
+from unittest.mock import MagicMock
+
+class TestEventBus(unittest.TestCase):
+    """Test cases for the event bus."""
+
+    def setUp(self):
+        """Set up a bus with its own metrics."""
+        self.metrics = Metrics()
+        self.bus = EventBus(metrics=self.metrics)
+
+    def tearDown(self):
+        self.bus.close()
+
+    def test_fanout(self):
+        """Test that every listener gets the event, in order."""
+        calls = []
+        self.bus.subscribe('event', lambda sender, arg: calls.append(('first', arg)))
+        self.bus.subscribe('event', lambda sender, arg: calls.append(('second', arg)) or 'result')
+
+        self.assertEqual(self.bus.publish('event', None, 1), 'result')
+        self.assertEqual(calls, [('first', 1), ('second', 1)])
+        self.assertIsNone(self.bus.publish('other', None, 1))
+
+    def test_queued(self):
+        """Test that queued listeners run in the background and are timed."""
+        release = threading.Event()
+        seen = []
+        def slow(sender, arg):
+            release.wait(5.0)
+            seen.append(arg)
+        subscription = self.bus.subscribe('event', slow, delivery='queued')
+
+        self.bus.publish('event', None, 1)
+        self.assertEqual(seen, [])
+        release.set()
+        self.assertTrue(self.bus.join())
+        self.assertEqual(seen, [1])
+        self.assertEqual(subscription.stats()['delivered'], 1)
+        self.assertEqual(self.metrics.histogram('listener', 'event/slow').count, 1)
+
+    def test_queued_snapshot(self):
+        """Test that a queued listener sees the argument as it was emitted."""
+        release = threading.Event()
+        seen = []
+        def slow(sender, arg):
+            release.wait(5.0)
+            seen.append(arg)
+        self.bus.subscribe('event', slow, delivery='queued')
+        deal = Deal(deal_id='deal', orders={'ex1': {'status': 'open'}}, trace={'acked': {'ex1': 1.0}})
+
+        self.bus.publish('event', None, deal)
+        deal['orders']['ex1']['status'] = 'closed'
+        deal['orders']['ex2'] = {'status': 'open'}
+        deal['trace']['filled'] = {'ex1': 2.0}
+        release.set()
+        self.assertTrue(self.bus.join())
+
+        self.assertIsInstance(seen[0], Deal)
+        self.assertEqual(seen[0]['orders'], {'ex1': {'status': 'open'}})
+        self.assertEqual(seen[0]['trace'], {'acked': {'ex1': 1.0}})
+
+    def test_drop_policies(self):
+        """Test that full queues drop by policy."""
+        release = threading.Event()
+        seen = { 'drop_oldest': [], 'drop_newest': [] }
+        subscriptions = {}
+        for policy in seen:
+            def listener(sender, arg, policy=policy):
+                release.wait(5.0)
+                seen[policy].append(arg)
+            subscriptions[policy] = self.bus.subscribe(policy, listener,
+                delivery='queued', queue_size=2, policy=policy)
+            self.bus.publish(policy, None, 0)
+            # 先頭の呼び出しが始まってから積む
+            while subscriptions[policy].depth():
+                pass
+            for i in range(1, 5):
+                self.bus.publish(policy, None, i)
+
+        release.set()
+        self.assertTrue(self.bus.join())
+        self.assertEqual(seen['drop_oldest'], [0, 3, 4])
+        self.assertEqual(seen['drop_newest'], [0, 1, 2])
+        self.assertEqual(subscriptions['drop_oldest'].stats()['dropped'], 2)
+        self.assertEqual(self.metrics.counters()[('listener_dropped', 'drop_newest/listener')], 2)
+
+class TestBrokerEvents(unittest.TestCase):
+    """Test cases for broker events with several listeners."""
+
+    def test_second_listener(self):
+        """Test that a second listener no longer replaces the first."""
+        broker = Broker(MagicMock(), MagicMock())
+        first, second = MagicMock(), MagicMock()
+        broker.on('open_pair', first)
+        broker.on('open_pair', second, notify='notify', delivery='queued')
+
+        broker.emit('open_pair', 'data')
+        broker.events().join()
+
+        first.assert_called_once_with(broker, 'data')
+        second.assert_called_once_with(broker, 'data', notify='notify')
+        broker.events().close()
+
+if __name__ == '__main__':
+    unittest.main()
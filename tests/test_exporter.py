@@ -0,0 +1,56 @@
+import unittest
+import urllib.request
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.exporter import MetricsExporter, render
+from arbtools.metrics import Metrics
+
+class TestExporter(unittest.TestCase):
+    """Test cases for the metrics exporter."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.metrics = Metrics()
+        self.metrics.observe('cycle', 0.5)
+        self.metrics.observe('fetch_order_book', 0.1, 'exchange1')
+        self.metrics.incr('fetch_order_book_errors', 'exchange1')
+        self.metrics.gauge('requests', lambda: {'confirm_open': 2}, 'state')
+
+    def test_render(self):
+        """Test the text format."""
+        text = render(self.metrics)
+        self.assertIn('blacksnake_stage_seconds_count{stage="cycle"} 1', text)
+        self.assertIn('blacksnake_stage_seconds{stage="fetch_order_book",exchange="exchange1",quantile="0.99"}', text)
+        self.assertIn('blacksnake_events_total{name="fetch_order_book_errors",exchange="exchange1"} 1', text)
+        self.assertIn('blacksnake_requests{state="confirm_open"} 2', text)
+        self.assertIn('blacksnake_process_resident_memory_bytes', text)
+
+    def test_render_unlabeled(self):
+        """Test a dictionary gauge registered without a label name."""
+        self.metrics.gauge('g', lambda: {'a': 1.0})
+        text = render(self.metrics)
+        self.assertIn('blacksnake_g{key="a"} 1.0', text)
+
+    def test_render_label_tuple(self):
+        """Test a dictionary gauge keyed by tuples of label values."""
+        self.metrics.gauge('requests', lambda: {('a', 'confirm_open'): 2}, ('strategy', 'state'))
+        text = render(self.metrics)
+        self.assertIn('blacksnake_requests{strategy="a",state="confirm_open"} 2', text)
+
+    def test_serve(self):
+        """Test scraping the endpoint."""
+        exporter = MetricsExporter(0, metrics=self.metrics).start()
+        try:
+            host, port = exporter.address()
+            with urllib.request.urlopen('http://{}:{}/metrics'.format(host, port)) as response:
+                self.assertEqual(response.status, 200)
+                body = response.read().decode('utf-8')
+        finally:
+            exporter.stop()
+        self.assertIn('blacksnake_stage_seconds_count{stage="cycle"} 1', body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import time
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.hedging import HedgedReads
+from arbtools.metrics import Metrics
+
+class TestHedgedReads(unittest.TestCase):
+    """Test cases for hedged reads."""
+
+    def setUp(self):
+        """Set up hedging with a known attempt latency."""
+        self.metrics = Metrics()
+        for _ in range(20):
+            self.metrics.observe('fetch_order_book_attempt', 0.01, 'exchange1')
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _read(self):
+        # 最初の呼び出しだけ遅い
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            time.sleep(0.5)
+            return 'slow'
+        return 'fast'
+
+    def test_delay(self):
+        """Test that only known stages with enough samples are hedged."""
+        hedging = HedgedReads(min_samples=10, metrics=self.metrics)
+
+        self.assertGreaterEqual(hedging.delay('fetch_order_book', 'exchange1'), 0.005)
+        self.assertIsNone(hedging.delay('fetch_order_book', 'exchange2'))
+        self.assertIsNone(hedging.delay('fetch_balance', 'exchange1'))
+
+    def test_hedge_wins(self):
+        """Test that a slow read is hedged and the first answer wins."""
+        hedging = HedgedReads(min_samples=10, metrics=self.metrics)
+
+        started = time.perf_counter()
+        result = hedging.call('fetch_order_book', 'exchange1', self._read)
+
+        self.assertEqual(result, 'fast')
+        self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual(self.metrics.counters()[('hedged_reads', 'exchange1')], 1)
+        self.assertEqual(self.metrics.counters()[('hedge_wins', 'exchange1')], 1)
+        hedging.shutdown()
+
+    def test_budget(self):
+        """Test that reads are not hedged once the budget is spent."""
+        hedging = HedgedReads(min_samples=10, budget=0.0, burst=0.0, metrics=self.metrics)
+
+        result = hedging.call('fetch_order_book', 'exchange1', self._read)
+
+        self.assertEqual(result, 'slow')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.metrics.counters()[('hedge_budget_exhausted', 'exchange1')], 1)
+        hedging.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools import clock
+from arbtools.apifacade import APIFacade
+from arbtools.latency import LatencyEstimator, RoundTrip, ClockOffset
+
+class TestRoundTrip(unittest.TestCase):
+    """Test cases for the RoundTrip class."""
+
+    def test_smoothing(self):
+        """Test the RFC 6298 averages of the samples."""
+        rtt = RoundTrip()
+        self.assertIsNone(rtt.timeout())
+        rtt.observe(0.1)
+        self.assertAlmostEqual(rtt.srtt, 0.1)
+        self.assertAlmostEqual(rtt.timeout(), 0.1 + 4 * 0.05)
+
+        rtt.observe(0.3)
+        self.assertAlmostEqual(rtt.rttvar, 0.05 + 0.25 * (0.2 - 0.05))
+        self.assertAlmostEqual(rtt.srtt, 0.1 + 0.125 * 0.2)
+        self.assertEqual(rtt.min_rtt, 0.1)
+        self.assertEqual(rtt.samples, 2)
+
+class TestClockOffset(unittest.TestCase):
+    """Test cases for the ClockOffset class."""
+
+    def test_offset(self):
+        """Test that samples are taken at the middle of the request."""
+        offset = ClockOffset()
+        offset.observe(100.0, 102.5, 101.0)
+        self.assertAlmostEqual(offset.offset, 2.0)
+        self.assertAlmostEqual(offset.error, 0.5)
+
+    def test_slow_samples_weigh_less(self):
+        """Test that a slow answer barely moves the estimate."""
+        fast, slow = ClockOffset(), ClockOffset()
+        for o in (fast, slow):
+            o.observe(100.0, 102.0, 100.0)
+        fast.observe(200.0, 203.0, 200.0)
+        slow.observe(200.0, 205.0, 204.0)
+        self.assertAlmostEqual(fast.offset, 2.125)
+        self.assertLess(slow.offset - 2.0, 0.01)
+
+class TestLatencyEstimator(unittest.TestCase):
+    """Test cases for the LatencyEstimator class."""
+
+    def setUp(self):
+        """Set up a virtual clock."""
+        self.clock = clock.VirtualClock(1000.0)
+        self.previous = clock.set_clock(self.clock)
+        self.latency = LatencyEstimator()
+
+    def tearDown(self):
+        """Restore the clock."""
+        clock.set_clock(self.previous)
+
+    def test_kinds(self):
+        """Test that calls are kept apart by kind of request."""
+        self.latency.observe('exchange1', 'fetch_order_book', 0.05)
+        self.latency.observe('exchange1', 'create_order', 0.2)
+        self.latency.observe('exchange2', 'create_order', 0.4)
+        self.latency.observe('exchange1', 'unknown', 9.0)
+
+        self.assertEqual(self.latency.rtt('exchange1', 'public'), 0.05)
+        self.assertEqual(self.latency.rtt('exchange1', 'order'), 0.2)
+        self.assertIsNone(self.latency.rtt('exchange1', 'private'))
+        self.assertAlmostEqual(self.latency.timeout(['exchange1', 'exchange2']), 0.4 + 4 * 0.2)
+        self.assertIsNone(self.latency.timeout(['exchange3']))
+        self.assertEqual(self.latency.gauge('order'), {'exchange1': 0.2, 'exchange2': 0.4})
+        self.assertEqual(set(self.latency.stats()['exchange1']), {'public', 'order'})
+
+    def test_probe(self):
+        """Test clock samples from fetchTime."""
+        api = MagicMock(has={'fetchTime': True})
+        api.fetch_time.return_value = 1003000
+        other = MagicMock(has={})
+        failing = MagicMock(has={'fetchTime': True})
+        failing.fetch_time.side_effect = Exception('timeout')
+
+        errors = self.latency.probe([('exchange1', api), ('exchange2', other), ('exchange3', failing)])
+        self.assertEqual(errors, {'exchange1': None, 'exchange3': 'timeout'})
+        self.assertAlmostEqual(self.latency.offset('exchange1'), 3.0, places=2)
+        self.assertAlmostEqual(self.latency.local_time('exchange1', 1003.0), 1000.0, places=2)
+        self.assertIsNone(self.latency.offset('exchange2'))
+        self.assertEqual(self.latency.local_time('exchange2', 5.0), 5.0)
+        self.assertIn('exchange1', self.latency.gauge('offset'))
+
+    def test_apifacade_feed(self):
+        """Test that APIFacade feeds successful gateway calls."""
+        gw = MagicMock()
+        exchange = MagicMock()
+        exchange.fetch_order_book.return_value = {'asks': [], 'bids': []}
+        gw.exchange1 = MagicMock(return_value=exchange)
+        with patch.dict('sys.modules', {'test_gw': gw}):
+            api = APIFacade({'exchange1': MagicMock(enable=True)}, 'test_gw')
+        self.assertIsNone(api.order_timeout(['exchange1']))
+        api.set_latency(self.latency)
+        api.fetch_orderbooks()
+        self.assertIsNotNone(self.latency.rtt('exchange1', 'public'))
+        self.assertIsNone(api.order_timeout(['exchange1']))
+        self.assertIs(api.latency(), self.latency)
@@ -0,0 +1,84 @@
+import unittest
+import threading
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.metrics import Histogram, Metrics
+
+class TestHistogram(unittest.TestCase):
+    """Test cases for the Histogram class."""
+
+    def test_quantiles(self):
+        """Test quantile estimates stay within the bucket error."""
+        histogram = Histogram()
+        for ms in range(1, 1001):
+            histogram.observe(ms / 1000.0)
+
+        p50, p95, p99 = histogram.quantiles()
+        self.assertAlmostEqual(p50, 0.5, delta=0.5 * 0.125)
+        self.assertAlmostEqual(p95, 0.95, delta=0.95 * 0.125)
+        self.assertAlmostEqual(p99, 0.99, delta=0.99 * 0.125)
+        self.assertEqual(histogram.count, 1000)
+        self.assertEqual(histogram.max, 1.0)
+
+    def test_empty(self):
+        """Test quantiles of an empty histogram."""
+        self.assertEqual(Histogram().quantiles(), [0.0, 0.0, 0.0])
+
+    def test_rolling_window(self):
+        """Test that old windows are dropped."""
+        with patch('arbtools.metrics.time.monotonic', return_value=0.0):
+            histogram = Histogram(window=10.0)
+            histogram.observe(1.0)
+        with patch('arbtools.metrics.time.monotonic', return_value=15.0):
+            histogram.observe(0.001)
+            self.assertGreater(histogram.quantiles((0.99,))[0], 0.5)
+        with patch('arbtools.metrics.time.monotonic', return_value=35.0):
+            histogram.observe(0.001)
+            self.assertLess(histogram.quantiles((0.99,))[0], 0.01)
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for the Metrics class."""
+
+    def test_span(self):
+        """Test spans keyed by stage and exchange."""
+        metrics = Metrics()
+        with metrics.span('fetch_order_book', 'exchange1'):
+            pass
+        with metrics.span('cycle'):
+            pass
+        metrics.observe('cycle', 0.25)
+
+        summary = metrics.summary()
+        self.assertEqual(summary[('fetch_order_book', 'exchange1')]['count'], 1)
+        self.assertEqual(summary[('cycle', None)]['count'], 2)
+        self.assertEqual(summary[('cycle', None)]['max'], 0.25)
+        self.assertIn('fetch_order_book[exchange1]', metrics.format())
+
+    def test_threads(self):
+        """Test that concurrent recording loses no increments."""
+        metrics = Metrics()
+
+        def _record(n):
+            for i in range(2000):
+                metrics.incr('errors')
+                metrics.incr('errors', 'exchange{}'.format(i % 50))
+                metrics.observe('stage{}'.format(i % 50), 0.001)
+                metrics.counters()
+                if i % 200 == 0:
+                    metrics.summary()
+
+        threads = [ threading.Thread(target=_record, args=(n,)) for n in range(4) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(metrics.counters()[('errors', None)], 8000)
+        self.assertEqual(sum(s['count'] for s in metrics.summary().values()), 8000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -136,6 +136,22 @@ class TestMutimediaNotificator(unittest.TestCase):
             notificator = MutimediaNotificator(self.config)
             self.assertEqual(len(notificator._notificators), 2)
 
+    def test_watch_sessions(self):
+        """Test that every notifier session gets a keep-alive ping."""
+        self.config.items.return_value = [
+            ('slack', MagicMock(enable=True, url='https://hooks.example.com/services/T/B/X')),
+        ]
+        connections = MagicMock()
+        notificator = MutimediaNotificator(self.config, connections=connections)
+
+        connections.session.assert_called_once_with('notify_slack')
+        name, ping = connections.watch.call_args[0]
+        self.assertEqual(name, 'notify_slack')
+        ping()
+        connections.session.return_value.head.assert_called_once_with(
+            'https://hooks.example.com/', timeout=10)
+        self.assertIs(notificator._notificators['slack']._session, connections.session.return_value)
+
     def test_broadcast_message(self):
         """Test broadcast_message method."""
         mock_line = MagicMock()
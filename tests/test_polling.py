@@ -0,0 +1,125 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools import clock
+from arbtools.broker import Broker
+from arbtools.polling import PollSchedule
+
+class TestPollSchedule(unittest.TestCase):
+    """Test cases for the confirmation poll schedule."""
+
+    def setUp(self):
+        """Set up a virtual clock."""
+        self.clock = clock.VirtualClock(1000.0)
+        self.previous = clock.set_clock(self.clock)
+        self.polls = PollSchedule(interval=1.0, max_interval=4.0, backoff=2.0)
+        self.data = {}
+
+    def tearDown(self):
+        """Restore the clock."""
+        clock.set_clock(self.previous)
+
+    def test_backoff(self):
+        """Test that polls without change back off up to the maximum."""
+        self.assertTrue(self.polls.due(self.data))
+        self.polls.placed(self.data)
+        self.assertFalse(self.polls.due(self.data))
+        self.clock.advance(1.0)
+        self.assertTrue(self.polls.due(self.data))
+
+        for wait in (2.0, 4.0, 4.0):
+            self.polls.polled(self.data, changed=False)
+            self.clock.advance(wait - 0.1)
+            self.assertFalse(self.polls.due(self.data))
+            self.clock.advance(0.1)
+            self.assertTrue(self.polls.due(self.data))
+
+        self.polls.polled(self.data, changed=True)
+        self.clock.advance(1.0)
+        self.assertTrue(self.polls.due(self.data))
+
+    def test_deadline_caps_backoff(self):
+        """Test that a backed-off poll is never later than the given deadline."""
+        self.polls.placed(self.data)
+        self.polls.polled(self.data, changed=False)
+        self.polls.polled(self.data, changed=False, deadline=1002.5)
+        self.clock.advance(2.5)
+        self.assertTrue(self.polls.due(self.data))
+        self.polls.polled(self.data, changed=False, deadline=1000.0)
+        self.assertTrue(self.polls.due(self.data))
+
+    def test_wake_and_forget(self):
+        """Test that a pushed fill makes the poll due at once."""
+        self.polls.placed(self.data)
+        self.polls.wake(self.data)
+        self.assertTrue(self.polls.due(self.data))
+        self.polls.forget(self.data)
+        self.assertEqual(len(self.polls), 0)
+
+    def test_reused_id(self):
+        """Test that a new request never inherits the schedule of a freed one."""
+        self.polls.placed(self.data)
+        self.polls.polled(self.data, changed=False)
+        impostor = {}
+        self.polls._polls[id(impostor)] = self.polls._polls.pop(id(self.data))
+        self.assertTrue(self.polls.due(impostor))
+        self.polls.forget(impostor)
+        self.assertEqual(len(self.polls), 1)
+
+class TestBrokerPolling(unittest.TestCase):
+    """Test cases for confirmation polling in the Broker."""
+
+    def setUp(self):
+        """Set up a broker waiting for fills."""
+        self.clock = clock.VirtualClock(1000.0)
+        self.previous = clock.set_clock(self.clock)
+        self.trade = MagicMock()
+        self.trade.poll_interval = 1.0
+        self.broker = Broker(MagicMock(), self.trade)
+        self.broker._trade_rule = MagicMock()
+        self.data = {'orders': {'exchange1': {'id': '1', 'status': 'open', 'filled': 0.0}}}
+        self.broker._trade_rule.execute.side_effect = lambda status, *args: status
+        self.broker._requests = [('confirm_open', self.data)]
+
+    def tearDown(self):
+        """Restore the clock."""
+        clock.set_clock(self.previous)
+
+    def test_process_requests_skips_polls_not_due(self):
+        """Test that requests are only confirmed when their poll is due."""
+        self.broker.process_requests()
+        self.broker.process_requests()
+        self.assertEqual(self.broker._trade_rule.execute.call_count, 1)
+
+        self.clock.advance(2.0)
+        self.broker.process_requests()
+        self.assertEqual(self.broker._trade_rule.execute.call_count, 2)
+        self.assertEqual(self.broker._requests, [('confirm_open', self.data)])
+
+    def test_hedge_deadline_overrides_backoff(self):
+        """Test that a deal with an unmatched fill is polled by its hedge deadline."""
+        self.trade.hedge_timeout = 3.0
+        self.broker._api.order_timeout.return_value = None
+        self.data['orders']['exchange2'] = {'id': '2', 'status': 'closed', 'filled': 1.0}
+        self.data['trace'] = {'filled': {'exchange2': 1000.0}}
+        for _ in range(3):
+            self.broker.process_requests()
+            self.clock.advance(1.0)
+        self.assertEqual(self.broker._trade_rule.execute.call_count, 2)
+        self.broker.process_requests()
+        self.assertEqual(self.broker._trade_rule.execute.call_count, 3)
+
+    def test_notify_fill(self):
+        """Test that a pushed fill short-circuits the wait."""
+        self.broker.process_requests()
+        self.assertEqual(self.broker.notify_fill('exchange2'), 0)
+        self.assertEqual(self.broker.notify_fill('exchange1', '1'), 1)
+        self.broker.process_requests()
+        self.assertEqual(self.broker._trade_rule.execute.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
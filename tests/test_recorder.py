@@ -0,0 +1,93 @@
+import unittest
+import tempfile
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.recorder import Recorder, RecordReader
+
+class TestRecorder(unittest.TestCase):
+    """Test cases for the Recorder and RecordReader classes."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def books(self, shift):
+        return {
+            'exchange1': {
+                'asks': [(1000100 + shift, 0.5), (1000200 + shift, 1.25)],
+                'bids': [(999800 + shift, 2.0), (999900 + shift, 0.01)],
+            },
+            'exchange2': {
+                'asks': [(1000300 - shift, 0.1)],
+                'bids': [(999700 - shift, 0.2)],
+            },
+        }
+
+    def test_round_trip(self):
+        """Test that recorded books are read back unchanged."""
+        recorder = Recorder(self.root, tick=100, chunk_records=2)
+        for i in range(5):
+            recorder.record(self.books(i * 100), timestamp=1000.0 + i)
+        recorder.close()
+
+        reader = RecordReader(self.root)
+        self.assertEqual(reader.names(), ['exchange1', 'exchange2'])
+
+        records = list(reader.read('exchange1'))
+        self.assertEqual(len(records), 5)
+        for i, (timestamp, book) in enumerate(records):
+            expected = self.books(i * 100)['exchange1']
+            self.assertEqual(timestamp, 1000.0 + i)
+            self.assertEqual(book['asks'], expected['asks'])
+            self.assertEqual(book['bids'], expected['bids'])
+
+    def test_read_time_range(self):
+        """Test reading a time range through the chunk index."""
+        recorder = Recorder(self.root, tick=100, chunk_records=2)
+        for i in range(6):
+            recorder.record(self.books(0), timestamp=1000.0 + i)
+        recorder.close()
+
+        reader = RecordReader(self.root)
+        timestamps = [ t for t, _ in reader.read('exchange2', start=1002.0, end=1005.0) ]
+        self.assertEqual(timestamps, [1002.0, 1003.0, 1004.0])
+
+    def test_cycles(self):
+        """Test that books of all exchanges are grouped by cycle."""
+        recorder = Recorder(self.root, tick=100)
+        recorder.record(self.books(0), timestamp=1000.0)
+        recorder.record(self.books(100), timestamp=1001.0)
+        recorder.close()
+
+        cycles = list(RecordReader(self.root).cycles())
+        self.assertEqual(len(cycles), 2)
+        self.assertEqual(set(cycles[1][1].keys()), {'exchange1', 'exchange2'})
+        self.assertEqual(cycles[1][1]['exchange2']['asks'], [(1000200, 0.1)])
+
+    def test_reopen_without_close(self):
+        """Test that records of a chunk left open by a crash are kept."""
+        recorder = Recorder(self.root, tick=100, chunk_records=10)
+        for i in range(5):
+            recorder.record(self.books(0), timestamp=1000.0 + i)
+        recorder.flush()
+        path = os.path.join(self.root, 'exchange1', '00000000.chunk')
+        with open(path, 'ab') as f:
+            f.write(b'\x80')   # 途中で切れたレコード
+
+        recorder = Recorder(self.root, tick=100, chunk_records=10)
+        for i in range(5, 8):
+            recorder.record(self.books(0), timestamp=1000.0 + i)
+        recorder.close()
+
+        timestamps = [ t for t, _ in RecordReader(self.root).read('exchange1') ]
+        self.assertEqual(timestamps, [ 1000.0 + i for i in range(8) ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import pickle
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.records import Deal, Leg, Order, Quote, compact_deal
+
+class TestRecords(unittest.TestCase):
+    """Test cases for the record types."""
+
+    def setUp(self):
+        """Set up a pair deal with orders."""
+        self.order = Order.from_ccxt({
+            'id': '1', 'side': 'buy', 'price': 100.0, 'amount': 0.01, 'filled': 0.0,
+            'status': 'open', 'fee': {'cost': 0.5}, 'info': {'raw': 'response'},
+        }, sent_at=1.0, acked_at=2.0)
+        self.deal = Deal(
+            deal_id='deal',
+            buy=Leg(exchange_name='exchange1', quote=Quote(100.0, 1.0)),
+            sell=Leg(exchange_name='exchange2', quote=Quote(101.0, 1.0)),
+            volume=0.01,
+            orders={'exchange1': self.order},
+            trace={'planned': 3.0},
+        )
+
+    def test_mapping_access(self):
+        """Test that records read like the dicts they replace."""
+        self.assertEqual(self.deal['buy']['quote'][0], 100.0)
+        self.assertEqual(self.deal['sell'].quote.price, 101.0)
+        self.assertIn('orders', self.deal)
+        self.assertNotIn('legs', self.deal)
+        self.assertIsNone(self.deal.get('legs'))
+        with self.assertRaises(KeyError):
+            self.deal['open_deal']
+        with self.assertRaises(KeyError):
+            self.deal['unknown'] = 1
+
+        self.deal['timestamp'] = 'now'
+        self.assertEqual(dict(self.deal)['timestamp'], 'now')
+
+    def test_order_from_ccxt(self):
+        """Test that conversion keeps the unified fields and drops 'info'."""
+        self.assertEqual(self.order['id'], '1')
+        self.assertEqual(self.order['fee_cost'], 0.5)
+        self.assertEqual(self.order['sent_at'], 1.0)
+        self.assertIn('filled', self.order)
+        self.assertNotIn('info', self.order)
+        self.assertNotIn('average', self.order)
+
+    def test_pickle(self):
+        """Test that records survive a pickle round trip."""
+        data = pickle.loads(pickle.dumps(('confirm_open', self.deal)))
+
+        self.assertEqual(data[1], self.deal)
+        self.assertIsInstance(data[1]['orders']['exchange1'], Order)
+        self.assertIsInstance(data[1]['buy']['quote'], Quote)
+
+    def test_positional(self):
+        """Test that records build from values in slot order, as pickle does."""
+        leg = Leg('exchange1', Quote(100.0, 1.0))
+        self.assertEqual(leg, Leg(exchange_name='exchange1', quote=Quote(100.0, 1.0)))
+        self.assertIsNone(leg.symbol)
+        with self.assertRaises(TypeError):
+            Leg(venue='exchange1')
+
+    def test_compact_deal(self):
+        """Test that the nested open deal drops its open deal and keeps its trace."""
+        reverse = self.deal.copy()
+        reverse['open_deal'] = compact_deal(self.deal)
+
+        self.assertNotIn('open_deal', compact_deal(reverse))
+        self.assertEqual(reverse['open_deal']['trace'], {'planned': 3.0})
+        self.assertEqual(reverse['open_deal']['orders'], self.deal['orders'])
+        self.assertEqual(compact_deal({'open_deal': {}, 'volume': 1.0}), {'volume': 1.0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.broker import Broker, unfilled_exchanges
+from arbtools.nothing import Nothing
+from arbtools.requestbook import RequestBook
+
+def _deal(deal_id, buy, sell, status='open'):
+    return {
+        'deal_id': deal_id,
+        'buy': {'exchange_name': buy},
+        'sell': {'exchange_name': sell},
+        'orders': {
+            buy: {'id': deal_id + 'b', 'status': status},
+            sell: {'id': deal_id + 's', 'status': 'closed'},
+        },
+    }
+
+class TestRequestBook(unittest.TestCase):
+    """Test cases for the indexed request book."""
+
+    def setUp(self):
+        """Set up a book with open and closing requests."""
+        self.open = ('confirm_open', _deal('1', 'exchange1', 'exchange2'))
+        self.close = ('close_pair', _deal('2', 'exchange3', 'exchange4'))
+        self.book = RequestBook([self.open, self.close], exchanges=unfilled_exchanges)
+
+    def test_indexes(self):
+        """Test that states, deals and unfilled exchanges are indexed."""
+        self.assertEqual(self.book, [self.open, self.close])
+        self.assertEqual(self.book.counts(), {'confirm_open': 1, 'close_pair': 1})
+        self.assertTrue(self.book.any_state(['confirm_open']))
+        self.assertIs(self.book.deal('2'), self.close)
+        self.assertEqual(self.book.unclosed_exchanges(), {'exchange1'})
+        self.assertTrue(self.book.unclosed(['exchange1', 'exchange3']))
+        self.assertFalse(self.book.unclosed(['exchange2']))
+
+    def test_transition(self):
+        """Test that indexes follow a request through its transitions."""
+        self.assertIs(self.book.popleft(), self.open)
+        self.assertEqual(self.book.unclosed_exchanges(), set())
+        self.assertIsNone(self.book.deal('1'))
+
+        filled = ('confirm_open', _deal('1', 'exchange1', 'exchange2', status='closed'))
+        self.book.append(filled)
+        self.assertEqual(self.book.unclosed_exchanges(), set())
+        self.assertIs(self.book.deal('1'), filled)
+
+    def test_rotate_and_copy(self):
+        """Test that rotating keeps indexes and copies are independent."""
+        copy = self.book.copy()
+        self.book.rotate()
+        self.assertEqual(self.book, [self.close, self.open])
+        self.assertEqual(self.book.unclosed_exchanges(), {'exchange1'})
+
+        copy.popleft()
+        self.assertEqual(len(self.book), 2)
+        self.assertEqual(copy.counts(), {'close_pair': 1})
+
+    def test_version(self):
+        """Test that the version moves when a request enters or leaves."""
+        version = self.book.version()
+        self.book.rotate()
+        self.assertEqual(self.book.version(), version)
+        self.book.append(self.book.popleft())
+        self.assertEqual(self.book.version(), version + 2)
+
+class TestBrokerRequests(unittest.TestCase):
+    """Test cases for admission through the request book."""
+
+    def test_request_admission(self):
+        """Test that venues with unfilled orders are not traded again."""
+        trade = MagicMock(max_order=5, target_profit_rate=0.0)
+        broker = Broker(MagicMock(), trade)
+        broker._requests = [('confirm_open', _deal('1', 'exchange1', 'exchange2'))]
+        self.assertFalse(broker.request_is_ready())
+
+        deal = _deal('3', 'exchange1', 'exchange3')
+        deal['profit_rate'] = 1.0
+        self.assertIsInstance(broker.request(deal), Nothing)
+
+        deal = _deal('4', 'exchange2', 'exchange3')
+        deal['profit_rate'] = 1.0
+        self.assertIs(broker.request(deal), broker)
+        self.assertEqual(broker.find_request('4')[0], 'open_pair')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.balances import Balances
+from arbtools.loop import run_broker
+from arbtools.routing import ConsolidatedBook, SmartRouter
+
+def balance(jpy=10000000.0, btc=10.0):
+    return {'JPY': {'free': jpy}, 'BTC': {'free': btc}}
+
+class TestConsolidatedBook(unittest.TestCase):
+    """Test cases for the ConsolidatedBook class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.book = ConsolidatedBook({'ex1': 0.1})
+        self.book.update_books({
+            'ex1': {'asks': [(100, 1.0), (110, 1.0)], 'bids': [(80, 1.0), (90, 1.0)]},
+            'ex2': {'asks': [(105, 2.0)], 'bids': [(95, 2.0)]},
+        })
+
+    def test_merged_levels(self):
+        """Test that asks and bids of all venues are merged after fees."""
+        asks = [ (round(eff, 6), name) for eff, _, _, name in self.book.asks() ]
+        bids = [ (round(eff, 6), name) for eff, _, _, name in self.book.bids() ]
+
+        self.assertEqual(asks, [(100.1, 'ex1'), (105, 'ex2'), (110.11, 'ex1')])
+        self.assertEqual(bids, [(95, 'ex2'), (89.91, 'ex1'), (79.92, 'ex1')])
+
+    def test_incremental_update(self):
+        """Test that only changed venues are recomputed and missing ones removed."""
+        version = self.book.version
+        changed = self.book.update_books({
+            'ex1': {'asks': [(100, 1.0), (110, 1.0)], 'bids': [(80, 1.0), (90, 1.0)]},
+        })
+
+        self.assertEqual(changed, ['ex2'])
+        self.assertEqual(self.book.version, version + 1)
+        self.assertNotIn('ex2', self.book)
+        self.assertEqual(self.book.update_books({
+            'ex1': {'asks': [(100, 1.0), (110, 1.0)], 'bids': [(80, 1.0), (90, 1.0)]},
+        }), [])
+
+class TestSmartRouter(unittest.TestCase):
+    """Test cases for the SmartRouter class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.book = ConsolidatedBook()
+        self.book.update_books({
+            'ex1': {'asks': [(100, 0.5), (101, 1.0)], 'bids': [(90, 1.0)]},
+            'ex2': {'asks': [(102, 1.0)], 'bids': [(90, 1.0)]},
+            'ex3': {'asks': [(120, 1.0)], 'bids': [(105, 0.3), (110, 0.7)]},
+            'ex4': {'asks': [(130, 1.0)], 'bids': [(104, 2.0)]},
+        })
+        self.router = SmartRouter(self.book, min_volume=0.01)
+        self.balances = {name: balance() for name in ('ex1', 'ex2', 'ex3', 'ex4')}
+
+    def legs(self, deal):
+        return { (leg['exchange_name'], leg['side']): round(leg['amount'], 6) for leg in deal['legs'] }
+
+    def test_splits_over_venues(self):
+        """Test that the volume is split over the best buy and sell venues."""
+        deal = self.router.route(2.0, self.balances)
+
+        self.assertEqual(self.legs(deal), {
+            ('ex1', 'buy'): 1.5, ('ex2', 'buy'): 0.5,
+            ('ex3', 'sell'): 1.0, ('ex4', 'sell'): 1.0,
+        })
+        self.assertAlmostEqual(deal['volume'], 2.0)
+        # 板を上から突き合わせた各約定の利ざやの合計
+        expected = 0.5 * 10 + 0.2 * 9 + 0.3 * 4 + 0.5 * 3 + 0.5 * 2
+        self.assertAlmostEqual(deal['expected_profit'], expected)
+        sides = {leg['leg_id']: leg['quote'][0] for leg in deal['legs']}
+        self.assertEqual(sides['0:ex1'], 101)
+        self.assertEqual(set(l['symbol'] for l in deal['legs']), {'BTC/JPY'})
+
+    def test_balances_limit_venues(self):
+        """Test that a venue's balance only limits its own legs."""
+        self.balances['ex1'] = balance(jpy=100.0 * 0.2)
+        self.balances['ex3'] = balance(btc=0.1)
+        deal = self.router.route(1.0, self.balances)
+
+        legs = self.legs(deal)
+        self.assertEqual(legs[('ex1', 'buy')], 0.2)
+        self.assertEqual(legs[('ex3', 'sell')], 0.1)
+        self.assertEqual(legs[('ex4', 'sell')], 0.9)
+
+    def test_small_legs_are_rerouted(self):
+        """Test that legs below min_volume are left out."""
+        self.balances['ex3'] = balance(btc=0.005)
+        deal = self.router.route(0.5, self.balances)
+
+        self.assertNotIn(('ex3', 'sell'), self.legs(deal))
+        self.assertAlmostEqual(sum(v for (_, side), v in self.legs(deal).items() if side == 'sell'), 0.5)
+
+    def test_no_crossing(self):
+        """Test that no deal is built when fees remove the spread."""
+        book = ConsolidatedBook({'ex1': 5.0, 'ex2': 5.0})
+        book.update_books({
+            'ex1': {'asks': [(100, 1.0)], 'bids': [(90, 1.0)]},
+            'ex2': {'asks': [(120, 1.0)], 'bids': [(105, 1.0)]},
+        })
+        self.assertIsNone(SmartRouter(book).route(1.0, self.balances))
+
+    def test_run_broker_uses_routed_deal(self):
+        """Test that run_broker requests a routed deal with more than two legs."""
+        broker = MagicMock()
+        broker.trade_volume.return_value = 2.0
+        balances = Balances(None, self.balances)
+        run_broker(broker, MagicMock(), balances=balances, router=self.router)
+
+        deal = broker.request.call_args[0][0]
+        self.assertEqual(len(deal['legs']), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.backtest import exchange_configs
+from arbtools.sharedbooks import BookSlot, SharedBooks, _SEQ
+from arbtools.simserver import ExchangeSimulator
+
+class TestBookSlot(unittest.TestCase):
+    """Test cases for the shared-memory book slot."""
+
+    def setUp(self):
+        """Set up a small slot."""
+        self.slot = BookSlot(depth=2, create=True)
+        self.reader = BookSlot(self.slot.name, depth=2)
+
+    def tearDown(self):
+        self.reader.close()
+        self.slot.close()
+
+    def test_publish_and_read(self):
+        """Test that a reader sees the published book, cut to depth."""
+        self.assertIsNone(self.reader.read())
+
+        self.slot.publish({
+            'asks': [(100.0, 1.0), (200.0, 2.0), (300.0, 3.0)],
+            'bids': [(70.0, 3.0), (80.0, 2.0), (90.0, 1.0)],
+            'received_at': 1.5, 'rounded_at': 2.5,
+        })
+        book = self.reader.read()
+        self.assertEqual(book['asks'], [(100.0, 1.0), (200.0, 2.0)])
+        self.assertEqual(book['bids'], [(80.0, 2.0), (90.0, 1.0)])
+        self.assertEqual(book['received_at'], 1.5)
+        self.assertEqual(self.reader.seq, 2)
+
+    def test_publish_error(self):
+        """Test that fetch errors replace the book."""
+        self.slot.publish_error('timeout')
+        self.assertEqual(self.reader.read()['fetch_orderbooks_error'], 'timeout')
+
+    def test_torn_read(self):
+        """Test that a slot being written is never read."""
+        self.slot.publish({ 'asks': [(100.0, 1.0)], 'bids': [(90.0, 1.0)] })
+        _SEQ.pack_into(self.slot._shm.buf, 0, 3)
+        self.assertIsNone(self.reader.read(retries=3))
+
+class TestSharedBooks(unittest.TestCase):
+    """Test cases for the fetcher processes."""
+
+    def setUp(self):
+        """Set up a simulator and a fetcher per venue."""
+        self.simulator = ExchangeSimulator(['exchange1', 'exchange2'], tick_interval=60.0, seed=1).start()
+        self.books = SharedBooks(exchange_configs({ 'exchange1': 0.1, 'exchange2': 0.1 }),
+            'arbtools.simhttp', interval=0.05,
+            gw_options={ 'base_url': self.simulator.base_url() }).start()
+
+    def tearDown(self):
+        self.books.stop()
+        self.simulator.stop()
+
+    def test_read_and_restart(self):
+        """Test that books are published and a dead fetcher is restarted."""
+        self.assertTrue(self.books.wait(timeout=30.0))
+        books = self.books.read()
+        for name in ('exchange1', 'exchange2'):
+            self.assertGreater(books[name]['asks'][0][0], books[name]['bids'][-1][0])
+
+        process = self.books._processes['exchange1']
+        process.terminate()
+        process.join()
+        self.assertEqual(self.books.check(), ['exchange1'])
+        self.assertTrue(self.books._processes['exchange1'].is_alive())
+
+if __name__ == '__main__':
+    unittest.main()
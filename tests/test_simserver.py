@@ -0,0 +1,56 @@
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools import simhttp
+from arbtools.simserver import ExchangeSimulator
+
+class TestExchangeSimulator(unittest.TestCase):
+    """Test cases for the simulator server and its HTTP gateway."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.simulator = ExchangeSimulator(['exchange1', 'exchange2'], tick_interval=60.0, seed=1).start()
+        simhttp.base_url = self.simulator.base_url()
+        self.exchange = simhttp.exchange1({})
+
+    def tearDown(self):
+        self.simulator.stop()
+
+    def test_orderbook_and_balance(self):
+        """Test public and private reads."""
+        book = self.exchange.fetch_order_book('BTC/JPY')
+        self.assertGreater(book['asks'][0][0], book['bids'][0][0])
+        self.assertEqual(self.exchange.fetch_balance()['BTC']['free'], 10.0)
+
+    def test_order_round_trip(self):
+        """Test placing, matching and cancelling orders."""
+        book = self.exchange.fetch_order_book('BTC/JPY')
+        ask = book['asks'][0][0]
+
+        order = self.exchange.create_order('BTC/JPY', 'limit', 'buy', 0.0001, ask)
+        self.assertEqual(self.exchange.fetch_order(order['id'])['status'], 'closed')
+
+        order = self.exchange.create_order('BTC/JPY', 'limit', 'buy', 0.0001, 1)
+        self.assertEqual(self.exchange.fetch_order(order['id'])['status'], 'open')
+        self.assertEqual(self.exchange.cancel_order(order['id'])['status'], 'canceled')
+
+    def test_connection_pool(self):
+        """Test that requests reuse the pooled keep-alive connections."""
+        opened = simhttp.stats['connections']
+        for _ in range(5):
+            self.exchange.fetch_order_book('BTC/JPY')
+        self.assertEqual(simhttp.stats['connections'] - opened, 1)
+        self.assertEqual(self.exchange.idle_connections(), 1)
+
+    def test_error_injection(self):
+        """Test that injected errors surface as exceptions."""
+        self.simulator._error_rate = 1.0
+        with self.assertRaises(Exception):
+            self.exchange.fetch_balance()
+        self.assertEqual(self.simulator.errors, 1)
+
+if __name__ == '__main__':
+    unittest.main()
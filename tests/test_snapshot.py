@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.broker import Broker
+from arbtools.nothing import Nothing
+from arbtools.snapshot import MarketSnapshot, SnapshotBuffer
+
+class Quotes(dict):
+
+    def __init__(self, data, received):
+        super().__init__(data)
+        self._received = received
+
+    def trace(self):
+        return { 'received': self._received }
+
+class TestSnapshotBuffer(unittest.TestCase):
+    """Test cases for versioned market snapshots."""
+
+    def test_publish(self):
+        """Test that versions grow and unchanged fields are carried over."""
+        snapshots = SnapshotBuffer()
+        self.assertIsNone(snapshots.current())
+
+        quotes = Quotes({}, { 'exchange1': 10.0, 'exchange2': 10.5, 'exchange3': 12.0 })
+        first = snapshots.publish(quotes=quotes, balances='balances')
+        second = snapshots.publish(balances='next')
+
+        self.assertEqual((first.version, second.version), (1, 2))
+        self.assertIs(second.quotes, quotes)
+        self.assertEqual(first.balances, 'balances')
+        self.assertIs(snapshots.previous(), first)
+        self.assertEqual(second.skew(), 2.0)
+        self.assertEqual(second.skew(['exchange1', 'exchange2']), 0.5)
+        self.assertIsNone(second.skew(['exchange1']))
+
+    def test_immutable(self):
+        """Test that a snapshot cannot be changed."""
+        snapshot = MarketSnapshot(1, {}, None)
+        with self.assertRaises(AttributeError):
+            snapshot.quotes = {}
+
+class TestBrokerSkew(unittest.TestCase):
+    """Test cases for skew checks in planning."""
+
+    def setUp(self):
+        """Set up a broker with a valid plan."""
+        self.trade = MagicMock(volume=0.01, max_skew=1.0)
+        self.broker = Broker(MagicMock(), self.trade)
+        self.broker._trade_rule = MagicMock()
+        self.broker._trade_rule.validate_plan.return_value = True
+        self.balances = MagicMock()
+        self.balances.has_error.return_value = False
+        self.rejected = MagicMock()
+        self.broker.on('skew_rejected', self.rejected)
+
+    def _planning(self, received):
+        plan = MagicMock()
+        plan.best.side_effect = lambda side: { 'buy': { 'exchange_name': 'exchange1' },
+            'sell': { 'exchange_name': 'exchange2' } }[side]
+        quotes = Quotes({}, received)
+        self.broker._tradable = MagicMock(return_value={})
+        with unittest.mock.patch('arbtools.broker.TradePlan', return_value=plan):
+            return self.broker.planning(quotes, balances=self.balances)
+
+    def test_contemporaneous(self):
+        """Test that plans from close books are kept."""
+        plan = self._planning({ 'exchange1': 10.0, 'exchange2': 10.5, 'exchange3': 0.0 })
+        self.assertNotIsInstance(plan, Nothing)
+        self.assertEqual(self.broker.snapshot().version, 1)
+        self.rejected.assert_not_called()
+
+    def test_skewed(self):
+        """Test that plans from books received too far apart are rejected."""
+        plan = self._planning({ 'exchange1': 10.0, 'exchange2': 12.0 })
+        self.assertIsInstance(plan, Nothing)
+        self.assertEqual(self.rejected.call_args[0][1]['skew'], 2.0)
+        self.assertIs(self.broker._last_balances, self.balances)
+
+if __name__ == '__main__':
+    unittest.main()
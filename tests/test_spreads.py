@@ -0,0 +1,153 @@
+import unittest
+from unittest.mock import MagicMock
+from types import SimpleNamespace
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.broker import Broker
+from arbtools.spreads import P2Quantile, WindowedQuantile, SpreadStats
+
+def quotes(ask1, bid1, ask2, bid2):
+    return {
+        'ex1': {'ask': (ask1, 1.0), 'bid': (bid1, 1.0)},
+        'ex2': {'ask': (ask2, 1.0), 'bid': (bid2, 1.0)},
+    }
+
+class TestQuantiles(unittest.TestCase):
+    """Test cases for the streaming quantile estimates."""
+
+    def test_p2_quantile(self):
+        """Test that P-square tracks the quantiles of a sample."""
+        rng = random.Random(1)
+        xs = [ rng.gauss(0.0, 1.0) for _ in range(5000) ]
+        for p in (0.5, 0.9):
+            sketch = P2Quantile(p)
+            for x in xs:
+                sketch.observe(x)
+            self.assertAlmostEqual(sketch.value(), sorted(xs)[int(p * len(xs))], delta=0.05)
+
+    def test_few_samples(self):
+        """Test that the quantile of fewer than five samples is read directly."""
+        sketch = P2Quantile(0.5)
+        self.assertIsNone(sketch.value())
+        for x in (3.0, 1.0, 2.0):
+            sketch.observe(x)
+        self.assertEqual(sketch.value(), 2.0)
+
+    def test_window_forgets_regime(self):
+        """Test that the windowed quantile follows a shift within one window."""
+        rng = random.Random(2)
+        quantile = WindowedQuantile(0.5, 200)
+        for _ in range(1000):
+            quantile.observe(rng.gauss(0.0, 1.0))
+        for _ in range(200):
+            quantile.observe(rng.gauss(5.0, 1.0))
+
+        self.assertAlmostEqual(quantile.value(), 5.0, delta=0.3)
+        self.assertLessEqual(quantile.samples(), 200)
+
+class TestSpreadStats(unittest.TestCase):
+    """Test cases for the SpreadStats class."""
+
+    def setUp(self):
+        """Set up statistics with one venue charging fees."""
+        self.stats = SpreadStats({'ex1': 0.1}, window=100, entry_quantile=0.9,
+            exit_quantile=0.5, min_samples=10)
+
+    def test_fee_adjusted_rate(self):
+        """Test that every ordered pair gets the fee-adjusted profit rate."""
+        self.assertEqual(self.stats.update(quotes(1000, 990, 1005, 1020), now=0.0), 2)
+
+        self.assertAlmostEqual(self.stats.pair('ex1', 'ex2').last, (1020 - 1000 * 1.001) / 1000 * 100)
+        self.assertAlmostEqual(self.stats.pair('ex2', 'ex1').last, (990 * 0.999 - 1005) / 1005 * 100)
+
+    def test_thresholds_after_warm_up(self):
+        """Test that thresholds are given only once a pair has enough samples."""
+        self.stats = SpreadStats(window=100, min_samples=10)
+        for i in range(9):
+            self.stats.update(quotes(1000, 990, 1000, 1005), now=float(i))
+        self.assertIsNone(self.stats.entry_rate('ex1', 'ex2'))
+
+        self.stats.update(quotes(1000, 990, 1000, 1005), now=9.0)
+        self.assertAlmostEqual(self.stats.entry_rate('ex1', 'ex2'), 0.5)
+        # 反対方向(ex2で買いex1で売る)は中央値で1%の損
+        self.assertAlmostEqual(self.stats.exitcost_ratio('ex1', 'ex2', 2.0), 50.0)
+        self.assertEqual(self.stats.exitcost_ratio('ex1', 'ex2', 0.5), 100.0)
+        self.assertIsNone(self.stats.exitcost_ratio('ex1', 'ex2', -0.1))
+
+    def test_persistence(self):
+        """Test that the duration of profitable runs is averaged."""
+        for now, bid in ((0.0, 1010), (5.0, 1010), (10.0, 990), (20.0, 1010), (30.0, 990)):
+            self.stats.update(quotes(1000, 990, 1000, bid), now=now)
+
+        pair = self.stats.pair('ex1', 'ex2')
+        self.assertEqual(pair.runs, 2)
+        self.assertAlmostEqual(pair.persistence.mean, 10.0)
+
+    def test_save_and_load(self):
+        """Test that saved statistics warm up a new instance."""
+        for i in range(20):
+            self.stats.update(quotes(1000, 990, 1000, 1000 + i), now=float(i))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'spreads.pcl')
+            self.stats.save_to(path)
+            loaded = SpreadStats({'ex1': 0.1}, window=100, min_samples=10).load_from(path)
+            other = SpreadStats(entry_quantile=0.95).load_from(path)
+
+        self.assertEqual(loaded.entry_rate('ex1', 'ex2'), self.stats.entry_rate('ex1', 'ex2'))
+        self.assertIsNone(loaded.pair('ex1', 'ex2').since)
+        self.assertEqual(other.stats(), {})
+        self.assertEqual(SpreadStats().load_from('/nonexistent/spreads.pcl').stats(), {})
+
+    def test_load_damaged(self):
+        """Test that a truncated or unreadable file starts cold."""
+        for i in range(20):
+            self.stats.update(quotes(1000, 990, 1000, 1000 + i), now=float(i))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'spreads.pcl')
+            self.stats.save_to(path)
+            self.assertEqual(os.listdir(tmp), ['spreads.pcl'])
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path, 'wb') as f:
+                f.write(data[:len(data) // 2])
+            truncated = SpreadStats().load_from(path)
+            with open(path, 'wb') as f:
+                f.write(b'cnowhere\nNothing\n.')
+            missing = SpreadStats().load_from(path)
+
+        self.assertEqual(truncated.stats(), {})
+        self.assertEqual(missing.stats(), {})
+
+class TestBrokerThresholds(unittest.TestCase):
+    """Test cases for the thresholds a Broker takes from SpreadStats."""
+
+    def setUp(self):
+        """Set up a broker with a static target of 0.1%."""
+        trade = SimpleNamespace(volume=0.01, target_profit_rate=0.1, allowed_exitcost_ratio=50, max_order=3)
+        self.broker = Broker(MagicMock(), trade)
+        self.deal = {'buy': {'exchange_name': 'ex1'}, 'sell': {'exchange_name': 'ex2'}}
+
+    def test_static_without_stats(self):
+        """Test that the configured rate applies without statistics."""
+        self.assertEqual(self.broker.target_profit_rate(self.deal), 0.1)
+
+    def test_entry_rate_above_floor(self):
+        """Test that the pair's entry rate applies when it is above the floor."""
+        spreads = MagicMock()
+        self.broker.set_spreads(spreads)
+
+        spreads.entry_rate.return_value = 0.4
+        self.assertEqual(self.broker.target_profit_rate(self.deal), 0.4)
+        spreads.entry_rate.return_value = -0.2
+        self.assertEqual(self.broker.target_profit_rate(self.deal), 0.1)
+        spreads.entry_rate.return_value = None
+        self.assertEqual(self.broker.target_profit_rate(self.deal), 0.1)
+        self.assertEqual(self.broker.target_profit_rate({'legs': []}), 0.1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools import clock
+from arbtools import simgw
+from arbtools.backtest import exchange_configs
+from arbtools.balances import Balances
+from arbtools.provider import Provider
+
+def trade(**options):
+    return SimpleNamespace(**{ 'volume': 0.01, 'target_profit_rate': 0.1,
+        'allowed_exitcost_ratio': 50, 'max_order': 3, **options })
+
+class TestStrategyRunner(unittest.TestCase):
+    """Test cases for the StrategyRunner class."""
+
+    def setUp(self):
+        """Set up a simulated market with a spread between two exchanges."""
+        names = ['exchange1', 'exchange2']
+        self.market = simgw.install(simgw.SimMarket(
+            { name: {'JPY': 1000000.0, 'BTC': 1.0} for name in names },
+            fees=dict.fromkeys(names, 0.0)))
+        self.market.update({
+            'exchange1': {'asks': [[1000000, 1.0]], 'bids': [[999000, 1.0]]},
+            'exchange2': {'asks': [[1011000, 1.0]], 'bids': [[1010000, 1.0]]},
+        })
+        self.provider = Provider(exchange_configs(dict.fromkeys(names, 0.0)), gw_name='arbtools.simgw')
+        self.runner = self.provider.strategies()
+
+    def test_one_fetch_per_cycle(self):
+        """Test that strategies share the books and balances of a cycle."""
+        for name in ('a', 'b', 'c'):
+            self.runner.add(name, trade(), shadow=True)
+        plans = self.runner.run_cycle()
+        self.assertEqual(set(plans), {'a', 'b', 'c'})
+        # 板2つと残高2つだけ
+        self.assertEqual(self.market.calls, 4)
+
+    def test_shadow_and_live(self):
+        """Test that shadow strategies report deals without ordering."""
+        shadow = self.runner.add('shadow', trade(), shadow=True)
+        live = self.runner.add('live', trade(), share=0.5)
+        deals = []
+        shadow.on('shadow_deal', lambda sender, deal: deals.append(deal))
+        self.runner.run_cycle()
+
+        self.assertEqual(len(deals), 1)
+        self.assertEqual(shadow.request_counts(), {})
+        self.assertEqual(sum(live.request_counts().values()), 1)
+        self.assertEqual(self.runner.request_counts(), {'live': 1})
+        self.assertEqual(self.runner.request_states(), {('live', 'confirm_open'): 1})
+        self.assertEqual(self.runner['live'], live)
+
+    def test_capital_share(self):
+        """Test that strategies plan with their share of the balances."""
+        broker = self.runner.add('small', trade(volume=0.5), share=0.25)
+        self.runner.run_cycle()
+        # 25万円では0.5BTCを買えない
+        self.assertEqual(broker.request_counts(), {})
+        self.assertEqual(broker.snapshot().balances['exchange1']['JPY']['free'], 250000.0)
+
+    def test_open_deal_keeps_other_share(self):
+        """Test that one strategy's open deal does not shrink another's funds."""
+        busy = self.runner.add('busy', trade(max_order=1), share=0.5)
+        idle = self.runner.add('idle', trade(target_profit_rate=100.0), share=0.5)
+        previous = clock.set_clock(clock.VirtualClock(1000.0))
+        try:
+            self.runner.run_cycle()
+            # 約定を確かめてから、次の回の残高で比べる
+            for _ in range(2):
+                clock.get_clock().advance(5.0)
+                self.runner.run_cycle()
+        finally:
+            clock.set_clock(previous)
+        self.assertEqual(busy.request_counts(), {'close_pair': 1})
+
+        idle_balances = idle.snapshot().balances
+        self.assertEqual(idle_balances['exchange1']['JPY']['free'], 500000.0)
+        self.assertEqual(idle_balances['exchange2']['BTC']['free'], 0.5)
+        busy_balances = busy.snapshot().balances
+        self.assertEqual(busy_balances['exchange1']['JPY']['free'], 490000.0)
+        self.assertEqual(busy_balances['exchange2']['BTC']['free'], 0.49)
+
+    def test_cycles_per_strategy(self):
+        """Test that each strategy asks its own CycleFinder for deals."""
+        finders = { name: MagicMock() for name in ('a', 'b') }
+        for name, finder in finders.items():
+            finder.symbols.return_value = ['BTC/JPY']
+            finder.deals.return_value = []
+            self.runner.add(name, trade(), share=0.5, cycles=finder)
+        self.runner.run_cycle()
+        for finder in finders.values():
+            finder.update.assert_called_once()
+            finder.deals.assert_called_once()
+
+    def test_one_symbol_fetch_for_cycles(self):
+        """Test that the cycle books are fetched once for all strategies."""
+        for name in ('a', 'b'):
+            self.runner.add(name, trade(), shadow=True,
+                cycles=self.provider.cycle_finder(['BTC/JPY', 'ETH/JPY']))
+        self.runner.run_cycle()
+        # 板2つと残高2つに、2銘柄の板を取引所ごとに1回ずつ
+        self.assertEqual(self.market.calls, 8)
+
+    def test_share_validation(self):
+        """Test that live strategies cannot share more than the capital."""
+        self.runner.add('a', trade(), share=0.6)
+        self.runner.add('shadow', trade(), share=1.0, shadow=True)
+        with self.assertRaises(ValueError):
+            self.runner.add('b', trade(), share=0.5)
+        with self.assertRaises(ValueError):
+            self.runner.add('a', trade(), share=0.1)
+        with self.assertRaises(ValueError):
+            self.runner.add('c', trade(), share=0.0)
+
+class TestBalances(unittest.TestCase):
+    """Test cases for Balances.partition."""
+
+    def test_partition(self):
+        """Test that a partition scales amounts and keeps errors."""
+        balances = Balances(None, {
+            'exchange1': {'JPY': {'free': 1000.0, 'used': 10.0, 'total': 1010.0}},
+            'exchange2': {'fetch_balances_error': 'timeout'},
+        })
+        part = balances.partition(0.5)
+        self.assertEqual(part['exchange1']['JPY'], {'free': 500.0, 'used': 5.0, 'total': 505.0})
+        self.assertEqual(balances['exchange1']['JPY']['free'], 1000.0)
+        self.assertEqual(part.errors(), balances.errors())
+
+    def test_partition_ledger(self):
+        """Test that open deals count toward the capital of every share."""
+        balances = Balances(None, {'exchange1': {'JPY': {'free': 800.0}}})
+        reserved = {('exchange1', 'JPY'): 200.0}
+        self.assertEqual(balances.partition(0.5, reserved, {})['exchange1']['JPY']['free'], 500.0)
+        self.assertEqual(balances.partition(0.5, reserved, reserved)['exchange1']['JPY']['free'], 300.0)
+        self.assertEqual(balances.partition(0.1, reserved, reserved)['exchange1']['JPY']['free'], 0.0)
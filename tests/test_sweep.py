@@ -0,0 +1,74 @@
+import unittest
+import tempfile
+from unittest import mock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools.recorder import Recorder, RecordReader
+from arbtools.synthetic import SyntheticBooks
+from arbtools import sweep as sweep_module
+from arbtools.sweep import Sweep, grid, table
+
+class TestSweep(unittest.TestCase):
+    """Test cases for the parameter sweep."""
+
+    def test_grid(self):
+        """Test grid expansion."""
+        points = grid({'volume': [0.01, 0.02], 'target_profit_rate': [0.1, 0.2, 0.3]})
+        self.assertEqual(len(points), 6)
+        self.assertIn({'volume': 0.02, 'target_profit_rate': 0.3}, points)
+
+    def test_table(self):
+        """Test table formatting."""
+        text = table([{'volume': 0.01, 'pnl': 12.5}, {'volume': 0.02, 'pnl': -1.0}])
+        lines = text.split('\n')
+        self.assertEqual(len(lines), 3)
+        self.assertIn('pnl', lines[0])
+
+    def test_run(self):
+        """Test a sweep over a recording."""
+        names = ['exchange1', 'exchange2', 'exchange3']
+        with tempfile.TemporaryDirectory() as root:
+            recorder = Recorder(root)
+            books = SyntheticBooks(names, premium=0.004, seed=1)
+            for timestamp, data in books.cycles(200, start=1000.0):
+                recorder.record(data, timestamp=timestamp)
+            recorder.close()
+
+            trade = {'volume': 0.01, 'allowed_exitcost_ratio': 50, 'max_order': 3}
+            balances = { name: {'JPY': 1000000.0, 'BTC': 1.0} for name in names }
+            params = {'target_profit_rate': [0.05, 0.1], 'volume': [0.01, 0.02]}
+            sweep = Sweep(root, dict.fromkeys(names, 0.0), balances, trade, params, processes=2)
+            rows = sweep.run()
+
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([row['cycles'] for row in rows], [200] * 4)
+        pnl = [row['pnl'] for row in rows]
+        self.assertEqual(pnl, sorted(pnl, reverse=True))
+
+    def test_decode_once_per_worker(self):
+        """Test that a worker decodes the recording once for all of its points."""
+        names = ['exchange1', 'exchange2']
+        with tempfile.TemporaryDirectory() as root:
+            recorder = Recorder(root)
+            books = SyntheticBooks(names, premium=0.004, seed=1)
+            for timestamp, data in books.cycles(50, start=1000.0):
+                recorder.record(data, timestamp=timestamp)
+            recorder.close()
+
+            balances = { name: {'JPY': 1000000.0, 'BTC': 1.0} for name in names }
+            sweep = Sweep(root, dict.fromkeys(names, 0.0), balances,
+                          {'volume': 0.01, 'allowed_exitcost_ratio': 50, 'max_order': 3},
+                          {'target_profit_rate': [0.05, 0.1, 0.2]})
+            with mock.patch.object(RecordReader, 'cycles', autospec=True,
+                                   side_effect=RecordReader.cycles) as cycles:
+                sweep_module._init_worker(root, sweep._options)
+                rows = [ sweep_module._run_point(point) for point in sweep.points() ]
+
+        self.assertEqual(cycles.call_count, 1)
+        self.assertEqual([row['cycles'] for row in rows], [50] * 3)
+
+if __name__ == '__main__':
+    unittest.main()
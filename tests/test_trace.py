@@ -0,0 +1,99 @@
+import unittest
+import tempfile
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arbtools import trace
+
+class TestTrace(unittest.TestCase):
+    """Test cases for deal tracing."""
+
+    def test_mark(self):
+        """Test that marks keep the first time unless overwritten."""
+        data = {}
+        trace.mark(data, 'requested', timestamp=1.0)
+        trace.mark(data, 'requested', timestamp=2.0)
+        trace.mark(data, 'sent', 'exchange1', timestamp=3.0)
+        trace.mark(data, 'sent', 'exchange1', timestamp=4.0, overwrite=True)
+
+        self.assertEqual(data['trace']['requested'], 1.0)
+        self.assertEqual(data['trace']['sent'], {'exchange1': 4.0})
+
+    def test_summarize(self):
+        """Test durations between the stages of a deal."""
+        data = {
+            'buy': {'exchange_name': 'exchange1'},
+            'sell': {'exchange_name': 'exchange2'},
+            'orders': {'exchange1': {}, 'exchange2': {}},
+            'trace': {
+                'received': {'exchange1': 10.0, 'exchange2': 10.2, 'exchange3': 5.0},
+                'rounded': 10.3,
+                'planned': 10.5,
+                'requested': 10.6,
+                'sent': {'exchange1': 11.0, 'exchange2': 11.1},
+                'acked': {'exchange1': 11.3, 'exchange2': 11.5},
+                'filled': {'exchange1': 12.0, 'exchange2': 13.0},
+            },
+        }
+        durations = trace.summarize(data)
+
+        self.assertAlmostEqual(durations['book_age'], 0.5)
+        self.assertAlmostEqual(durations['skew'], 0.2)
+        self.assertAlmostEqual(durations['plan'], 0.2)
+        self.assertAlmostEqual(durations['queue'], 0.4)
+        self.assertAlmostEqual(durations['ack'], 0.5)
+        self.assertAlmostEqual(durations['fill'], 1.7)
+        self.assertAlmostEqual(durations['tick_to_trade'], 1.0)
+        self.assertAlmostEqual(durations['fill_skew'], 1.0)
+
+    def test_fill_skew(self):
+        """Test that fill times reported by the exchanges come first."""
+        data = {
+            'orders': {'exchange1': {}, 'exchange2': {}},
+            'trace': {
+                'filled': {'exchange1': 12.0, 'exchange2': 13.0},
+                'traded': {'exchange1': 11.8},
+            },
+        }
+        self.assertAlmostEqual(trace.fill_skew(data), 1.0)
+        data['trace']['traded']['exchange2'] = 11.9
+        self.assertAlmostEqual(trace.fill_skew(data), 0.1)
+
+    def test_summarize_unfilled(self):
+        """Test that missing stages are None."""
+        data = {
+            'buy': {'exchange_name': 'exchange1'},
+            'sell': {'exchange_name': 'exchange2'},
+            'orders': {'exchange1': {}, 'exchange2': {}},
+            'trace': {'filled': {'exchange1': 12.0}},
+        }
+        durations = trace.summarize(data)
+        self.assertIsNone(durations['fill'])
+        self.assertIsNone(durations['tick_to_trade'])
+        self.assertIsNone(durations['fill_skew'])
+
+    def test_log_finished(self):
+        """Test that a finished reverse deal logs its own and its open deal's trace."""
+        open_deal = {
+            'deal_id': 'open', 'expected_profit': 10.0,
+            'buy': {'exchange_name': 'exchange1'},
+            'sell': {'exchange_name': 'exchange2'},
+            'orders': {'exchange1': {}, 'exchange2': {}},
+            'trace': {'received': {'exchange1': 1.0, 'exchange2': 1.5}, 'sent': {'exchange1': 2.0}},
+        }
+        data = {**open_deal, 'deal_id': 'close', 'open_deal': open_deal, 'trace': {}}
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'traces.pcl')
+            trace.append_log(path, data)
+            trace.append_log(path, open_deal)
+            rows = list(trace.read_log(path))
+
+        self.assertEqual([ (r['deal_id'], r['kind']) for r in rows ],
+            [('open', 'open'), ('close', 'close'), ('open', 'pair')])
+        self.assertEqual(rows[0]['tick_to_trade'], 1.0)
+        self.assertIsNone(rows[1]['tick_to_trade'])
+
+if __name__ == '__main__':
+    unittest.main()
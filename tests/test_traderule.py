@@ -6,7 +6,10 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from types import SimpleNamespace
+from arbtools import clock
 from arbtools.traderule import TradeRule, nop, execute_order, confirm_order, close_pair, finish_trade
+from arbtools.traderule import recover, confirm_recovery
 
 class TestTradeRuleFunctions(unittest.TestCase):
     """Test cases for the TradeRule helper functions."""
@@ -99,6 +102,24 @@ class TestTradeRuleFunctions(unittest.TestCase):
             self.assertEqual(result[0], next_state)
             self.assertIn('close', result[1])
 
+    def test_execute_order_legs(self):
+        """Test execute_order waits for every leg of a multi-leg deal."""
+        api = MagicMock()
+        data = {'volume': 0.01, 'legs': [{}, {}, {}]}
+        api.create_orders.return_value = {
+            '0:exchange1': {'id': 'order1'},
+            '1:exchange1': {'id': 'order2'},
+            '2:exchange2': {'create_orders_error': 'Test error'},
+        }
+        
+        result = execute_order(api, ('open_legs', data), 'confirm_legs')
+        self.assertEqual(result[0], 'open_legs')
+        
+        api.create_orders.return_value['2:exchange2'] = {'id': 'order3'}
+        result = execute_order(api, ('open_legs', data), 'confirm_legs')
+        self.assertEqual(result[0], 'confirm_legs')
+        self.assertEqual(result[1]['orders']['2:exchange2'], {'id': 'order3'})
+
     def test_finish_trade(self):
         """Test finish_trade function returns None."""
         api = MagicMock()
@@ -108,6 +129,130 @@ class TestTradeRuleFunctions(unittest.TestCase):
         result = finish_trade(api, status, next_state)
         self.assertIsNone(result)
 
+        broker = MagicMock()
+        self.assertIsNone(finish_trade(api, status, next_state, broker=broker))
+        broker.emit.assert_called_once_with('finished', {'data': 'test'})
+
+class TestRecovery(unittest.TestCase):
+    """Test cases for single-leg recovery."""
+
+    def setUp(self):
+        """Set up a deal whose buy leg filled and sell leg rests."""
+        self.clock = clock.VirtualClock(1000.0)
+        self.previous = clock.set_clock(self.clock)
+        self.api = MagicMock()
+        self.broker = MagicMock()
+        self.broker._trade = SimpleNamespace(hedge_timeout=5.0, confirm_timeout=60.0)
+        self.quotes = {
+            'exchange2': {'ask': [102, 1.0], 'bid': [100, 1.0]},
+            'exchange3': {'ask': [103, 1.0], 'bid': [101, 1.0]},
+        }
+        self.data = {
+            'deal_id': 'deal',
+            'buy': {'exchange_name': 'exchange1', 'quote': [99, 1.0]},
+            'sell': {'exchange_name': 'exchange2', 'quote': [102, 1.0]},
+            'volume': 0.01,
+            'orders': {
+                'exchange1': {'id': 'order1', 'side': 'buy', 'status': 'closed', 'filled': 0.01},
+                'exchange2': {'id': 'order2', 'side': 'sell', 'status': 'open', 'filled': 0.0},
+            },
+            'trace': {'acked': {'exchange1': 1000.0, 'exchange2': 1000.0},
+                      'filled': {'exchange1': 1000.0}},
+        }
+
+    def tearDown(self):
+        """Restore the clock."""
+        clock.set_clock(self.previous)
+
+    def _kwargs(self):
+        return {'broker': self.broker, 'quotes': self.quotes, 'balances': None}
+
+    def test_confirm_order_hedge_timeout(self):
+        """Test that a lone filled leg goes to recovery after the hedge timeout."""
+        self.api.fetch_orders.return_value = self.data['orders']
+        status = ('confirm_open', self.data)
+
+        self.clock.advance(4.0)
+        self.assertEqual(confirm_order(self.api, status, 'close_pair', **self._kwargs())[0], 'confirm_open')
+        self.clock.advance(2.0)
+        self.assertEqual(confirm_order(self.api, status, 'close_pair', **self._kwargs())[0], 'recover')
+
+    def test_hedge_timeout_follows_round_trip(self):
+        """Test that the hedge timeout is not shorter than the order round trip."""
+        self.api.fetch_orders.return_value = self.data['orders']
+        self.broker.order_timeout.return_value = 8.0
+        status = ('confirm_open', self.data)
+
+        self.clock.advance(6.0)
+        self.assertEqual(confirm_order(self.api, status, 'close_pair', **self._kwargs())[0], 'confirm_open')
+        self.clock.advance(3.0)
+        self.assertEqual(confirm_order(self.api, status, 'close_pair', **self._kwargs())[0], 'recover')
+
+    def test_recover_hedges_at_best_venue(self):
+        """Test that the stale leg is canceled and the fill hedged."""
+        self.api.cancel_orders.return_value = {
+            'exchange2': {'id': 'order2', 'side': 'sell', 'status': 'canceled', 'filled': 0.0}}
+        self.api.create_orders.side_effect = lambda data, ordered: {
+            data['legs'][0]['leg_id']: {'id': 'hedge', 'sent_at': 1000.0, 'acked_at': 1000.1}}
+
+        result = recover(self.api, ('recover', self.data), 'confirm_recover', **self._kwargs())
+
+        self.assertEqual(result[0], 'confirm_recover')
+        leg = result[1]['hedges'][0]
+        self.assertEqual((leg['exchange_name'], leg['side'], leg['amount']), ('exchange3', 'sell', 0.01))
+        self.assertEqual(result[1]['orders']['exchange2']['status'], 'canceled')
+        self.assertIn(leg['leg_id'], result[1]['orders'])
+        self.broker.emit.assert_called_with('recover', result[1])
+
+        self.api.fetch_orders.return_value = {**result[1]['orders'],
+            leg['leg_id']: {'id': 'hedge', 'side': 'sell', 'status': 'closed', 'filled': 0.01}}
+        result = confirm_recovery(self.api, result, 'finish_trade', **self._kwargs())
+        self.assertEqual(result[0], 'finish_trade')
+        self.broker.emit.assert_called_with('recovered', result[1])
+
+    def test_recover_hedges_routed_legs(self):
+        """Test that only legs of one symbol are hedged after their cancel."""
+        orders = {
+            '0:exchange1': {'id': 'order1', 'side': 'buy', 'status': 'closed', 'filled': 0.02},
+            '1:exchange2': {'id': 'order2', 'side': 'sell', 'status': 'canceled', 'filled': 0.0},
+            '2:exchange3': {'id': 'order3', 'side': 'sell', 'status': 'closed', 'filled': 0.01},
+        }
+        legs = [ {'leg_id': key, 'symbol': 'BTC/JPY'} for key in orders ]
+        data = {'deal_id': 'routed', 'legs': legs, 'volume': 0.02, 'orders': orders}
+        self.api.create_orders.side_effect = lambda data, ordered: {
+            data['legs'][0]['leg_id']: {'id': 'hedge', 'sent_at': 1000.0, 'acked_at': 1000.1}}
+
+        result = recover(self.api, ('recover', data), 'confirm_recover', **self._kwargs())
+        self.assertEqual(result[0], 'confirm_recover')
+        self.assertEqual(result[1]['hedges'][0]['amount'], 0.01)
+
+        legs[2]['symbol'] = 'ETH/BTC'
+        data = {'deal_id': 'cycle', 'legs': legs, 'volume': 0.02, 'orders': orders}
+        result = recover(self.api, ('recover', data), 'confirm_recover', **self._kwargs())
+        self.assertEqual(result[0], 'finish_trade')
+
+    def test_recover_waits_for_cancel(self):
+        """Test that recovery stays put until the cancel is confirmed."""
+        self.api.cancel_orders.return_value = {
+            'exchange2': {'id': 'order2', 'cancel_orders_error': 'Test error'}}
+
+        result = recover(self.api, ('recover', self.data), 'confirm_recover', **self._kwargs())
+
+        self.assertEqual(result[0], 'recover')
+        self.api.create_orders.assert_not_called()
+
+    def test_recover_unfilled_close_replans(self):
+        """Test that a reverse deal without fills goes back to close_pair."""
+        open_deal = {'deal_id': 'open'}
+        self.data['open_deal'] = open_deal
+        self.data['orders']['exchange1'] = {'id': 'order1', 'side': 'buy', 'status': 'open', 'filled': 0.0}
+        self.api.cancel_orders.return_value = {
+            key: {**order, 'status': 'canceled'} for key, order in self.data['orders'].items()}
+
+        result = recover(self.api, ('recover', self.data), 'confirm_recover', **self._kwargs())
+
+        self.assertEqual(result, ('close_pair', open_deal))
+
 class TestTradeRule(unittest.TestCase):
     """Test cases for the TradeRule class."""
 
@@ -170,6 +315,15 @@ class TestTradeRule(unittest.TestCase):
         self.assertEqual(result[0], 'open_pair')
         self.assertEqual(result[1], data)
 
+    def test_new_status_legs(self):
+        """Test new_status method with a multi-leg deal."""
+        data = {'volume': 0.01, 'legs': [{'leg_id': '0:exchange1'}]}
+        
+        result = self.trade_rule.new_status(data)
+        
+        self.broker.emit.assert_called_once_with('found_legs', data)
+        self.assertEqual(result, ('open_legs', data))
+
     def test_execute(self):
         """Test execute method."""
         api = MagicMock()